@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+from functions.lazy_import import lazy_import
+
+types = lazy_import("google.genai.types")
+
+DEFAULT_TOKEN_BUDGET = 32000
+DEFAULT_KEEP_RECENT_TURNS = 2
+MIN_COMPACT_LENGTH = 200
+SUMMARY_LENGTH = 120
+
+
+@dataclass
+class CompactionStats:
+    bytes_before: int
+    bytes_after: int
+    compacted_results: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+
+@dataclass
+class _ToolResult:
+    index: int
+    turn: int
+    name: str
+    path: str | None
+    result: str
+
+
+def content_size(content: types.Content) -> int:
+    return len(content.model_dump_json(exclude_none=True).encode())
+
+
+def estimate_tokens(size: int) -> int:
+    """Rough token estimate for a serialized request of `size` bytes."""
+    return size // 4
+
+
+def _normalize(path: str | None) -> str | None:
+    if path is None:
+        return None
+    return os.path.normpath(path.strip("/") or ".")
+
+
+def _tool_results(messages: list[types.Content]) -> tuple[list[_ToolResult], dict]:
+    """Pair every tool result with the call that produced it.
+
+    The agent loop appends one tool message per function call, in the order the
+    calls appear in the preceding model message, so the pairing is positional.
+    """
+    results: list[_ToolResult] = []
+    writes: dict[str, int] = {}
+    pending: list[types.FunctionCall] = []
+    turn = 0
+    for index, content in enumerate(messages):
+        parts = content.parts or []
+        if content.role == "model":
+            turn += 1
+            pending = [part.function_call for part in parts if part.function_call]
+            continue
+
+        response = parts[0].function_response if parts else None
+        if response is None or not pending:
+            continue
+        call = pending.pop(0)
+        args = call.args or {}
+        path = _normalize(args.get("file_path", args.get("directory")))
+        if call.name in ("write_file", "edit_file") and path is not None:
+            writes[path] = index
+        result = (response.response or {}).get("result")
+        if isinstance(result, str):
+            results.append(_ToolResult(index, turn, response.name, path, result))
+
+    return results, writes
+
+
+def _stub(tool_result: _ToolResult, reason: str) -> types.Content:
+    target = f'("{tool_result.path}")' if tool_result.path else "()"
+    summary = tool_result.result[:SUMMARY_LENGTH].rstrip()
+    stub = (
+        f"[Compacted {tool_result.name}{target} result: {reason}. "
+        f"{len(tool_result.result)} characters omitted. Call the function again "
+        f"if you need the full result.]\n{summary}..."
+    )
+    return types.Content(
+        role="tool",
+        parts=[
+            types.Part.from_function_response(
+                name=tool_result.name, response={"result": stub}
+            )
+        ],
+    )
+
+
+def compact_messages(
+    messages: list[types.Content],
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    keep_recent_turns: int = DEFAULT_KEEP_RECENT_TURNS,
+) -> tuple[list[types.Content], CompactionStats]:
+    """Return a copy of `messages` that is cheaper to send to the model.
+
+    File reads that were made obsolete by a later write or edit of the same path are
+    always replaced by a short stub. If the estimated size is still over
+    `token_budget`, tool results are then stubbed oldest first, starting with those
+    older than the last `keep_recent_turns` model turns. The results of the latest
+    turn are never touched. `messages` itself is left unchanged.
+
+    Parameters
+    ----------
+    messages: list[types.Content]
+        The full conversation
+    token_budget: int
+        Target size of the conversation in tokens. Default: 32000
+    keep_recent_turns: int
+        Number of recent model turns whose results are only compacted as a last
+        resort. Default: 2
+
+    Returns
+    -------
+    tuple[list[types.Content], CompactionStats]
+        The compacted conversation and the number of bytes that were saved
+    """
+    sizes = [content_size(content) for content in messages]
+    bytes_before = sum(sizes)
+    results, writes = _tool_results(messages)
+    compacted = list(messages)
+    total = bytes_before
+    count = 0
+
+    def replace(tool_result: _ToolResult, reason: str):
+        nonlocal total, count
+        stub = _stub(tool_result, reason)
+        new_size = content_size(stub)
+        if new_size >= sizes[tool_result.index]:
+            return
+        compacted[tool_result.index] = stub
+        total -= sizes[tool_result.index] - new_size
+        sizes[tool_result.index] = new_size
+        count += 1
+
+    candidates = []
+    for tool_result in results:
+        if len(tool_result.result) < MIN_COMPACT_LENGTH:
+            continue
+        if (
+            tool_result.name == "get_file_content"
+            and writes.get(tool_result.path, -1) > tool_result.index
+        ):
+            replace(tool_result, "the file was overwritten later on")
+        else:
+            candidates.append(tool_result)
+
+    last_turn = results[-1].turn if results else 0
+    stale = [r for r in candidates if r.turn <= last_turn - keep_recent_turns]
+    recent = [
+        r for r in candidates if last_turn - keep_recent_turns < r.turn < last_turn
+    ]
+    for tool_result in stale + recent:
+        if estimate_tokens(total) <= token_budget:
+            break
+        replace(tool_result, "older results were dropped to save space")
+
+    return compacted, CompactionStats(bytes_before, total, count)
@@ -0,0 +1,116 @@
+"""Wire protocol shared by the agent server and its thin client.
+
+The client connects to the server's Unix socket and sends one JSON line holding its
+command line arguments, working directory and the environment variables a session
+uses (`SESSION_ENV_VARS`), together with its stdin,
+stdout and stderr file descriptors. The server runs the session in a forked child
+that writes straight to those descriptors, so output streams to the client's
+terminal as it is produced. The child replies with a JSON line carrying its pid, so
+the client can forward Ctrl-C, and another one with the session's exit code.
+
+As the server gets the client's API key and terminal, the socket lives in a directory
+that only its user may use, and both ends check that the other one runs as the same
+user.
+
+This module is imported by the thin client and must only depend on the standard
+library.
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import tempfile
+
+MAX_MESSAGE = 1024 * 1024
+SERVER_FDS = 3
+# Environment variables a session may depend on: the API client's settings, proxies,
+# locale and terminal. Nothing else from the client's environment is sent.
+SESSION_ENV_VARS = frozenset(
+    {
+        "COLUMNS",
+        "HOME",
+        "HTTPS_PROXY",
+        "HTTP_PROXY",
+        "LANG",
+        "LINES",
+        "NO_COLOR",
+        "NO_PROXY",
+        "PATH",
+        "SSL_CERT_DIR",
+        "SSL_CERT_FILE",
+        "TERM",
+        "TZ",
+        "https_proxy",
+        "http_proxy",
+        "no_proxy",
+    }
+)
+SESSION_ENV_PREFIXES = ("AGENT_", "GEMINI_", "GOOGLE_", "LC_")
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"example-ai-agent-{os.getuid()}", "agent.sock")
+
+
+def check_private_dir(path: str):
+    """Raise PermissionError unless `path` is a directory of the current user that no
+    one else may use."""
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} is not a private directory of the current user")
+
+
+def peer_uid(sock: socket.socket) -> int | None:
+    """Return the uid of the process on the other end of a Unix socket, or None if
+    the platform cannot tell."""
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    ucred = struct.Struct("3i")
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, ucred.size)
+    _, uid, _ = ucred.unpack(creds)
+    return uid
+
+
+def is_session_env_var(name: str) -> bool:
+    return name in SESSION_ENV_VARS or name.startswith(SESSION_ENV_PREFIXES)
+
+
+def send_request(sock: socket.socket, argv: list[str]):
+    env = {
+        name: value for name, value in os.environ.items() if is_session_env_var(name)
+    }
+    request = {"argv": argv, "cwd": os.getcwd(), "env": env}
+    data = json.dumps(request).encode() + b"\n"
+    socket.send_fds(sock, [data], [0, 1, 2])
+
+
+def recv_request(sock: socket.socket) -> tuple[dict, list[int]]:
+    data = b""
+    fds: list[int] = []
+    while not data.endswith(b"\n"):
+        chunk, chunk_fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE, SERVER_FDS)
+        fds += chunk_fds
+        if not chunk:
+            raise ConnectionError("Client disconnected before sending its request")
+        data += chunk
+    return json.loads(data), fds
+
+
+def send_message(sock: socket.socket, message: dict):
+    sock.sendall(json.dumps(message).encode() + b"\n")
+
+
+def read_messages(sock: socket.socket):
+    """Yield the JSON lines sent by the server until it closes the connection."""
+    buffer = b""
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            yield json.loads(line)
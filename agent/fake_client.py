@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from functions.lazy_import import lazy_import
+
+types = lazy_import("google.genai.types")
+
+
+class ScriptedModels:
+    """Stand-in for `client.models` that answers from a fixed script.
+
+    The response to a request is picked by the number of model turns already in its
+    contents, so the same script drives any number of sessions, concurrent ones
+    included, and a session that runs out of script gets the last turn again.
+    """
+
+    def __init__(self, turns: list[list[types.Part]], latency: float = 0.0):
+        self.turns = turns
+        self.latency = latency
+        self.calls = 0
+
+    def _turn(self, contents: list[types.Content]) -> list[types.Part]:
+        self.calls += 1
+        done = sum(content.role == "model" for content in contents)
+        return self.turns[min(done, len(self.turns) - 1)]
+
+    @staticmethod
+    def _response(
+        parts: list[types.Part], prompt_tokens: int
+    ) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(content=types.Content(role="model", parts=parts))
+            ],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens, candidates_token_count=len(parts)
+            ),
+        )
+
+    def generate_content(self, *, model, contents, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(self._turn(contents), self.count(contents))
+
+    def count_tokens(self, *, model, contents, config=None):
+        return SimpleNamespace(total_tokens=self.count(contents))
+
+    @staticmethod
+    def count(contents: list[types.Content]) -> int:
+        # The usual rough estimate of four bytes per token
+        size = sum(len(c.model_dump_json(exclude_none=True)) for c in contents)
+        return size // 4
+
+
+class AsyncScriptedModels:
+    def __init__(self, models: ScriptedModels):
+        self.models = models
+
+    async def generate_content_stream(self, *, model, contents, config=None):
+        if self.models.latency:
+            await asyncio.sleep(self.models.latency)
+        parts = self.models._turn(contents)
+        prompt_tokens = self.models.count(contents)
+
+        async def stream():
+            # One chunk per part, as the API streams text and function calls
+            for part in parts:
+                yield self.models._response([part], prompt_tokens)
+
+        return stream()
+
+
+class ScriptedClient:
+    """A local fake of `genai.Client` for benchmarks and tests.
+
+    Parameters
+    ----------
+    turns : list[list[types.Part]]
+        The parts of each model turn in a session, in order
+    latency : float
+        Seconds each model call takes
+    """
+
+    def __init__(self, turns: list[list[types.Part]], latency: float = 0.0):
+        self.models = ScriptedModels(turns, latency)
+        self.aio = SimpleNamespace(models=AsyncScriptedModels(self.models))
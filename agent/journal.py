@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+
+from functions.lazy_import import lazy_import
+
+types = lazy_import("google.genai.types")
+
+
+class JournalError(Exception):
+    pass
+
+
+@dataclass
+class ResumedSession:
+    """The state of a session rebuilt from its journal.
+
+    Attributes
+    ----------
+    prompt: str
+        The user prompt the session was started with
+    messages: list[types.Content]
+        The conversation up to the last journaled record
+    iterations: int
+        Number of model calls already made, i.e. the iteration to continue from
+    pending_calls: list[types.FunctionCall]
+        Function calls from the last model turn whose results were never journaled
+    """
+
+    prompt: str
+    messages: list[types.Content] = field(default_factory=list)
+    iterations: int = 0
+    pending_calls: list[types.FunctionCall] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        """Whether the last model turn was a final answer."""
+        return (
+            bool(self.messages)
+            and self.messages[-1].role == "model"
+            and not self.pending_calls
+        )
+
+
+class SessionJournal:
+    """Append-only JSON Lines journal of an agent session.
+
+    The first record holds the prompt. Every model turn then adds one "model" record
+    with the content it returned, and once its function calls have run, one "tools"
+    record with their results. Records are flushed and fsynced as they are written,
+    so a crashed session can be resumed from its last complete record without
+    repeating the model calls it already paid for.
+
+    Parameters
+    ----------
+    path: str
+        The journal file
+    append: bool
+        Whether to continue an existing journal rather than start a new one.
+        Default: False
+    fsync: bool
+        Whether to fsync after every record. Default: True
+    """
+
+    def __init__(self, path: str, append: bool = False, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        # Closed by close() or at the end of the `with` block
+        self._fp = open(path, "a" if append else "w", encoding="utf-8")  # noqa: SIM115
+
+    def _write(self, record: dict):
+        self._fp.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._fp.flush()
+        if self.fsync:
+            os.fsync(self._fp.fileno())
+
+    def record_prompt(self, prompt: str, model: str):
+        self._write({"type": "prompt", "prompt": prompt, "model": model})
+
+    def _record_contents(self, kind: str, iteration: int, contents: list):
+        self._write(
+            {
+                "type": kind,
+                "iteration": iteration,
+                "contents": [
+                    c.model_dump(mode="json", exclude_none=True) for c in contents
+                ],
+            }
+        )
+
+    def record_model(self, iteration: int, contents: list[types.Content]):
+        """Record the contents returned by the model call of `iteration`."""
+        self._record_contents("model", iteration, contents)
+
+    def record_tools(self, iteration: int, contents: list[types.Content]):
+        """Record the function results of `iteration`, once all of them are in."""
+        self._record_contents("tools", iteration, contents)
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def load(cls, path: str) -> ResumedSession:
+        """Rebuild a session from the journal at `path`.
+
+        A last line that was only partly written when the session crashed is
+        discarded, and cut off the file so that new records start on a clean line.
+
+        Raises
+        ------
+        JournalError
+            If the file does not start with a prompt record or a complete record
+            is corrupt
+        """
+        with open(path, "rb") as fp:
+            data = fp.read()
+
+        records: list[dict] = []
+        offset = 0
+        while offset < len(data):
+            end = data.find(b"\n", offset)
+            if end == -1:
+                # Every record is written with its newline, so this one is incomplete
+                os.truncate(path, offset)
+                break
+            try:
+                records.append(json.loads(data[offset:end]))
+            except ValueError:
+                raise JournalError(f"{path}: corrupt record at byte {offset}") from None
+            offset = end + 1
+
+        if not records or records[0].get("type") != "prompt":
+            raise JournalError(f"{path} does not start with a prompt record")
+        session = ResumedSession(records[0]["prompt"])
+        session.messages.append(
+            types.Content(role="user", parts=[types.Part(text=session.prompt)])
+        )
+        for record in records[1:]:
+            contents = [types.Content.model_validate(c) for c in record["contents"]]
+            session.messages.extend(contents)
+            if record["type"] == "model":
+                session.iterations = record["iteration"] + 1
+                session.pending_calls = [
+                    part.function_call
+                    for content in contents
+                    for part in content.parts or []
+                    if part.function_call
+                ]
+            else:
+                session.pending_calls = []
+        return session
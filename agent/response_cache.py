@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from functions.lazy_import import lazy_import
+
+types = lazy_import("google.genai.types")
+
+DEFAULT_CACHE_DIR = ".agent_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def cache_key(
+    model: str,
+    contents: list[types.Content],
+    config: types.GenerateContentConfig | None,
+) -> str:
+    """Return a key identifying a `generate_content` request.
+
+    The key is a SHA-256 hash over the model name, the serialized config (which holds
+    the system instruction and the tool declarations) and the serialized messages.
+
+    Parameters
+    ----------
+    model: str
+        Name of the model the request is sent to
+    contents: list[types.Content]
+        The conversation so far
+    config: types.GenerateContentConfig | None
+        The request config
+
+    Returns
+    -------
+    str
+        A hex digest that is stable across processes
+    """
+    request = {
+        "model": model,
+        "config": config.model_dump(mode="json", exclude_none=True) if config else None,
+        "contents": [c.model_dump(mode="json", exclude_none=True) for c in contents],
+    }
+    data = json.dumps(request, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache of model responses with size-bounded LRU eviction.
+
+    Each response is stored as JSON in its own file named after its key. The file's
+    modification time is bumped on every hit, so the least recently used entries are
+    the first to go once the directory grows past `max_bytes`.
+    """
+
+    def __init__(
+        self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.json")
+
+    def get(self, key: str) -> types.GenerateContentResponse | None:
+        path = self._path(key)
+        try:
+            with open(path) as fp:
+                response = types.GenerateContentResponse.model_validate(json.load(fp))
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    def put(self, key: str, response: types.GenerateContentResponse):
+        data = json.dumps(response.model_dump(mode="json", exclude_none=True))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(data)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".json"):
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            Path(path).unlink(missing_ok=True)
+            total -= size
+
+
+class CachedModels:
+    """Drop-in replacement for `client.models` that serves `generate_content` from a
+    `ResponseCache`.
+
+    With `offline=True` no requests are forwarded and a miss raises `CacheMiss`, which
+    lets a recorded session stand in for the model, e.g. in tests.
+    """
+
+    def __init__(self, models, cache: ResponseCache, offline: bool = False):
+        self.models = models
+        self.cache = cache
+        self.offline = offline
+
+    def generate_content(
+        self,
+        *,
+        model: str,
+        contents: list[types.Content],
+        config: types.GenerateContentConfig | None = None,
+    ) -> types.GenerateContentResponse:
+        key = cache_key(model, contents, config)
+        response = self.cache.get(key)
+        if response is not None:
+            return response
+        if self.offline or self.models is None:
+            raise CacheMiss(f"No cached response for request {key}")
+
+        response = self.models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        self.cache.put(key, response)
+        return response
@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+
+from functions.lazy_import import lazy_import
+
+from .compaction import content_size, estimate_tokens
+
+httpx = lazy_import("httpx")
+errors = lazy_import("google.genai.errors")
+types = lazy_import("google.genai.types")
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_CALL_DEADLINE = 300.0
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How failed model calls are retried.
+
+    Attributes
+    ----------
+    max_retries: int
+        Retries after the first attempt before giving up
+    base_delay: float
+        Upper bound in seconds of the first backoff, doubled on every retry
+    max_delay: float
+        Cap in seconds on a single backoff
+    deadline: float | None
+        Seconds a call may take over all of its attempts and backoffs. Each attempt
+        is sent with the time that remains as its HTTP timeout.
+    """
+
+    max_retries: int = DEFAULT_MAX_RETRIES
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+    deadline: float | None = DEFAULT_CALL_DEADLINE
+
+    def backoff(self, retry: int, rng: random.Random) -> float:
+        """Return the delay before retry number `retry` (0-based), with full jitter."""
+        return rng.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _parse_duration(value: str) -> float | None:
+    # google.rpc.RetryInfo durations look like "17s" or "0.5s"
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)s?\s*", value)
+    return float(match.group(1)) if match else None
+
+
+def retry_after(error: Exception) -> float | None:
+    """Return how long the server asked us to wait before retrying, if it did.
+
+    Both the HTTP `Retry-After` header (in seconds or as a date) and the
+    `google.rpc.RetryInfo` detail of Gemini API errors are understood.
+    """
+    if not isinstance(error, errors.APIError):
+        return None
+    headers = getattr(error.response, "headers", None) or {}
+    value = headers.get("retry-after")
+    if value is not None:
+        delay = _parse_duration(value)
+        if delay is not None:
+            return delay
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    details = error.details if isinstance(error.details, dict) else {}
+    for detail in details.get("error", details).get("details", None) or []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            return _parse_duration(str(detail["retryDelay"]))
+    return None
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute.
+
+    `reserve` takes capacity from both buckets right away and returns how long the
+    caller has to wait for the buckets to cover it, so callers that share a limiter
+    queue up behind each other instead of all firing once capacity returns. Token
+    counts are estimated before a call and corrected with the real usage afterwards.
+    A 429 from the server holds back every caller via `pause`.
+
+    Parameters
+    ----------
+    requests_per_minute: int | None
+        Request limit, or None for no limit
+    tokens_per_minute: int | None
+        Token limit, or None for no limit
+    clock: Callable[[], float]
+        Monotonic clock, replaceable in tests
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int | None = None,
+        tokens_per_minute: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        # Each bucket is [capacity, level, updated_at]
+        self._buckets = {
+            name: [float(limit), float(limit), now]
+            for name, limit in (
+                ("requests", requests_per_minute),
+                ("tokens", tokens_per_minute),
+            )
+            if limit
+        }
+        self._paused_until = now
+
+    def _take(self, name: str, amount: float, now: float) -> float:
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            return 0.0
+        capacity, level, updated_at = bucket
+        rate = capacity / 60
+        # Refill before charging, so an idle bucket never absorbs part of a request
+        level = min(capacity, level + (now - updated_at) * rate)
+        level = min(capacity, level - min(amount, capacity))
+        bucket[1:] = [level, now]
+        return max(-level / rate, 0.0)
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request using `tokens` tokens.
+
+        Returns
+        -------
+        float
+            Seconds to wait before sending the request
+        """
+        with self._lock:
+            now = self._clock()
+            wait = max(
+                self._take("requests", 1, now), self._take("tokens", tokens, now)
+            )
+            return max(wait, self._paused_until - now)
+
+    def adjust(self, tokens: int):
+        """Correct the token bucket by the difference between used and reserved."""
+        with self._lock:
+            self._take("tokens", tokens, self._clock())
+
+    def pause(self, seconds: float):
+        """Hold back all callers for `seconds`, e.g. after the server said to."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class _Retrier:
+    def __init__(
+        self,
+        policy: RetryPolicy,
+        limiter: RateLimiter | None,
+        clock: Callable[[], float],
+        rng: random.Random,
+        verbose: bool,
+    ):
+        self.policy = policy
+        self.limiter = limiter
+        self.clock = clock
+        self.rng = rng
+        self.verbose = verbose
+        self.retries = 0
+
+    def start(self) -> float | None:
+        if self.policy.deadline is None:
+            return None
+        return self.clock() + self.policy.deadline
+
+    def before_attempt(self, contents) -> tuple[float, int]:
+        """Return the time to wait for the rate limiter and the tokens reserved."""
+        tokens = estimate_tokens(sum(content_size(c) for c in contents))
+        wait = self.limiter.reserve(tokens) if self.limiter is not None else 0.0
+        return wait, tokens
+
+    def with_timeout(self, config, deadline: float | None):
+        if deadline is None:
+            return config
+        remaining_ms = max(int((deadline - self.clock()) * 1000), 1)
+        config = config or types.GenerateContentConfig()
+        http_options = (config.http_options or types.HttpOptions()).model_copy(
+            update={"timeout": remaining_ms}
+        )
+        return config.model_copy(update={"http_options": http_options})
+
+    def after_success(self, response, tokens: int):
+        usage = getattr(response, "usage_metadata", None)
+        if self.limiter is not None and usage is not None and usage.total_token_count:
+            self.limiter.adjust(usage.total_token_count - tokens)
+
+    def on_failure(self, error: Exception, retry: int, deadline: float | None) -> float:
+        """Return the delay before the next attempt, or re-raise `error`."""
+        if retry >= self.policy.max_retries or not is_retryable(error):
+            raise error
+        server_delay = retry_after(error)
+        delay = self.policy.backoff(retry, self.rng)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+            if self.limiter is not None:
+                self.limiter.pause(server_delay)
+        if deadline is not None and self.clock() + delay >= deadline:
+            raise error
+        self.retries += 1
+        if self.verbose:
+            print(f"Model call failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+
+class RetryingModels:
+    """Wrap `client.models` to retry failed `generate_content` calls.
+
+    Transient failures (HTTP 408, 429 and 5xx, and transport errors) are retried
+    with exponential backoff and full jitter, waiting at least as long as the
+    server's `Retry-After` asks for. Every attempt first waits for the optional rate
+    limiter, and the whole call is bounded by the policy's deadline. Other attributes
+    are passed through to the wrapped object.
+
+    Parameters
+    ----------
+    models: genai.models.Models
+        The object to wrap
+    policy: RetryPolicy | None
+        Retry limits and backoff parameters. Default: None (`RetryPolicy()`)
+    limiter: RateLimiter | None
+        Shared request and token rate limiter. Default: None
+    sleep: Callable[[float], None]
+        Used to wait, replaceable in tests. Default: `time.sleep`
+    clock: Callable[[], float]
+        Monotonic clock, replaceable in tests. Default: `time.monotonic`
+    rng: random.Random | None
+        Source of the backoff jitter. Default: None (a new `random.Random`)
+    verbose: bool
+        Whether to print a line for every retry. Default: False
+    """
+
+    def __init__(
+        self,
+        models,
+        policy: RetryPolicy | None = None,
+        limiter: RateLimiter | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+        verbose: bool = False,
+    ):
+        self._models = models
+        self._sleep = sleep
+        self._retrier = _Retrier(
+            policy or RetryPolicy(), limiter, clock, rng or random.Random(), verbose
+        )
+
+    @property
+    def retries(self) -> int:
+        return self._retrier.retries
+
+    def generate_content(
+        self,
+        *,
+        model: str,
+        contents: list[types.Content],
+        config: types.GenerateContentConfig | None = None,
+    ) -> types.GenerateContentResponse:
+        deadline = self._retrier.start()
+        for retry in range(self._retrier.policy.max_retries + 1):
+            wait, tokens = self._retrier.before_attempt(contents)
+            if wait > 0:
+                self._sleep(wait)
+            try:
+                response = self._models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=self._retrier.with_timeout(config, deadline),
+                )
+            except Exception as e:
+                self._sleep(self._retrier.on_failure(e, retry, deadline))
+                continue
+            self._retrier.after_success(response, tokens)
+            return response
+
+    def __getattr__(self, name: str):
+        return getattr(self._models, name)
+
+
+class AsyncRetryingModels:
+    """Wrap `client.aio.models` to retry failed `generate_content_stream` calls.
+
+    Only opening the stream is retried: once chunks have been handed out, a failure
+    is passed on, as the caller may already have acted on them. The token estimate is
+    corrected with the usage reported by the last chunks once the stream is
+    consumed. Takes the same arguments as `RetryingModels`, with an async `sleep`.
+    """
+
+    def __init__(
+        self,
+        models,
+        policy: RetryPolicy | None = None,
+        limiter: RateLimiter | None = None,
+        sleep: Callable[[float], object] = asyncio.sleep,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random | None = None,
+        verbose: bool = False,
+    ):
+        self._models = models
+        self._sleep = sleep
+        self._retrier = _Retrier(
+            policy or RetryPolicy(), limiter, clock, rng or random.Random(), verbose
+        )
+
+    @property
+    def retries(self) -> int:
+        return self._retrier.retries
+
+    async def generate_content_stream(
+        self,
+        *,
+        model: str,
+        contents: list[types.Content],
+        config: types.GenerateContentConfig | None = None,
+    ):
+        deadline = self._retrier.start()
+        for retry in range(self._retrier.policy.max_retries + 1):
+            wait, tokens = self._retrier.before_attempt(contents)
+            if wait > 0:
+                await self._sleep(wait)
+            try:
+                stream = await self._models.generate_content_stream(
+                    model=model,
+                    contents=contents,
+                    config=self._retrier.with_timeout(config, deadline),
+                )
+            except Exception as e:
+                await self._sleep(self._retrier.on_failure(e, retry, deadline))
+                continue
+            return self._track_usage(stream, tokens)
+
+    async def _track_usage(self, stream, tokens: int):
+        # The usage of the whole response comes with the last chunks
+        last_usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage_metadata", None) is not None:
+                last_usage = chunk
+            yield chunk
+        if last_usage is not None:
+            self._retrier.after_success(last_usage, tokens)
+
+    def __getattr__(self, name: str):
+        return getattr(self._models, name)
+
+
+class RetryingClient:
+    """A `genai.Client` whose model calls are retried and rate limited.
+
+    `models` and `aio.models` are wrapped with `RetryingModels` and
+    `AsyncRetryingModels` sharing one policy and limiter; everything else is passed
+    through to the wrapped client.
+    """
+
+    def __init__(
+        self,
+        client,
+        policy: RetryPolicy | None = None,
+        limiter: RateLimiter | None = None,
+        verbose: bool = False,
+    ):
+        policy = policy or RetryPolicy()
+        self._client = client
+        self.models = RetryingModels(client.models, policy, limiter, verbose=verbose)
+        self.aio = _AsyncClient(
+            client.aio,
+            AsyncRetryingModels(client.aio.models, policy, limiter, verbose=verbose),
+        )
+
+    @property
+    def retries(self) -> int:
+        return self.models.retries + self.aio.models.retries
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+
+class _AsyncClient:
+    def __init__(self, aio, models: AsyncRetryingModels):
+        self._aio = aio
+        self.models = models
+
+    def __getattr__(self, name: str):
+        return getattr(self._aio, name)
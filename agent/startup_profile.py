@@ -0,0 +1,81 @@
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+# What a session imports before its first model call
+STARTUP_CODE = "import main; main.preload()"
+DEFAULT_TOP = 15
+
+
+@dataclass
+class ImportTiming:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.name.split(".")[0]
+
+
+def parse_importtime(output: str) -> list[ImportTiming]:
+    """Parse the lines `python -X importtime` writes to stderr."""
+    timings = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            timings.append(
+                ImportTiming(name, int(self_us), int(cumulative_us), len(indent) // 2)
+            )
+    return timings
+
+
+def profile_imports(code: str = STARTUP_CODE) -> tuple[list[ImportTiming], float]:
+    """Run `code` in a fresh interpreter with `-X importtime`.
+
+    Returns
+    -------
+    tuple[list[ImportTiming], float]
+        The timing of every import and the wall time of the whole run in seconds
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(proc.stderr), time.perf_counter() - start
+
+
+def summarize(timings: list[ImportTiming], wall_time: float, top: int = DEFAULT_TOP):
+    """Return a report of the time spent importing, per top-level package and for
+    the slowest individual modules."""
+    by_package: dict[str, int] = defaultdict(int)
+    for timing in timings:
+        by_package[timing.package] += timing.self_us
+    total_us = sum(by_package.values())
+
+    lines = [
+        f"Startup: {wall_time * 1000:.0f} ms wall time, "
+        f"{total_us / 1000:.0f} ms in {len(timings)} imports",
+        "",
+        f"{'Package':<30} {'Self ms':>9} {'Share':>7}",
+    ]
+    for package, self_us in sorted(by_package.items(), key=lambda p: -p[1])[:top]:
+        lines.append(f"{package:<30} {self_us / 1000:>9.1f} {self_us / total_us:>7.1%}")
+    lines += ["", f"{'Module':<50} {'Self ms':>9} {'Cumulative ms':>14}"]
+    for timing in sorted(timings, key=lambda t: -t.self_us)[:top]:
+        lines.append(
+            f"{timing.name:<50} {timing.self_us / 1000:>9.1f} "
+            f"{timing.cumulative_us / 1000:>14.1f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections.abc import Callable
+
+from functions.lazy_import import lazy_import
+
+types = lazy_import("google.genai.types")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Return the `pct`-th percentile of `values` using linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _latency_summary(latencies: list[float]) -> dict:
+    return {
+        "total": sum(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "max": max(latencies, default=0.0),
+    }
+
+
+class SessionTelemetry:
+    """Collect per-iteration token usage, latencies and payload sizes for a session.
+
+    Model calls are recorded from the agent loop and function calls from
+    `call_function`, which may run on several threads at once.
+
+    Parameters
+    ----------
+    token_counter: Callable[[list[types.Content]], int] | None
+        Optional function that counts the tokens of a request before it is sent.
+        Default: None
+    """
+
+    def __init__(
+        self, token_counter: Callable[[list[types.Content]], int] | None = None
+    ):
+        self.token_counter = token_counter
+        self.model_calls: list[dict] = []
+        self.tool_calls: list[dict] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def estimate_prompt_tokens(self, contents: list[types.Content]) -> int | None:
+        if self.token_counter is None:
+            return None
+        return self.token_counter(contents)
+
+    def record_model_call(
+        self,
+        iteration: int,
+        latency: float,
+        usage_metadata: types.GenerateContentResponseUsageMetadata | None,
+        request_bytes: int,
+        response_bytes: int,
+        estimated_prompt_tokens: int | None = None,
+        first_chunk_latency: float | None = None,
+    ) -> dict:
+        usage = usage_metadata or types.GenerateContentResponseUsageMetadata()
+        record = {
+            "iteration": iteration,
+            "latency_s": latency,
+            "prompt_tokens": usage.prompt_token_count or 0,
+            "candidates_tokens": usage.candidates_token_count or 0,
+            "cached_tokens": usage.cached_content_token_count or 0,
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+        }
+        if estimated_prompt_tokens is not None:
+            record["estimated_prompt_tokens"] = estimated_prompt_tokens
+        if first_chunk_latency is not None:
+            record["first_chunk_latency_s"] = first_chunk_latency
+        with self._lock:
+            self.model_calls.append(record)
+        return record
+
+    def record_tool_call(self, name: str, latency: float, result_bytes: int):
+        with self._lock:
+            self.tool_calls.append(
+                {"name": name, "latency_s": latency, "result_bytes": result_bytes}
+            )
+
+    def summary(self) -> dict:
+        with self._lock:
+            model_calls = list(self.model_calls)
+            tool_calls = list(self.tool_calls)
+
+        by_name: dict[str, list[float]] = {}
+        for call in tool_calls:
+            by_name.setdefault(call["name"], []).append(call["latency_s"])
+
+        return {
+            "wall_time_s": time.perf_counter() - self._start,
+            "model": {
+                "calls": len(model_calls),
+                "latency_s": _latency_summary([c["latency_s"] for c in model_calls]),
+                **{
+                    key: sum(c[key] for c in model_calls)
+                    for key in (
+                        "prompt_tokens",
+                        "candidates_tokens",
+                        "cached_tokens",
+                        "request_bytes",
+                        "response_bytes",
+                    )
+                },
+            },
+            "tools": {
+                "calls": len(tool_calls),
+                "latency_s": _latency_summary([c["latency_s"] for c in tool_calls]),
+                "result_bytes": sum(c["result_bytes"] for c in tool_calls),
+                "by_name": {
+                    name: {"calls": len(latencies), **_latency_summary(latencies)}
+                    for name, latencies in sorted(by_name.items())
+                },
+            },
+            "iterations": model_calls,
+        }
+
+    def dump(self, path: str):
+        """Write the session summary as JSON to `path`, or to stdout for "-"."""
+        data = json.dumps(self.summary(), indent=2)
+        if path == "-":
+            print(data)
+            return
+        with open(path, "w") as fp:
+            fp.write(data + "\n")
@@ -0,0 +1,361 @@
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+from google.genai.types import Content, Part
+
+import main
+from agent.response_cache import CachedModels, ResponseCache
+from agent.retry import RateLimiter, RetryingClient, RetryPolicy
+from agent.telemetry import SessionTelemetry
+from functions import run_python
+from functions.call_function import WORKING_DIRECTORY, ToolResultCache
+from functions.prefetch import Prefetcher
+from functions.python_worker_pool import PythonWorkerPool
+from functions.run_cache import RunCache
+from functions.search_index import drop_index
+from functions.workspace import close_workspace, open_workspace
+
+DEFAULT_SESSIONS = 4
+
+
+def parse_args(
+    argv: list[str] | None = None,
+) -> tuple[Namespace, list[str], Namespace]:
+    """Parse the batch options and the session options following "--".
+
+    Returns the batch options, the raw session options passed on to every session
+    and those session options parsed with a placeholder prompt.
+    """
+    parser = argparse.ArgumentParser(
+        prog="example_ai_agent_batch",
+        description="Run one agent session per prompt of a JSON Lines file",
+        epilog="Options after -- are passed to every session, e.g. "
+        "-- --compact --concurrent-tools",
+    )
+    parser.add_argument(
+        "input",
+        help='JSON Lines file with a "prompt" (or "title" and "body") per line, '
+        'and optionally an "id" ("-" for stdin)',
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help='Where to write one JSON result per session (default: "-", stdout)',
+    )
+    parser.add_argument(
+        "-j",
+        "--sessions",
+        type=int,
+        default=DEFAULT_SESSIONS,
+        help=f"Number of sessions run at the same time (default: {DEFAULT_SESSIONS})",
+    )
+    parser.add_argument(
+        "--template",
+        default=WORKING_DIRECTORY,
+        metavar="DIR",
+        help="Directory copied into each session's sandbox as its working "
+        f"directory (default: {WORKING_DIRECTORY})",
+    )
+    parser.add_argument(
+        "--sandbox-root",
+        metavar="DIR",
+        help="Where session sandboxes are created (default: the temp directory)",
+    )
+    parser.add_argument(
+        "--keep-sandboxes",
+        action="store_true",
+        help="Keep each session's sandbox instead of deleting it afterwards",
+    )
+    parser.add_argument(
+        "--warm-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Run Python files of all sessions on a shared pool of N warm "
+        "interpreters (default: disabled)",
+    )
+
+    argv = sys.argv[1:] if argv is None else argv
+    session_argv: list[str] = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, session_argv = argv[:split], argv[split + 1 :]
+    args = parser.parse_args(argv)
+    if args.sessions < 1:
+        parser.error("--sessions must be at least 1")
+
+    # Validate the session options once, up front
+    session_args = main.parse_args([*session_argv, "prompt"])
+    for option in ("journal", "telemetry"):
+        if getattr(session_args, option) is not None:
+            parser.error(f"--{option} cannot be used for batch sessions")
+    if session_args.stream or session_args.warm_workers:
+        parser.error(
+            "--stream and --warm-workers cannot be used for batch sessions; "
+            "use the batch --warm-workers option to share a pool between sessions"
+        )
+    return args, session_argv, session_args
+
+
+def _read_lines(fp, path: str) -> Iterator[tuple[str, str | None, str | None]]:
+    for number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("record is not an object")
+        except ValueError as e:
+            yield str(number), None, f"{path}:{number}: {e}"
+            continue
+        session_id = str(record.get("id", record.get("request_id", number)))
+        prompt = record.get("prompt") or "\n\n".join(
+            record[key] for key in ("title", "body") if record.get(key)
+        )
+        if not prompt:
+            yield session_id, None, f"{path}:{number}: no prompt in record"
+            continue
+        yield session_id, prompt, None
+
+
+def read_prompts(path: str) -> Iterator[tuple[str, str | None, str | None]]:
+    """Yield the `(id, prompt, error)` of every line of a JSON Lines file as it is
+    read.
+
+    A line that is not a JSON object or has no prompt yields its error instead of a
+    prompt, so one bad record does not stop the batch.
+    """
+    if path == "-":
+        yield from _read_lines(sys.stdin, path)
+        return
+    with open(path, encoding="utf-8") as fp:
+        yield from _read_lines(fp, path)
+
+
+def final_response(messages: list[Content]) -> str | None:
+    """Return the text of the model's final answer, if the session reached one."""
+    last = messages[-1]
+    if last.role != "model" or any(part.function_call for part in last.parts or []):
+        return None
+    return "".join(part.text or "" for part in last.parts or [] if not part.thought)
+
+
+def run_session(
+    session_id: str,
+    prompt: str,
+    models,
+    session_argv: list[str],
+    batch_args: Namespace,
+) -> dict:
+    """Run one agent session in a fresh copy of the template directory.
+
+    Returns
+    -------
+    dict
+        The session's result record: its final response or error and its metrics
+    """
+    sandbox = tempfile.mkdtemp(prefix="agent-session-", dir=batch_args.sandbox_root)
+    working_directory = os.path.join(sandbox, "workdir")
+    args = main.parse_args(
+        [*session_argv, "--working-directory", working_directory, "--", prompt]
+    )
+    messages = [Content(role="user", parts=[Part(text=prompt)])]
+    config = types.GenerateContentConfig(
+        tools=[main.get_available_functions()], system_instruction=main.SYSTEM_PROMPT
+    )
+    tool_cache = None if args.no_tool_cache else ToolResultCache()
+    prefetcher = None
+    if args.prefetch and tool_cache is not None:
+        prefetcher = Prefetcher(tool_cache, budget_bytes=args.prefetch_budget_kb * 1024)
+    telemetry = SessionTelemetry()
+    result = {"id": session_id, "response": None, "error": None}
+    workspace = None
+    start = time.perf_counter()
+    try:
+        shutil.copytree(
+            batch_args.template,
+            working_directory,
+            ignore=shutil.ignore_patterns("__pycache__"),
+        )
+        workspace = open_workspace(working_directory)
+        result["reached_max_iter"] = main.run_agent(
+            models, main.MODEL, messages, config, args, tool_cache, telemetry
+        )
+        result["response"] = final_response(messages)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+        drop_index(working_directory)
+        if workspace is not None:
+            close_workspace(working_directory)
+        if batch_args.keep_sandboxes:
+            result["sandbox"] = sandbox
+        else:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+    result["duration"] = time.perf_counter() - start
+    result["iterations"] = sum(1 for m in messages if m.role == "model")
+    result["telemetry"] = telemetry.summary()
+    if tool_cache is not None:
+        result["tool_cache"] = tool_cache.stats()
+    if prefetcher is not None:
+        result["prefetch"] = prefetcher.stats()
+    return result
+
+
+def run_batch(
+    prompts: Iterator[tuple[str, str | None, str | None]],
+    models,
+    session_argv: list[str],
+    batch_args: Namespace,
+    output,
+) -> tuple[int, int]:
+    """Run sessions for `prompts` on a thread pool and write their results.
+
+    Prompts are only read as sessions free up, so the input can be larger than
+    memory, and results are written and flushed in the order sessions finish.
+    Records that could not be read get an error result without a session. Should
+    reading the input fail altogether, the sessions already running are finished
+    and written before the error is raised.
+
+    Returns
+    -------
+    tuple[int, int]
+        The number of sessions run and how many of them failed
+    """
+    total = failed = 0
+    with ThreadPoolExecutor(
+        max_workers=batch_args.sessions, thread_name_prefix="session"
+    ) as executor:
+        running: set[Future] = set()
+
+        def write_record(result: dict):
+            nonlocal total, failed
+            total += 1
+            failed += result["error"] is not None
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            print(
+                f"[{total}] {result['id']}: "
+                f"{'failed' if result['error'] else 'done'} "
+                f"in {result['duration']:.1f}s",
+                file=sys.stderr,
+            )
+
+        def write_finished(done: set[Future]):
+            for future in done:
+                write_record(future.result())
+
+        try:
+            for session_id, prompt, error in prompts:
+                if error is not None:
+                    write_record(
+                        {
+                            "id": session_id,
+                            "response": None,
+                            "error": error,
+                            "duration": 0.0,
+                        }
+                    )
+                    continue
+                if len(running) >= batch_args.sessions:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    write_finished(done)
+                running.add(
+                    executor.submit(
+                        run_session,
+                        session_id,
+                        prompt,
+                        models,
+                        session_argv,
+                        batch_args,
+                    )
+                )
+        finally:
+            write_finished(wait(running).done)
+    return total, failed
+
+
+def batch_main():
+    batch_args, session_argv, session_args = parse_args()
+
+    # One client, and so one HTTP connection pool and one rate limiter, for all
+    # sessions
+    load_dotenv()
+    models = None
+    if not session_args.offline:
+        policy = RetryPolicy(
+            max_retries=session_args.max_retries, deadline=session_args.call_timeout
+        )
+        limiter = RateLimiter(session_args.rpm, session_args.tpm)
+        client = RetryingClient(
+            genai.Client(api_key=os.environ.get("GEMINI_API_KEY")), policy, limiter
+        )
+        models = client.models
+    if session_args.response_cache is not None:
+        cache = ResponseCache(
+            session_args.response_cache, session_args.cache_max_mb * 1024 * 1024
+        )
+        models = CachedModels(models, cache, offline=session_args.offline)
+
+    worker_pool = None
+    if batch_args.warm_workers > 0:
+        worker_pool = PythonWorkerPool(batch_args.warm_workers)
+        run_python.use_worker_pool(worker_pool)
+    if session_args.cache_runs:
+        # Shared by all sessions; keys include each sandbox's path
+        run_python.use_run_cache(RunCache())
+    to_stdout = batch_args.output == "-"
+    start = time.perf_counter()
+    try:
+        # Sessions print their progress to stdout, which is of no use when they run
+        # side by side; their results are in the output records instead
+        with (
+            open(
+                sys.stdout.fileno() if to_stdout else batch_args.output,
+                "w",
+                encoding="utf-8",
+                closefd=not to_stdout,
+            ) as output,
+            open(os.devnull, "w") as devnull,
+            contextlib.redirect_stdout(devnull),
+        ):
+            total, failed = run_batch(
+                read_prompts(batch_args.input),
+                models,
+                session_argv,
+                batch_args,
+                output,
+            )
+    finally:
+        if worker_pool is not None:
+            run_python.use_worker_pool(None)
+            worker_pool.close()
+        run_python.use_run_cache(None)
+    print(
+        f"{total} sessions ({failed} failed) in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    try:
+        batch_main()
+    except Exception as e:
+        print(f"Error running batch: {e}", file=sys.stderr)
+        sys.exit(1)
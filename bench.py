@@ -0,0 +1,333 @@
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from collections.abc import Callable
+
+from google.genai import types
+
+import main
+from agent.fake_client import ScriptedClient
+from functions.get_file_content import get_file_content
+from functions.get_files_info import get_files_info
+from functions.run_python import run_python_file
+from functions.search_index import drop_index
+from functions.workspace import Workspace
+from functions.write_file import write_file
+
+CALCULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calculator")
+# Timings only compare on the machine they were taken on, so the baseline is kept
+# out of the repository and created locally with --update-baseline
+DEFAULT_BASELINE = "bench_baseline.json"
+DEFAULT_TOLERANCE = 0.5
+DEFAULT_REPEAT = 5
+MIN_SAMPLE_TIME = 0.05
+
+# A benchmark's setup gets a scratch directory and returns the operation to time,
+# or a context manager giving it, which is exited once the operation was timed
+BENCHMARKS: dict[str, Callable[[str], Callable[[], object]]] = {}
+
+
+def benchmark(name: str, **params):
+    def register(setup):
+        BENCHMARKS[name] = functools.partial(setup, **params)
+        return setup
+
+    return register
+
+
+def make_tree(root: str, files: int, fanout: int = 10, file_size: int = 200) -> str:
+    """Create `files` files spread over nested directories of `fanout` entries."""
+    content = "x" * (file_size - 1) + "\n"
+    for i in range(files):
+        parts = []
+        n = i // fanout
+        while n:
+            parts.append(f"d{n % fanout}")
+            n //= fanout
+        directory = os.path.join(root, *parts)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"f{i}.txt"), "w") as fp:
+            fp.write(content)
+    return root
+
+
+@benchmark("get_files_info/top_level/100", files=100, recursive=False)
+@benchmark("get_files_info/recursive/100", files=100, recursive=True)
+@benchmark("get_files_info/recursive/5000", files=5000, recursive=True)
+def bench_get_files_info(tmp: str, files: int, recursive: bool):
+    make_tree(tmp, files)
+    return lambda: get_files_info(tmp, ".", recursive=recursive, page_size=files)
+
+
+@benchmark("get_file_content/1KiB", size=1024)
+@benchmark("get_file_content/1MiB", size=1024 * 1024)
+def bench_get_file_content(tmp: str, size: int):
+    with open(os.path.join(tmp, "file.txt"), "w") as fp:
+        fp.write(("y" * 79 + "\n") * (size // 80))
+    return lambda: get_file_content(tmp, "file.txt")
+
+
+@benchmark("write_file/1KiB", size=1024)
+@benchmark("write_file/1MiB", size=1024 * 1024)
+def bench_write_file(tmp: str, size: int):
+    content = "z" * size
+    return lambda: write_file(tmp, "out.txt", content)
+
+
+@benchmark("run_python_file/calculator")
+def bench_run_python_file(tmp: str):
+    return lambda: run_python_file(CALCULATOR_DIR, "main.py", ["3 + 5"])
+
+
+@benchmark("workspace/relative/shallow", path="main.py")
+@benchmark("workspace/relative/deep", path="/".join(["d"] * 20 + ["f.py"]))
+@benchmark("workspace/relative/escape", path="../../etc/passwd")
+@contextlib.contextmanager
+def bench_workspace_relative(tmp: str, path: str):
+    with Workspace(CALCULATOR_DIR) as workspace:
+        yield lambda: workspace.relative(path)
+
+
+@benchmark("workspace/open/shallow", path="main.py")
+@benchmark("workspace/open/deep", path="/".join(["d"] * 5 + ["f.py"]))
+@contextlib.contextmanager
+def bench_workspace_open(tmp: str, path: str):
+    os.makedirs(os.path.join(tmp, os.path.dirname(path)), exist_ok=True)
+    with open(os.path.join(tmp, path), "w"):
+        pass
+    with Workspace(tmp) as workspace:
+        yield lambda: os.close(workspace.open(path, os.O_RDONLY))
+
+
+LONG_EXPRESSION = " + ".join(f"{i} * {i + 1} / 2" for i in range(50))
+
+
+@benchmark("calculator/short", expression="3 * 4 + 5", cache_size=1024)
+@benchmark("calculator/short/uncached", expression="3 * 4 + 5", cache_size=0)
+@benchmark("calculator/long", expression=LONG_EXPRESSION, cache_size=1024)
+@benchmark("calculator/long/uncached", expression=LONG_EXPRESSION, cache_size=0)
+def bench_calculator(tmp: str, expression: str, cache_size: int):
+    # The calculator is a separate project, importable as it is run: from its folder
+    if CALCULATOR_DIR not in sys.path:
+        sys.path.insert(0, CALCULATOR_DIR)
+    from pkg.calculator import Calculator
+
+    calculator = Calculator(cache_size=cache_size)
+    return lambda: calculator.evaluate(expression)
+
+
+def call(name: str, **args) -> list[types.Part]:
+    return [types.Part(function_call=types.FunctionCall(name=name, args=args))]
+
+
+# A session that looks around, edits the calculator and checks the result
+AGENT_SCRIPT = [
+    call("get_files_info", recursive=True),
+    call("get_file_content", file_path="pkg/calculator.py"),
+    call("search_files", pattern="def evaluate"),
+    call("write_file", file_path="notes.txt", content="checked\n" * 100),
+    call("run_python_file", file_path="main.py", args=["3 + 5"]),
+    [types.Part(text="The calculator works.")],
+]
+
+
+@benchmark("agent_loop/sync", options=[])
+@benchmark("agent_loop/stream", options=["--stream"])
+@benchmark("agent_loop/concurrent_tools", options=["--concurrent-tools"])
+def bench_agent_loop(tmp: str, options: list[str]):
+    working_directory = os.path.join(tmp, "calculator")
+    shutil.copytree(CALCULATOR_DIR, working_directory)
+    client = ScriptedClient(AGENT_SCRIPT)
+    argv = ["--working-directory", working_directory, *options, "check the calculator"]
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.main(argv, model_client=client)
+        drop_index(working_directory)
+
+    return run
+
+
+def measure(operation: Callable[[], object], repeat: int) -> dict:
+    """Time `operation` like `timeit`, calling it often enough per sample for the
+    clock's resolution not to matter, and return the per call times in seconds."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_TIME:
+            break
+        number *= 10 if elapsed < MIN_SAMPLE_TIME / 10 else 2
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "min_s": min(samples),
+        "median_s": statistics.median(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_benchmark(name: str, repeat: int) -> dict:
+    """Set up and time one benchmark in a scratch directory of its own."""
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        operation = BENCHMARKS[name](tmp)
+        if isinstance(operation, contextlib.AbstractContextManager):
+            operation = stack.enter_context(operation)
+        return measure(operation, repeat)
+
+
+def run_benchmarks(names: list[str], repeat: int) -> dict:
+    results = {}
+    for name in names:
+        results[name] = run_benchmark(name, repeat)
+        print(f"{name:<40} {format_time(results[name]['min_s']):>10}", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the benchmarks whose fastest time is more than `tolerance` (a
+    fraction) slower than in the baseline."""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["min_s"] > baseline[name]["min_s"] * (1 + tolerance)
+    ]
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def print_comparison(results: dict, baseline: dict, regressions: list[str]):
+    print(f"{'Benchmark':<40} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<40} {'-':>10} {format_time(result['min_s']):>10} {'new':>8}")
+            continue
+        before = baseline[name]["min_s"]
+        change = f"{result['min_s'] / before - 1:+.0%}"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(
+            f"{name:<40} {format_time(before):>10} "
+            f"{format_time(result['min_s']):>10} {change:>8}{flag}"
+        )
+
+
+def parse_args(argv: list[str] | None = None) -> Namespace:
+    parser = argparse.ArgumentParser(
+        prog="example_ai_agent_bench",
+        description="Benchmark the tools, the calculator and the agent loop (driven "
+        "by a scripted fake model) and compare the results against a baseline",
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        metavar="NAME",
+        help="Only run the benchmarks whose name starts with one of these",
+    )
+    parser.add_argument(
+        "-o", "--output", metavar="FILE", help="Write the results as JSON to FILE"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=DEFAULT_BASELINE,
+        metavar="FILE",
+        help="Results to compare against, taken on this machine with "
+        "--update-baseline (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="How much slower than the baseline a benchmark may be, as a fraction "
+        f"(default: {DEFAULT_TOLERANCE})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help=f"Number of samples per benchmark (default: {DEFAULT_REPEAT})",
+    )
+    parser.add_argument(
+        "--list", action="store_true", help="List the benchmarks and exit"
+    )
+    return parser.parse_args(argv)
+
+
+def bench_main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    names = sorted(
+        name
+        for name in BENCHMARKS
+        if not args.benchmarks or name.startswith(tuple(args.benchmarks))
+    )
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    results = run_benchmarks(names, args.repeat)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            # Keep the baseline of benchmarks that were not run this time
+            with open(args.baseline) as fp:
+                report["benchmarks"] = json.load(fp)["benchmarks"] | results
+        with open(args.baseline, "w") as fp:
+            json.dump(report, fp, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        # Nothing to compare against must not pass as "no regressions"
+        print(
+            f'No baseline at "{args.baseline}", run with --update-baseline first',
+            file=sys.stderr,
+        )
+        return 1
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)["benchmarks"]
+    regressions = compare(results, baseline, args.tolerance)
+    print_comparison(results, baseline, regressions)
+    if regressions:
+        print(
+            f"{len(regressions)} benchmarks regressed by more than {args.tolerance:.0%}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(bench_main())
@@ -1,26 +1,93 @@
 # main.py
 
+import json
 import sys
 
 from pkg.calculator import Calculator
-from pkg.render import render
+from pkg.render import render, render_json
+
+
+def print_usage():
+    print("Calculator App")
+    print('Usage: python main.py "<expression>"')
+    print('Example: python main.py "3 + 5"')
+    print("Batch: python main.py --batch [FILE] (one expression per line)")
+    print("Add --json to print results as JSON instead of boxes")
+
+
+def evaluate_line(calculator, line):
+    """Evaluate a plain expression, or an NDJSON object with an "expression" and an
+    optional "id", and return the id, expression, result and error message."""
+    expression_id, expression = None, line
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+            expression_id, expression = record.get("id"), record["expression"]
+        except (ValueError, KeyError, AttributeError):
+            return None, line, None, "expected a JSON object with an expression"
+    try:
+        return expression_id, expression, calculator.evaluate(expression), None
+    except Exception as e:
+        return expression_id, expression, None, str(e)
+
+
+def evaluate_stream(calculator, lines, as_json, prompt=False):
+    for raw_line in lines:
+        line = raw_line.strip()
+        if line:
+            expression_id, expression, result, error = evaluate_line(calculator, line)
+            if as_json:
+                print(render_json(expression, result, error, expression_id))
+            elif error is not None:
+                print(f"Error: {error}")
+            else:
+                print(render(expression, result))
+        if prompt:
+            print("> ", end="")
+        # Flush after every line so results reach a pipe as soon as they are ready
+        sys.stdout.flush()
 
 
 def main():
     calculator = Calculator()
-    if len(sys.argv) <= 1:
-        print("Calculator App")
-        print('Usage: python main.py "<expression>"')
-        print('Example: python main.py "3 + 5"')
+    args = sys.argv[1:]
+    as_json = "--json" in args
+    if as_json:
+        args.remove("--json")
+
+    if args and args[0] == "--batch":
+        if len(args) > 2:
+            print("Error: --batch takes at most one file")
+            return
+        if len(args) == 2 and args[1] != "-":
+            try:
+                with open(args[1]) as lines:
+                    evaluate_stream(calculator, lines, as_json)
+            except OSError as e:
+                print(f"Error: {e}")
+        else:
+            interactive = sys.stdin.isatty()
+            if interactive:
+                print("> ", end="", flush=True)
+            evaluate_stream(calculator, sys.stdin, as_json, prompt=interactive)
+        return
+
+    if not args:
+        print_usage()
         return
 
-    expression = " ".join(sys.argv[1:])
+    expression = " ".join(args)
     try:
         result = calculator.evaluate(expression)
-        to_print = render(expression, result)
-        print(to_print)
+        if as_json:
+            print(render_json(expression, result))
+        else:
+            print(render(expression, result))
     except Exception as e:
-        print(f"Error: {e}")
+        if as_json:
+            print(render_json(expression, error=str(e)))
+        else:
+            print(f"Error: {e}")
 
 
 if __name__ == "__main__":
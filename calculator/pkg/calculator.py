@@ -1,13 +1,85 @@
 # calculator.py
 
+import math
+import operator
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIVISION_BY_ZERO_POLICIES = ("raise", "nan", "inf")
+
+
+class _Fail:
+    # Compiled in place of the step where evaluation stops with a ValueError, so
+    # errors are raised in the same order as when parsing and evaluating together
+    __slots__ = ("message",)
+
+    def __init__(self, message):
+        self.message = message
+
+
+class _Variable:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+def _divide_or_nan(a, b):
+    return a / b if b else math.nan
+
+
+def _divide_ieee(a, b):
+    # What a float division by zero gives in IEEE 754 arithmetic (and NumPy)
+    if b:
+        return a / b
+    if a == 0 or math.isnan(a):
+        return math.nan
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def _array_divide(policy):
+    def divide(a, b):
+        if policy == "raise":
+            if np.any(np.equal(b, 0)):
+                raise ZeroDivisionError("float division by zero")
+            return np.divide(a, b)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = np.divide(a, b)
+        if policy == "nan":
+            result = np.where(np.equal(b, 0), np.nan, result)
+        return result
+
+    return divide
+
 
 class Calculator:
-    def __init__(self):
+    def __init__(self, cache_size=1024, division_by_zero="raise"):
+        """
+        Parameters
+        ----------
+        cache_size : int
+            Number of compiled expressions to keep
+        division_by_zero : str
+            What dividing by zero gives: "raise" a ZeroDivisionError, "nan", or
+            "inf" for the IEEE 754 result (+-inf, or nan for 0 / 0)
+        """
+        if division_by_zero not in DIVISION_BY_ZERO_POLICIES:
+            raise ValueError(f"unknown division by zero policy: {division_by_zero}")
+        self.division_by_zero = division_by_zero
+        divide = {
+            "raise": operator.truediv,
+            "nan": _divide_or_nan,
+            "inf": _divide_ieee,
+        }[division_by_zero]
         self.operators = {
-            "+": lambda a, b: a + b,
-            "-": lambda a, b: a - b,
-            "*": lambda a, b: a * b,
-            "/": lambda a, b: a / b,
+            "+": operator.add,
+            "-": operator.sub,
+            "*": operator.mul,
+            "/": divide,
         }
         self.precedence = {
             "+": 1,
@@ -15,48 +87,118 @@ class Calculator:
             "*": 2,
             "/": 2,
         }
+        # Per instance, as compiled programs hold this instance's operators
+        self._compile_cached = lru_cache(maxsize=cache_size)(self._compile)
 
-    def evaluate(self, expression):
+    def evaluate(self, expression, **variables):
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
+        variables = {name: float(value) for name, value in variables.items()}
+        return self._execute(self.compile(expression), variables)
 
-    def _evaluate_infix(self, tokens):
-        values = []
+    def evaluate_many(self, expression, **arrays):
+        """Evaluate an expression elementwise over NumPy arrays.
+
+        The expression is compiled once and every operation is applied to whole
+        arrays, so a formula is evaluated over millions of inputs at close to NumPy
+        speed.
+
+        Parameters
+        ----------
+        expression : str
+            Expression whose variables are given as keyword arguments
+        **arrays : array_like
+            Values of the variables, broadcast against each other
+
+        Returns
+        -------
+        numpy.ndarray
+            Float array with the broadcast shape of the variables
+        """
+        if np is None:
+            raise ImportError("evaluate_many requires NumPy")
+        if not expression or expression.isspace():
+            return None
+        variables = {name: np.asarray(a, dtype=float) for name, a in arrays.items()}
+        array_operators = {self.operators["/"]: _array_divide(self.division_by_zero)}
+        result = self._execute(self.compile(expression), variables, array_operators)
+        shape = np.broadcast_shapes(*(a.shape for a in variables.values()))
+        return np.broadcast_to(result, shape) if np.ndim(result) == 0 else result
+
+    def compile(self, expression):
+        """Parse an infix expression into a postfix program, reusing the program
+        compiled for the same expression before.
+
+        The program is a tuple of numbers to push, binary operator functions to
+        apply, variables to look up, and at most one final step that raises the
+        expression's syntax error. Changing `operators` or `precedence` after an
+        expression was compiled does not affect its cached program.
+        """
+        return self._compile_cached(expression)
+
+    def _compile(self, expression):
+        program = []
         operators = []
+        depth = 0
+
+        def apply_operator():
+            nonlocal depth
+            op = operators.pop()
+            if depth < 2:
+                program.append(_Fail(f"not enough operands for operator {op}"))
+                return False
+            program.append(self.operators[op])
+            depth -= 1
+            return True
 
-        for token in tokens:
+        for token in expression.strip().split():
             if token in self.operators:
                 while (
                     operators
-                    and operators[-1] in self.operators
                     and self.precedence[operators[-1]] >= self.precedence[token]
                 ):
-                    self._apply_operator(operators, values)
+                    if not apply_operator():
+                        return tuple(program)
                 operators.append(token)
             else:
                 try:
-                    values.append(float(token))
+                    program.append(float(token))
                 except ValueError:
-                    raise ValueError(f"invalid token: {token}")
+                    if not token.isidentifier():
+                        program.append(_Fail(f"invalid token: {token}"))
+                        return tuple(program)
+                    program.append(_Variable(token))
+                depth += 1
 
         while operators:
-            self._apply_operator(operators, values)
+            if not apply_operator():
+                return tuple(program)
 
-        if len(values) != 1:
-            raise ValueError("invalid expression")
+        if depth != 1:
+            program.append(_Fail("invalid expression"))
+        return tuple(program)
 
+    def _execute(self, program, variables, replaced_operators=None):
+        values = []
+        push = values.append
+        pop = values.pop
+        for step in program:
+            if step.__class__ is float:
+                push(step)
+            elif step.__class__ is _Variable:
+                try:
+                    push(variables[step.name])
+                except KeyError:
+                    # Without variables, names are reported as before variables
+                    # were supported
+                    kind = "undefined variable" if variables else "invalid token"
+                    raise ValueError(f"{kind}: {step.name}") from None
+            elif step.__class__ is _Fail:
+                raise ValueError(step.message)
+            else:
+                apply = (
+                    replaced_operators.get(step, step) if replaced_operators else step
+                )
+                b = pop()
+                push(apply(pop(), b))
         return values[0]
-
-    def _apply_operator(self, operators, values):
-        if not operators:
-            return
-
-        operator = operators.pop()
-        if len(values) < 2:
-            raise ValueError(f"not enough operands for operator {operator}")
-
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
@@ -1,11 +1,16 @@
 # render.py
 
+import json
 
-def render(expression, result):
+
+def format_result(result):
     if isinstance(result, float) and result.is_integer():
-        result_str = str(int(result))
-    else:
-        result_str = str(result)
+        return int(result)
+    return result
+
+
+def render(expression, result):
+    result_str = str(format_result(result))
 
     box_width = max(len(expression), len(result_str)) + 4
 
@@ -22,3 +27,13 @@ def render(expression, result):
     )
     box.append("└" + "─" * box_width + "┘")
     return "\n".join(box)
+
+
+def render_json(expression, result=None, error=None, expression_id=None):
+    record = {} if expression_id is None else {"id": expression_id}
+    record["expression"] = expression
+    if error is not None:
+        record["error"] = error
+    else:
+        record["result"] = format_result(result)
+    return json.dumps(record)
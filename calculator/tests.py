@@ -1,8 +1,9 @@
 # tests.py
 
+import math
 import unittest
 
-from pkg.calculator import Calculator
+from pkg.calculator import Calculator, np
 
 
 class TestCalculator(unittest.TestCase):
@@ -45,6 +46,50 @@ class TestCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.calculator.evaluate("+ 3")
 
+    def test_compiled_once(self):
+        program = self.calculator.compile("2 * 3 + 1")
+        self.assertIs(program, self.calculator.compile("2 * 3 + 1"))
+        self.assertEqual(self.calculator.evaluate("2 * 3 + 1"), 7)
+
+    def test_error_order(self):
+        # Evaluation stops at the first failing step, as without compiling
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate("1 / 0 + $")
+        with self.assertRaisesRegex(ValueError, "invalid token: \\$"):
+            self.calculator.evaluate("1 + $ / 0")
+
+    def test_variables(self):
+        self.assertEqual(self.calculator.evaluate("x * 2 + y", x=3, y=1), 7)
+        with self.assertRaisesRegex(ValueError, "undefined variable: y"):
+            self.calculator.evaluate("x + y", x=1)
+        with self.assertRaisesRegex(ValueError, "invalid token: a"):
+            self.calculator.evaluate("3 + a")
+        with self.assertRaisesRegex(ValueError, "invalid token: bad"):
+            self.calculator.evaluate("bad $")
+
+    def test_division_by_zero_policy(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate("x / 0", x=1)
+        self.assertTrue(
+            math.isnan(Calculator(division_by_zero="nan").evaluate("1 / 0"))
+        )
+        self.assertEqual(
+            Calculator(division_by_zero="inf").evaluate("-1 / 0"), -math.inf
+        )
+        with self.assertRaises(ValueError):
+            Calculator(division_by_zero="ignore")
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_evaluate_many(self):
+        x = np.arange(4.0)
+        result = self.calculator.evaluate_many("x * 2 + y / 4", x=x, y=[[4.0], [8.0]])
+        np.testing.assert_array_equal(result, [[1, 3, 5, 7], [2, 4, 6, 8]])
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate_many("1 / x", x=x)
+        result = Calculator(division_by_zero="nan").evaluate_many("1 / x", x=x)
+        self.assertTrue(np.isnan(result[0]))
+        self.assertEqual(result[2], 0.5)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,112 @@
+"""Thin client for the agent server.
+
+Takes the same arguments as `main.py` and runs the session on a warm server started
+with `python server.py`, so it only needs the standard library and starts in
+milliseconds. Without a running server, `main.py` is run directly instead.
+
+`main.py` itself also hands its session to a running server with `run_on_server`,
+unless `AGENT_NO_SERVER` is set.
+"""
+
+import os
+import signal
+import socket
+import sys
+
+from agent.daemon import (
+    check_private_dir,
+    default_socket_path,
+    peer_uid,
+    read_messages,
+    send_request,
+)
+
+SOCKET_ENV_VAR = "AGENT_SOCKET"
+NO_SERVER_ENV_VAR = "AGENT_NO_SERVER"
+
+
+def run_locally(argv: list[str]):
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    # The server was just found not to be running, so do not look for it again
+    env = {**os.environ, NO_SERVER_ENV_VAR: "1"}
+    os.execve(sys.executable, [sys.executable, main_path, *argv], env)
+
+
+def connect(socket_path: str) -> socket.socket | None:
+    """Connect to the agent server listening on `socket_path`, or return None if
+    there is none.
+
+    The session hands the server its environment and terminal, so only a server run
+    by the current user is used: the socket must be in a directory no one else may
+    use, and the process listening on it must run as the current user.
+    """
+    try:
+        check_private_dir(os.path.dirname(os.path.abspath(socket_path)))
+    except FileNotFoundError:
+        return None
+    except PermissionError as e:
+        print(f"Not using the agent server: {e}", file=sys.stderr)
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    # Where the platform cannot tell, the private directory has to do
+    uid = peer_uid(sock)
+    if uid is not None and uid != os.getuid():
+        sock.close()
+        print(
+            f"Not using the agent server: {socket_path} is not served by the "
+            "current user",
+            file=sys.stderr,
+        )
+        return None
+    return sock
+
+
+def run_on_server(argv: list[str]) -> int | None:
+    """Run a session on the agent server and return its exit code, or None if no
+    server is running (or `AGENT_NO_SERVER` is set)."""
+    if os.environ.get(NO_SERVER_ENV_VAR):
+        return None
+    sock = connect(os.environ.get(SOCKET_ENV_VAR) or default_socket_path())
+    if sock is None:
+        return None
+
+    with sock:
+        send_request(sock, argv)
+        session_pid = None
+        while True:
+            try:
+                for message in read_messages(sock):
+                    if "error" in message:
+                        print(
+                            f"Agent server error: {message['error']}", file=sys.stderr
+                        )
+                        return 1
+                    if "pid" in message:
+                        session_pid = message["pid"]
+                    if "returncode" in message:
+                        return message["returncode"]
+                break
+            except KeyboardInterrupt:
+                # Let the session handle Ctrl-C as the CLI would, and wait for it
+                if session_pid is None:
+                    return 130
+                os.kill(session_pid, signal.SIGINT)
+    print("Agent server closed the connection unexpectedly", file=sys.stderr)
+    return 1
+
+
+def client_main(argv: list[str]) -> int:
+    returncode = run_on_server(argv)
+    if returncode is None:
+        run_locally(argv)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(client_main(sys.argv[1:]))
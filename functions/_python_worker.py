@@ -0,0 +1,163 @@
+"""Warm Python worker used by `functions.python_worker_pool`.
+
+The worker imports commonly used standard library modules once and then waits for
+jobs on the socket it was handed. Every job runs in a forked child, so scripts start
+from a clean copy of the warm interpreter and cannot affect later jobs.
+
+This file is run as a script and must only depend on the standard library.
+"""
+
+import contextlib
+import importlib
+import io
+import json
+import os
+import runpy
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# The modules most scripts (and unittest based test files) pull in
+WARM_MODULES = (
+    "argparse",
+    "collections",
+    "dataclasses",
+    "decimal",
+    "functools",
+    "itertools",
+    "math",
+    "pathlib",
+    "re",
+    "typing",
+    "unittest",
+    "unittest.mock",
+)
+
+MAX_FDS = 3
+MAX_MESSAGE = 65536
+KILL_REQUEST = b"kill\n"
+
+
+def recv_request(sock: socket.socket) -> tuple[dict | None, list[int]]:
+    data = b""
+    fds: list[int] = []
+    while True:
+        chunk, chunk_fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE, MAX_FDS)
+        fds += chunk_fds
+        if not chunk:
+            return None, fds
+        data += chunk
+        # A kill request can arrive just after its job finished on its own
+        while data.startswith(KILL_REQUEST):
+            data = data[len(KILL_REQUEST) :]
+        if data.endswith(b"\n"):
+            return json.loads(data), fds
+
+
+def run_child(request: dict, stdout_fd: int, stderr_fd: int, cwd_fd: int):
+    """Run the requested script in the current (forked) process and never return."""
+    exit_code = 0
+    try:
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.fchdir(cwd_fd)
+        for fd in (devnull, stdout_fd, stderr_fd, cwd_fd):
+            os.close(fd)
+        sys.stdout = io.TextIOWrapper(io.FileIO(1, "w", closefd=False))
+        sys.stderr = io.TextIOWrapper(
+            io.FileIO(2, "w", closefd=False), line_buffering=True
+        )
+
+        script = request["argv"][0]
+        sys.argv = list(request["argv"])
+        sys.path[0] = os.path.dirname(os.path.abspath(script))
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(exit_code)
+
+
+def kill_child(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        os.kill(pid, signal.SIGKILL)
+
+
+def wait_child(pid: int, timeout: float, sock: socket.socket) -> tuple[int, bool]:
+    """Wait for a child with a timeout.
+
+    The child is killed once the timeout expires, or as soon as anything arrives on
+    `sock`, which is how the pool asks for runaway scripts to be stopped.
+    """
+    deadline = time.monotonic() + timeout
+    pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+    watched = [sock] if pidfd is None else [sock, pidfd]
+    killed = False
+    try:
+        while True:
+            waited_pid, status = os.waitpid(pid, os.WNOHANG)
+            if waited_pid:
+                return os.waitstatus_to_exitcode(status), False
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                kill_child(pid)
+                _, status = os.waitpid(pid, 0)
+                return os.waitstatus_to_exitcode(status), True
+            poll_interval = remaining if pidfd is not None else min(remaining, 0.001)
+            readable, _, _ = select.select(watched, [], [], poll_interval)
+            if sock in readable and not killed:
+                sock.recv(MAX_MESSAGE)
+                kill_child(pid)
+                killed = True
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def main(sock_fd: int):
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    sock = socket.socket(fileno=sock_fd)
+    while True:
+        request, fds = recv_request(sock)
+        if request is None:
+            return
+        stdout_fd, stderr_fd, cwd_fd = fds
+        pid = os.fork()
+        if pid == 0:
+            sock.close()
+            run_child(request, stdout_fd, stderr_fd, cwd_fd)
+        # Set in both processes so the group exists before killpg can run
+        with contextlib.suppress(OSError):
+            os.setpgid(pid, pid)
+        for fd in fds:
+            os.close(fd)
+        returncode, timed_out = wait_child(pid, request["timeout"], sock)
+        reply = {"returncode": returncode, "timed_out": timed_out}
+        sock.sendall(json.dumps(reply).encode() + b"\n")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]))
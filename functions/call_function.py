@@ -1,20 +1,195 @@
-from google.genai import types
+from __future__ import annotations
 
-from .get_file_content import get_file_content
-from .get_files_info import get_files_info
-from .run_python import run_python_file
-from .write_file import write_file
+import importlib
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 
+from .lazy_import import lazy_import
+
+if TYPE_CHECKING:
+    from agent.telemetry import SessionTelemetry
+
+    from .prefetch import Prefetcher
+
+types = lazy_import("google.genai.types")
+
+# The module each function is defined in, imported the first time it is called
 all_functions = {
-    "get_file_content": get_file_content,
-    "get_files_info": get_files_info,
-    "run_python_file": run_python_file,
-    "write_file": write_file,
+    "edit_file": ".edit_file",
+    "get_file_content": ".get_file_content",
+    "get_files_info": ".get_files_info",
+    "run_python_file": ".run_python",
+    "run_python_file_batch": ".run_python",
+    "search_files": ".search_files",
+    "write_file": ".write_file",
 }
 
+# The directory the model's function calls are confined to
+WORKING_DIRECTORY = "./calculator"
+
+READ_ONLY_FUNCTIONS = {"get_files_info", "get_file_content", "search_files"}
+WRITE_FUNCTIONS = {"write_file", "edit_file"}
+
+
+class ToolResultCache:
+    """Per-session memo of read-only function results.
+
+    Entries are keyed on the function name, the normalized path it was called on and
+    any other arguments. Each entry remembers the `(st_mtime_ns, st_size, st_ino)` of
+    that path when it was computed and is only served while the path still matches.
+    A directory's own stat does not change when a file inside it is rewritten in
+    place, so `call_function` also drops the affected entries after a file is
+    written and drops every directory listing after `run_python_file`.
+
+    A `Prefetcher` attached to the cache fills it with the results of likely next
+    calls and is told which of them were served.
+    """
+
+    def __init__(self):
+        self._entries: dict[tuple, tuple[tuple[int, int, int], str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prefetcher: Prefetcher | None = None
+
+    @staticmethod
+    def normalize_path(working_directory: str, path: str | None) -> str:
+        return os.path.normpath(
+            os.path.join(working_directory, (path or ".").strip("/"))
+        )
+
+    @staticmethod
+    def _signature(path: str) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _key(self, function_name: str, args: dict) -> tuple[tuple, str]:
+        path = self.normalize_path(
+            args["working_directory"], args.get("file_path", args.get("directory"))
+        )
+        other_args = tuple(
+            sorted(
+                (name, json.dumps(value, sort_keys=True))
+                for name, value in args.items()
+                if name not in ("working_directory", "file_path", "directory")
+            )
+        )
+        return (function_name, path, other_args), path
+
+    @staticmethod
+    def cacheable(function_name: str, args: dict) -> bool:
+        # The stat of the top directory says nothing about changes further down.
+        # Searches have their own index that is kept up to date instead.
+        if function_name == "search_files":
+            return False
+        if function_name == "get_files_info":
+            max_depth = args.get("max_depth")
+            return not args.get("recursive") and (max_depth is None or max_depth <= 1)
+        return True
+
+    def call(self, func, function_name: str, args: dict) -> str:
+        """Return the cached result of `func(**args)`, computing it on a miss."""
+        if not self.cacheable(function_name, args):
+            return func(**args)
+        key, path = self._key(function_name, args)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if signature is not None and entry is not None and entry[0] == signature:
+                self.hits += 1
+                if self.prefetcher is not None:
+                    self.prefetcher.record_hit(key)
+                return entry[1]
+            self.misses += 1
+
+        result = func(**args)
+        if signature is not None and not result.startswith("Error"):
+            with self._lock:
+                self._put(key, (signature, result))
+        return result
+
+    def prefill(self, func, function_name: str, args: dict) -> tuple[tuple, str] | None:
+        """Compute and store `func(**args)` ahead of a call that may come.
+
+        Returns the key and the result if they were stored, or None if the entry was
+        already there or the result was an error.
+        """
+        key, path = self._key(function_name, args)
+        signature = self._signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if signature is None or (entry is not None and entry[0] == signature):
+                return None
+
+        result = func(**args)
+        if result.startswith("Error"):
+            return None
+        with self._lock:
+            # A call may have stored the entry meanwhile
+            if key in self._entries:
+                return None
+            self._entries[key] = (signature, result)
+        return key, result
+
+    def _put(self, key: tuple, entry: tuple[tuple[int, int, int], str]):
+        if self.prefetcher is not None and key in self._entries:
+            self.prefetcher.record_drop(key)
+        self._entries[key] = entry
+
+    def _drop(self, key: tuple):
+        if self.prefetcher is not None:
+            self.prefetcher.record_drop(key)
+        del self._entries[key]
+
+    def invalidate(self, working_directory: str, file_path: str | None):
+        """Drop the entries for a path that was written to and the listings of the
+        directories above it."""
+        path = self.normalize_path(working_directory, file_path)
+        with self._lock:
+            for key in list(self._entries):
+                name, cached_path, _ = key
+                if cached_path == path or (
+                    name == "get_files_info"
+                    and path.startswith(cached_path.rstrip(os.sep) + os.sep)
+                ):
+                    self._drop(key)
+
+    def invalidate_listings(self):
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == "get_files_info":
+                    self._drop(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def get_function(function_name: str) -> Callable[..., str] | None:
+    """Return the function the model may call by `function_name`, if there is one."""
+    module_name = all_functions.get(function_name)
+    if module_name is None:
+        return None
+    return getattr(importlib.import_module(module_name, __package__), function_name)
+
 
 def call_function(
-    function_call_part: types.FunctionCall, verbose: bool = False
+    function_call_part: types.FunctionCall,
+    verbose: bool = False,
+    cache: ToolResultCache | None = None,
+    telemetry: SessionTelemetry | None = None,
+    working_directory: str = WORKING_DIRECTORY,
 ) -> types.Content:
     if verbose:
         print(f"Calling function: {function_call_part.name}({function_call_part.args})")
@@ -22,7 +197,7 @@ def call_function(
         print(f" - Calling function: {function_call_part.name}")
 
     function_name = function_call_part.name
-    func = all_functions.get(function_name)
+    func = get_function(function_name)
     if func is None:
         return types.Content(
             role="tool",
@@ -34,8 +209,38 @@ def call_function(
             ],
         )
 
-    function_call_part.args.update({"working_directory": "./calculator"})
-    function_result = func(**function_call_part.args)
+    function_call_part.args.update({"working_directory": working_directory})
+    args = function_call_part.args
+    start = time.perf_counter()
+    if cache is not None and function_name in READ_ONLY_FUNCTIONS:
+        function_result = cache.call(func, function_name, args)
+        prefetcher = cache.prefetcher
+        if (
+            prefetcher is not None
+            and function_name == "get_files_info"
+            and not function_result.startswith("Error")
+        ):
+            prefetcher.after_listing(args["working_directory"], args.get("directory"))
+    else:
+        function_result = func(**args)
+        is_write = function_name in WRITE_FUNCTIONS
+        if is_write and not function_result.startswith("Error"):
+            from .search_index import notify_write
+
+            notify_write(args["working_directory"], args["file_path"])
+        if not is_write:
+            # A script may have written anywhere, in place
+            from .search_index import notify_run
+
+            notify_run(args["working_directory"])
+        if cache is not None and is_write:
+            cache.invalidate(args["working_directory"], args.get("file_path"))
+        elif cache is not None:
+            cache.invalidate_listings()
+    if telemetry is not None:
+        telemetry.record_tool_call(
+            function_name, time.perf_counter() - start, len(function_result.encode())
+        )
     return types.Content(
         role="tool",
         parts=[
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+from .call_function import (
+    READ_ONLY_FUNCTIONS,
+    WORKING_DIRECTORY,
+    ToolResultCache,
+    call_function,
+)
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+    from agent.telemetry import SessionTelemetry
+
+EXEC_FUNCTIONS = {"run_python_file", "run_python_file_batch"}
+DEFAULT_MAX_WORKERS = 8
+
+
+def _normalize(path: str | None) -> str:
+    if not path:
+        return "."
+    return os.path.normpath(path.strip("/"))
+
+
+def _overlaps(a: str, b: str) -> bool:
+    if a == "." or b == ".":
+        return True
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+
+def call_footprint(function_call_part: types.FunctionCall) -> tuple[str, str]:
+    """Return the path a function call touches and how it touches it.
+
+    Reads touch the file or directory they name and writes touch the file they write
+    to. Executions touch the directory containing the script, as the script is free to
+    import anything next to it.
+
+    Parameters
+    ----------
+    function_call_part: types.FunctionCall
+        The function call requested by the model
+
+    Returns
+    -------
+    tuple[str, str]
+        The normalized path relative to the working directory and the kind of access:
+        one of "read", "write" or "exec".
+    """
+    args = function_call_part.args or {}
+    path = args.get("file_path", args.get("directory"))
+    if function_call_part.name in READ_ONLY_FUNCTIONS:
+        return _normalize(path), "read"
+    if function_call_part.name in EXEC_FUNCTIONS:
+        return _normalize(os.path.dirname(_normalize(path))), "exec"
+    return _normalize(path), "write"
+
+
+def _conflicts(kind: str, path: str, prev_kind: str, prev_path: str) -> bool:
+    # Reads only need ordering against writes; they can run alongside executions
+    if "read" in (kind, prev_kind) and "write" not in (kind, prev_kind):
+        return False
+    return _overlaps(path, prev_path)
+
+
+class ToolDispatcher:
+    """Run the function calls from a model turn on a thread pool.
+
+    Read-only calls run in parallel with each other and with executions. Writes and
+    executions wait for every earlier write or execution whose footprint overlaps
+    their own, and reads and writes to overlapping paths keep their original order.
+    Calls are submitted in the order the model made them, so dependencies always point
+    at calls that were queued earlier and a bounded pool cannot deadlock.
+    """
+
+    def __init__(
+        self,
+        verbose: bool = False,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        cache: ToolResultCache | None = None,
+        telemetry: SessionTelemetry | None = None,
+        working_directory: str = WORKING_DIRECTORY,
+    ):
+        self.verbose = verbose
+        self.working_directory = working_directory
+        self.cache = cache
+        self.telemetry = telemetry
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool"
+        )
+        self._submitted: list[tuple[str, str, Future]] = []
+
+    def submit(self, function_call_part: types.FunctionCall) -> Future:
+        path, kind = call_footprint(function_call_part)
+        deps = [
+            fut
+            for prev_path, prev_kind, fut in self._submitted
+            if _conflicts(kind, path, prev_kind, prev_path)
+        ]
+        future = self._executor.submit(self._run, function_call_part, deps)
+        self._submitted.append((path, kind, future))
+        return future
+
+    def _run(self, function_call_part: types.FunctionCall, deps: list[Future]):
+        wait(deps)
+        return call_function(
+            function_call_part,
+            self.verbose,
+            self.cache,
+            self.telemetry,
+            self.working_directory,
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._submitted.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def call_functions_concurrently(
+    function_calls: list[types.FunctionCall],
+    verbose: bool = False,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    cache: ToolResultCache | None = None,
+    telemetry: SessionTelemetry | None = None,
+    working_directory: str = WORKING_DIRECTORY,
+) -> list[types.Content]:
+    """Run the function calls from a single model turn concurrently.
+
+    Parameters
+    ----------
+    function_calls: list[types.FunctionCall]
+        The function calls requested by the model, in the order they were made
+    verbose: bool
+        Whether to print the arguments of each call. Default: False
+    max_workers: int
+        Maximum number of calls that run at the same time. Default: 8
+    cache: ToolResultCache | None
+        Cache for the results of read-only calls. Default: None
+    telemetry: SessionTelemetry | None
+        Records the latency of each call. Default: None
+    working_directory: str
+        The directory the calls are confined to. Default: "./calculator"
+
+    Returns
+    -------
+    list[types.Content]
+        The results of the function calls, in the same order as `function_calls`
+    """
+    with ToolDispatcher(
+        verbose, max_workers, cache, telemetry, working_directory
+    ) as dispatcher:
+        futures = [dispatcher.submit(fc) for fc in function_calls]
+        return [fut.result() for fut in futures]
@@ -0,0 +1,168 @@
+import os
+import re
+import stat
+
+from .workspace import get_workspace
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(Exception):
+    pass
+
+
+def apply_replacements(text: str, edits: list[dict]) -> str:
+    """Apply search/replace blocks to `text` in order.
+
+    Every `search` string must occur exactly once in the text as it is when its edit
+    is applied, so an edit can never land in the wrong place.
+    """
+    for number, edit in enumerate(edits, 1):
+        search = edit.get("search", "")
+        replace = edit.get("replace", "")
+        if not search:
+            raise PatchError(f"edit {number} has an empty search text")
+        count = text.count(search)
+        if count == 0:
+            raise PatchError(f"the search text of edit {number} was not found")
+        if count > 1:
+            raise PatchError(
+                f"the search text of edit {number} matches {count} times; include "
+                "more surrounding lines to make it unique"
+            )
+        text = text.replace(search, replace, 1)
+    return text
+
+
+def _parse_hunks(diff: str) -> list[tuple[int, list[str], list[str]]]:
+    hunks: list[tuple[int, list[str], list[str]]] = []
+    for line in diff.rstrip("\n").splitlines():
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunks.append((int(header.group(1)), [], []))
+            continue
+        if not hunks or line.startswith("\\"):
+            # File headers before the first hunk, "\ No newline at end of file"
+            continue
+        _, old, new = hunks[-1]
+        tag, body = line[:1], line[1:]
+        if tag in (" ", ""):
+            old.append(body)
+            new.append(body)
+        elif tag == "-":
+            old.append(body)
+        elif tag == "+":
+            new.append(body)
+        else:
+            raise PatchError(f"unexpected line in diff: {line!r}")
+    if not hunks:
+        raise PatchError("the diff contains no hunks")
+    return hunks
+
+
+def apply_unified_diff(text: str, diff: str) -> str:
+    """Apply the hunks of a unified diff to `text`.
+
+    Line numbers in hunk headers are only used as a hint: each hunk is applied where
+    its context and removed lines match, at the position closest to the one the
+    header names, taking earlier hunks into account.
+    """
+    lines = text.split("\n")
+    shift = 0
+    for number, (start, old, new) in enumerate(_parse_hunks(diff), 1):
+        expected = max(start - 1 + shift, 0)
+        if not old:
+            # Pure insertion; a start of 0 means "before the first line"
+            position = min(start + shift, len(lines)) if start else 0
+        else:
+            candidates = [
+                i
+                for i in range(len(lines) - len(old) + 1)
+                if lines[i : i + len(old)] == old
+            ]
+            if not candidates:
+                raise PatchError(f"hunk {number} does not match the file")
+            position = min(candidates, key=lambda i: abs(i - expected))
+        lines[position : position + len(old)] = new
+        shift += len(new) - len(old)
+    return "\n".join(lines)
+
+
+def edit_file(
+    working_directory: str,
+    file_path: str,
+    edits: list[dict] | None = None,
+    diff: str | None = None,
+    fsync: bool = False,
+) -> str:
+    """Apply targeted edits to an existing file.
+
+    Assumes that `file_path` is within the `working_directory`. The changes are given
+    either as search/replace blocks or as a unified diff, so only the changed lines
+    have to be sent instead of the whole file. All changes are applied in memory and
+    the file is then replaced atomically; if any of them fails to apply, the file is
+    left untouched.
+
+    Parameters
+    ----------
+    working_directory: str
+        The path to the working directory
+    file_path: str
+        Path to a file inside the working directory
+    edits: list[dict] | None
+        Search/replace blocks, each a dict with a "search" text that must occur
+        exactly once in the file and the "replace" text to put in its place.
+        Default: None
+    diff: str | None
+        A unified diff of the file, as produced by `diff -u`. Default: None
+    fsync: bool
+        Whether to flush the new contents to disk before returning. Default: False
+
+    Returns
+    -------
+    str
+        The following strings will be returned depending on whether any errors were
+        encountered:
+
+        - An error message indicating that the file is outside of the working directory
+        - An error message indicating that the file is actually not a file
+        - An error message indicating that the edits could not be applied
+        - An error message indicating that a problem occurred when writing to the file
+        - On success, a message indicating a successful edit as well as the size of
+          the file afterwards
+    """
+    workspace = get_workspace(working_directory)
+    rel_path = workspace.relative(file_path)
+
+    # Check if file path is outside of working directory
+    if rel_path is None:
+        return f'Error: Cannot edit "{file_path}" as it is outside the permitted working directory'
+
+    # Check if file path is not a file
+    try:
+        fd = workspace.open(rel_path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return f'Error: File not found or is not a regular file: "{file_path}"'
+    with open(fd, newline="") as fp:
+        if not stat.S_ISREG(os.fstat(fp.fileno()).st_mode):
+            return f'Error: File not found or is not a regular file: "{file_path}"'
+
+        if (edits is None) == (diff is None):
+            return "Error: Provide either edits or diff, but not both"
+
+        try:
+            original = fp.read()
+            if edits is not None:
+                content = apply_replacements(original, edits)
+            else:
+                content = apply_unified_diff(original, diff)
+        except PatchError as e:
+            return f'Error: Could not edit "{file_path}": {e}. The file was not changed'
+        except Exception as e:
+            return f'Error: Could not read file "{file_path}": {e}'
+
+    try:
+        workspace.atomic_write(rel_path, content, fsync)
+    except Exception as e:
+        return f'Error: Could not write to "{file_path}": {e}'
+    return f'Successfully edited "{file_path}" (file is now {len(content)} characters)'
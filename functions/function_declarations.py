@@ -2,14 +2,36 @@ from google.genai import types
 
 schema_get_files_info = types.FunctionDeclaration(
     name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory",
+    description="Lists files in the specified directory along with their sizes, constrained to the working directory. Can list subdirectories recursively and filter entries with glob patterns.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
             "directory": types.Schema(
                 type=types.Type.STRING,
                 description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-            )
+            ),
+            "recursive": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Optionally list the contents of all subdirectories as well, so a whole tree can be surveyed in one call",
+            ),
+            "max_depth": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional number of directory levels to list, where 1 only lists the directory itself. Implies recursive.",
+            ),
+            "include": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                description="Optional glob patterns (e.g. '*.py'); only matching entries are listed",
+            ),
+            "exclude": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                description="Optional glob patterns of entries to leave out, including the contents of matching directories",
+            ),
+            "cursor": types.Schema(
+                type=types.Type.STRING,
+                description="The cursor from the end of a truncated listing, to continue where it stopped",
+            ),
         },
     ),
 )
@@ -17,14 +39,30 @@ schema_get_files_info = types.FunctionDeclaration(
 
 schema_get_file_content = types.FunctionDeclaration(
     name="get_file_content",
-    description="Return the contents of the specified file, constrained to the working directory",
+    description="Return the contents of the specified file, or a byte or line range of it, constrained to the working directory. Results longer than 10000 characters are truncated and end with the offset to continue from.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
             "file_path": types.Schema(
                 type=types.Type.STRING,
                 description="The path to the file whose content we wish to retrieve, relative to the working directory",
-            )
+            ),
+            "offset": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional byte offset to start reading from. Use the offset given at the end of a truncated result to continue reading.",
+            ),
+            "length": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional maximum number of bytes to return (at most 10000)",
+            ),
+            "start_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional first line to return, starting at 1. Takes precedence over offset.",
+            ),
+            "end_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional last line to return (inclusive)",
+            ),
         },
     ),
 )
@@ -49,6 +87,44 @@ schema_write_file = types.FunctionDeclaration(
 )
 
 
+schema_edit_file = types.FunctionDeclaration(
+    name="edit_file",
+    description="Changes part of an existing file, constrained to the working directory. Prefer this over write_file for changes to existing files, as only the changed lines need to be sent. Provide either edits or diff. If any change does not apply, the file is left unchanged.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The path to the file that is to be edited, relative to the working directory.",
+            ),
+            "edits": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "search": types.Schema(
+                            type=types.Type.STRING,
+                            description="Exact text to replace, including whitespace. It must occur exactly once in the file, so include enough surrounding lines to make it unique.",
+                        ),
+                        "replace": types.Schema(
+                            type=types.Type.STRING,
+                            description="The text to put in its place",
+                        ),
+                    },
+                    required=["search", "replace"],
+                ),
+                description="Search/replace blocks, applied in order",
+            ),
+            "diff": types.Schema(
+                type=types.Type.STRING,
+                description="A unified diff of the file with @@ hunk headers, as produced by 'diff -u'",
+            ),
+        },
+        required=["file_path"],
+    ),
+)
+
+
 schema_run_python_file = types.FunctionDeclaration(
     name="run_python_file",
     description="Run the specified python file, constrained to the working directory",
@@ -58,7 +134,75 @@ schema_run_python_file = types.FunctionDeclaration(
             "file_path": types.Schema(
                 type=types.Type.STRING,
                 description="The path to the file that is to be executed, relative to the working directory",
-            )
+            ),
+            "args": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                description="Optional command line arguments to pass to the file",
+            ),
+        },
+    ),
+)
+
+
+schema_run_python_file_batch = types.FunctionDeclaration(
+    name="run_python_file_batch",
+    description="Run the specified python file once for each list of arguments, in parallel, constrained to the working directory. Prefer this over several run_python_file calls when checking many inputs.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The path to the file that is to be executed, relative to the working directory",
+            ),
+            "args_list": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(
+                    type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)
+                ),
+                description="One list of command line arguments per run. Results are returned in the same order.",
+            ),
+            "max_parallel": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional limit on the number of runs executed at the same time",
+            ),
+        },
+    ),
+)
+
+
+schema_search_files = types.FunctionDeclaration(
+    name="search_files",
+    description="Searches the files in the specified directory for lines matching a regular expression or plain text and returns the matching lines with some surrounding context, constrained to the working directory. Use this to find where something is defined or used instead of reading files one by one.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "pattern": types.Schema(
+                type=types.Type.STRING,
+                description="The regular expression (Python syntax) or, if literal is set, the plain text to search for",
+            ),
+            "directory": types.Schema(
+                type=types.Type.STRING,
+                description="The directory to search in, relative to the working directory. If not provided, searches the whole working directory.",
+            ),
+            "literal": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Optionally treat the pattern as plain text instead of a regular expression",
+            ),
+            "ignore_case": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Optionally match regardless of case",
+            ),
+            "include": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(type=types.Type.STRING),
+                description="Optional glob patterns (e.g. '*.py'); only matching files are searched",
+            ),
+            "context_lines": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional number of lines to show before and after each match. Defaults to 2.",
+            ),
         },
+        required=["pattern"],
     ),
 )
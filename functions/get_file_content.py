@@ -1,16 +1,79 @@
-from pathlib import Path
+import mmap
+import os
+import stat
 
-from .file_path_utils import is_file_outside_workdir
+from .workspace import get_workspace
 
 MAX_CONTENT_LENGTH = 10000
 
 
-def get_file_content(working_directory: str, file_path: str) -> str:
+def _is_continuation_byte(byte: int) -> bool:
+    return byte & 0b1100_0000 == 0b1000_0000
+
+
+def _trim_partial_utf8(data: bytes) -> bytes:
+    """Drop a UTF-8 sequence that was cut off at the end of `data`."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if _is_continuation_byte(byte):
+            continue
+        if byte >= 0b1111_0000:
+            needed = 4
+        elif byte >= 0b1110_0000:
+            needed = 3
+        elif byte >= 0b1100_0000:
+            needed = 2
+        else:
+            needed = 1
+        return data if needed <= back else data[:-back]
+    return data
+
+
+def _line_offsets(
+    fd: int, size: int, start_line: int, end_line: int | None, limit: int
+) -> tuple[int, int, bool]:
+    """Return the byte range covering lines `start_line` to `end_line` (1-based,
+    inclusive) and whether the whole range fits in `limit` bytes.
+
+    The file is scanned through a memory map only as far as the range needs.
+    """
+    if size == 0:
+        return 0, 0, True
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        for _ in range(start_line - 1):
+            newline = mm.find(b"\n", start)
+            if newline == -1 or newline + 1 == size:
+                raise ValueError(f"start_line {start_line} is past the end of the file")
+            start = newline + 1
+
+        stop = min(size, start + limit)
+        if end_line is None:
+            return start, stop, stop == size
+
+        end = start
+        for _ in range(end_line - start_line + 1):
+            newline = mm.find(b"\n", end, stop)
+            if newline == -1:
+                return start, stop, stop == size
+            end = newline + 1
+        return start, end, True
+
+
+def get_file_content(
+    working_directory: str,
+    file_path: str,
+    offset: int | None = None,
+    length: int | None = None,
+    start_line: int | None = None,
+    end_line: int | None = None,
+) -> str:
     """Return the contents of the specified file.
 
     Assumes that `file_path` is within the `working_directory`. Any returned file
     content is limited to 10000 characters in order to avoid running into API usage
-    limits.
+    limits. Only the requested range of the file is read from disk. When the content
+    is cut short, the returned string ends with the offset to continue reading from.
 
     Parameters
     ----------
@@ -18,6 +81,14 @@ def get_file_content(working_directory: str, file_path: str) -> str:
         The path to the working directory
     file_path: str
         Path to a file inside the working directory
+    offset: int | None
+        Byte offset to start reading from. Default: None (start of the file)
+    length: int | None
+        Maximum number of bytes to return, capped at 10000. Default: None
+    start_line: int | None
+        First line to return (1-based). Takes precedence over `offset`. Default: None
+    end_line: int | None
+        Last line to return (inclusive). Default: None (read up to `length` bytes)
 
     Returns
     -------
@@ -27,25 +98,72 @@ def get_file_content(working_directory: str, file_path: str) -> str:
 
         - An error message indicating that the file is outside of the working directory
         - An error message indicating that the file is actually not a file
+        - An error message indicating that the requested range is invalid
         - An error message indicating that a problem occurred when reading from the file
-        - On success, the contents of the file truncated at 10000 characters
+        - On success, the requested contents of the file truncated at 10000
+          characters
     """
-    final_path = Path(working_directory).joinpath(file_path.strip("/"))
+    workspace = get_workspace(working_directory)
+    rel_path = workspace.relative(file_path)
 
     # Check if file_path is outside of working_directory
-    if is_file_outside_workdir(working_directory, file_path):
+    if rel_path is None:
         return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
 
+    offset = int(offset or 0)
+    length = min(int(length or MAX_CONTENT_LENGTH), MAX_CONTENT_LENGTH)
+    start_line = None if start_line is None else int(start_line)
+    end_line = None if end_line is None else int(end_line)
+    if offset < 0 or length <= 0:
+        return "Error: offset must not be negative and length must be positive"
+    if start_line is not None and start_line < 1:
+        return "Error: start_line must be 1 or greater"
+    if end_line is not None and end_line < (start_line or 1):
+        return "Error: end_line must not be smaller than start_line"
+
     # Check if file path is not a file
-    if not final_path.is_file():
+    try:
+        fd = workspace.open(rel_path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
         return f'Error: File not found or is not a regular file: "{file_path}"'
 
-    # Read file and return contents as string
+    # Read the requested range and return it as a string
     try:
-        with open(final_path) as fp:
-            file_content = fp.read()
-        if len(file_content) > MAX_CONTENT_LENGTH:
-            file_content = f'{file_content[:MAX_CONTENT_LENGTH]}...File "{file_path}" truncated at {MAX_CONTENT_LENGTH} characters'
+        with open(fd, "rb") as fp:
+            st = os.fstat(fp.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                return f'Error: File not found or is not a regular file: "{file_path}"'
+            size = st.st_size
+            if start_line is not None or end_line is not None:
+                try:
+                    start, end, complete = _line_offsets(
+                        fp.fileno(), size, start_line or 1, end_line, length
+                    )
+                except ValueError as e:
+                    return f"Error: {e}"
+            else:
+                start, end = min(offset, size), min(size, offset + length)
+                complete = end == size
+            fp.seek(start)
+            data = fp.read(end - start)
+
+        # Skip the rest of a character the offset may have landed in
+        skipped = 0
+        while skipped < min(3, len(data)) and _is_continuation_byte(data[skipped]):
+            skipped += 1
+        start += skipped
+        data = data[skipped:]
+        if not complete:
+            data = _trim_partial_utf8(data)
+        end = start + len(data)
+        file_content = data.decode()
+
+        if not complete:
+            file_content = (
+                f'{file_content}...File "{file_path}" truncated at {len(file_content)} '
+                f"characters (bytes {start}-{end} of {size}). "
+                f"Call get_file_content with offset={end} to continue reading"
+            )
         return file_content
     except Exception as e:
         return f'Error: Could not read file "{file_path}": {e}'
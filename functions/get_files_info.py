@@ -1,15 +1,81 @@
-from pathlib import Path
+import os
+from collections.abc import Iterator
+from fnmatch import fnmatch
 
-from .file_path_utils import is_file_outside_workdir
+from .workspace import get_workspace
 
+IGNORED_NAMES = {".git", "__pycache__"}
+DEFAULT_PAGE_SIZE = 200
 
-def get_files_info(working_directory: str, directory: str = None) -> str:
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+def _matches(parts: tuple[str, ...], patterns: list[str]) -> bool:
+    rel_path = "/".join(parts)
+    return any(fnmatch(rel_path, p) or fnmatch(parts[-1], p) for p in patterns)
+
+
+def _walk(
+    dir_fd: int,
+    parts: tuple[str, ...],
+    depth: int,
+    max_depth: int | None,
+    exclude: list[str],
+    after: tuple[str, ...],
+) -> Iterator[tuple[tuple[str, ...], os.DirEntry]]:
+    """Yield the entries below the open directory `dir_fd` depth first, in name
+    order, without following symbolic links.
+
+    Entries up to and including `after` are skipped, and directories that lie
+    entirely before it are not even opened.
+    """
+    with os.scandir(dir_fd) as it:
+        entries = sorted(it, key=lambda entry: entry.name)
+
+    for entry in entries:
+        entry_parts = (*parts, entry.name)
+        if entry.name in IGNORED_NAMES or _matches(entry_parts, exclude):
+            continue
+        is_ancestor_of_after = entry_parts == after[: len(entry_parts)]
+        if entry_parts < after and not is_ancestor_of_after:
+            continue
+        if entry_parts > after:
+            yield entry_parts, entry
+        if (
+            (max_depth is None or depth < max_depth)
+            and entry.is_dir(follow_symlinks=False)
+            and (entry_parts > after or is_ancestor_of_after)
+        ):
+            try:
+                fd = os.open(entry.name, _DIR_FLAGS, dir_fd=dir_fd)
+            except OSError:
+                # Removed or replaced since it was listed
+                continue
+            try:
+                yield from _walk(fd, entry_parts, depth + 1, max_depth, exclude, after)
+            finally:
+                os.close(fd)
+
+
+def get_files_info(
+    working_directory: str,
+    directory: str | None = None,
+    recursive: bool = False,
+    max_depth: int | None = None,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    cursor: str | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE,
+) -> str:
     """Return a list of the objects contained in the specified directory as well as some
     associated info.
 
     Any directory specified by `directory` must be within the current
     `working_directory`. The information about the objects in the specified directory
-    include the size of the object in bytes and whether it is a directory.
+    include the size of the object in bytes and whether it is a directory. Entries are
+    read with `os.scandir`, listed in name order and `.git` and `__pycache__`
+    directories are skipped. Listings longer than `page_size` entries end with a
+    cursor to continue from.
 
     Parameters
     ----------
@@ -18,6 +84,21 @@ def get_files_info(working_directory: str, directory: str = None) -> str:
     directory: str
         The name of a directory in the working directory. If None, will just use
         working_directory. Default: None
+    recursive: bool
+        Whether to also list the contents of subdirectories. Default: False
+    max_depth: int | None
+        How many directory levels to list; 1 lists `directory` only. Implies
+        `recursive`. Default: None (no limit when recursive)
+    include: list[str] | None
+        Glob patterns; only entries whose name or relative path matches one of them
+        are listed. Directories are still searched. Default: None
+    exclude: list[str] | None
+        Glob patterns of entries to leave out, including everything below excluded
+        directories. Default: None
+    cursor: str | None
+        The cursor returned by a previous, truncated listing. Default: None
+    page_size: int
+        Maximum number of entries to return. Default: 200
 
     Returns
     -------
@@ -35,25 +116,50 @@ def get_files_info(working_directory: str, directory: str = None) -> str:
 
         - file_or_directory: file_size=int bytes, is_dir=bool
         - ...
-    """
-    wd_path = Path(working_directory)
-    final_dir = wd_path if directory is None else wd_path.joinpath(directory.strip("/"))
 
-    # Check that directory is actually a directory
-    if not final_dir.is_dir():
-        return f'Error: "{directory}" is not a directory'
+        Nested entries are shown by their path relative to `directory`.
+    """
+    workspace = get_workspace(working_directory)
+    rel_path = workspace.relative(directory or ".")
 
     # Check that directory is in working_directory
-    if is_file_outside_workdir(working_directory, directory):
+    if rel_path is None:
         return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
 
+    if max_depth is not None:
+        max_depth = int(max_depth)
+    elif not recursive:
+        max_depth = 1
+    page_size = max(int(page_size), 1)
+    after = tuple(part for part in (cursor or "").split("/") if part)
+
+    # Check that directory is actually a directory
+    try:
+        dir_fd = workspace.open_dir(rel_path)
+    except OSError:
+        return f'Error: "{directory}" is not a directory'
+
     # Get the contents of the specified directory
     try:
         files_str: list[str] = []
-        for f in final_dir.iterdir():
+        last_parts: tuple[str, ...] = ()
+        for parts, entry in _walk(dir_fd, (), 1, max_depth, exclude or [], after):
+            if include and not _matches(parts, include):
+                continue
+            if len(files_str) == page_size:
+                files_str.append(
+                    f"...Listing truncated after {page_size} entries. Call "
+                    f'get_files_info with cursor="{"/".join(last_parts)}" to continue'
+                )
+                break
+            st = entry.stat(follow_symlinks=False)
             files_str.append(
-                f"- {f.name}: file_size={f.stat().st_size} bytes, is_dir={f.is_dir()}"
+                f"- {'/'.join(parts)}: file_size={st.st_size} bytes, "
+                f"is_dir={entry.is_dir(follow_symlinks=False)}"
             )
+            last_parts = parts
         return "\n".join(files_str)
     except Exception as e:
         return f"Error: {e}"
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,37 @@
+import importlib
+import threading
+from typing import Any
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported when one of its attributes is
+    first used.
+
+    Importing `google.genai` takes the better part of a second, which `--help`,
+    argument errors and the thin client's startup should not have to pay for. Modules
+    that bind the SDK this way must use `from __future__ import annotations`, so that
+    annotations naming SDK types are not evaluated at import time.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded yet"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> Any:
+    """Return a proxy for the module `name` that imports it on first use."""
+    return LazyModule(name)
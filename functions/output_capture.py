@@ -0,0 +1,125 @@
+import os
+import selectors
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+READ_SIZE = 65536
+
+
+@dataclass(frozen=True)
+class OutputLimits:
+    """Limits on the output kept from a process.
+
+    Attributes
+    ----------
+    head_bytes: int
+        Bytes kept from the start of each stream
+    tail_bytes: int
+        Bytes kept from the end of each stream
+    max_bytes: int
+        Total bytes (over both streams) after which the process is killed
+    """
+
+    head_bytes: int = 4096
+    tail_bytes: int = 4096
+    max_bytes: int = 16 * 1024 * 1024
+
+
+class BoundedBuffer:
+    """Keep the first `head_bytes` and the last `tail_bytes` written to a stream and
+    count everything in between."""
+
+    def __init__(self, head_bytes: int, tail_bytes: int):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def feed(self, data: bytes):
+        self.total += len(data)
+        if len(self.head) < self.head_bytes:
+            room = self.head_bytes - len(self.head)
+            self.head += data[:room]
+            data = data[room:]
+        if not data or self.tail_bytes <= 0:
+            return
+        self.tail += data[-self.tail_bytes :]
+        if len(self.tail) > self.tail_bytes:
+            del self.tail[: len(self.tail) - self.tail_bytes]
+
+    @property
+    def dropped(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def getvalue(self) -> bytes:
+        if not self.dropped:
+            return bytes(self.head + self.tail)
+        marker = f"\n...[{self.dropped} bytes omitted]...\n".encode()
+        return bytes(self.head) + marker + bytes(self.tail)
+
+
+@dataclass
+class CapturedOutput:
+    stdout: BoundedBuffer
+    stderr: BoundedBuffer
+    limit_reached: bool = False
+    deadline_reached: bool = False
+
+
+def capture_output(
+    stdout_fd: int,
+    stderr_fd: int,
+    deadline: float,
+    limits: OutputLimits,
+    on_limit: Callable[[], None],
+) -> CapturedOutput:
+    """Read a process's stdout and stderr pipes incrementally into bounded buffers.
+
+    Reading stops once both pipes are closed or `deadline` (a `time.monotonic()`
+    value) has passed. Once more than `limits.max_bytes` have been read, `on_limit` is
+    called once to stop the producer; the pipes are still drained until they close.
+
+    Parameters
+    ----------
+    stdout_fd: int
+        Read end of the process's stdout pipe
+    stderr_fd: int
+        Read end of the process's stderr pipe
+    deadline: float
+        Monotonic time after which reading stops
+    limits: OutputLimits
+        How much output to keep and when to stop the process
+    on_limit: Callable[[], None]
+        Called when the output limit is reached, e.g. to kill the process
+
+    Returns
+    -------
+    CapturedOutput
+        The retained output of both streams and whether a limit was hit
+    """
+    captured = CapturedOutput(
+        BoundedBuffer(limits.head_bytes, limits.tail_bytes),
+        BoundedBuffer(limits.head_bytes, limits.tail_bytes),
+    )
+    buffers = {stdout_fd: captured.stdout, stderr_fd: captured.stderr}
+    with selectors.DefaultSelector() as selector:
+        for fd in buffers:
+            selector.register(fd, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                captured.deadline_reached = True
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                buffers[key.fd].feed(data)
+                total = captured.stdout.total + captured.stderr.total
+                if total > limits.max_bytes and not captured.limit_reached:
+                    captured.limit_reached = True
+                    on_limit()
+    return captured
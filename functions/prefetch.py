@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import os
+import stat
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+from .get_file_content import MAX_CONTENT_LENGTH, get_file_content
+from .get_files_info import IGNORED_NAMES
+from .workspace import get_workspace
+
+if TYPE_CHECKING:
+    from .call_function import ToolResultCache
+
+DEFAULT_BUDGET_BYTES = 1024 * 1024
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_SUFFIXES = (".py",)
+
+
+class Prefetcher:
+    """Reads the source files of a directory that was just listed into a
+    `ToolResultCache` in the background.
+
+    After a listing, the model usually goes on to read the files it was shown, one
+    round trip at a time. With a prefetcher, `call_function` hands every successful
+    `get_files_info` call to `after_listing`, which reads the small files with one of
+    `suffixes` directly in that directory on a thread pool. A later `get_file_content`
+    call for one of them with no other arguments is then served from memory.
+
+    Prefetched results that were not read yet count against `budget_bytes`; files
+    that do not fit are skipped, and the budget frees up as entries are read or
+    dropped. `stats` reports how many prefetched entries were read (the hit ratio)
+    and how many of the prefetched bytes were never read (the waste ratio).
+
+    Parameters
+    ----------
+    cache: ToolResultCache
+        The session's cache, which the prefetcher is attached to
+    max_workers: int
+        Number of threads reading files. Default: 2
+    budget_bytes: int
+        Memory for prefetched results that were not read yet. Default: 1 MiB
+    suffixes: tuple[str, ...]
+        Which files to prefetch. Default: (".py",)
+    """
+
+    def __init__(
+        self,
+        cache: ToolResultCache,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        budget_bytes: int = DEFAULT_BUDGET_BYTES,
+        suffixes: tuple[str, ...] = DEFAULT_SUFFIXES,
+    ):
+        self.cache = cache
+        self.budget_bytes = budget_bytes
+        self.suffixes = suffixes
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+        # Size of each prefetched entry that was not read yet, by cache key
+        self._unread: dict[tuple, int] = {}
+        self._futures: set[Future] = set()
+        self._reserved = 0
+        self._lock = threading.Lock()
+        self.prefetched = 0
+        self.prefetched_bytes = 0
+        self.hits = 0
+        self.dropped = 0
+        self.dropped_bytes = 0
+        self.skipped = 0
+        cache.prefetcher = self
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self.cache.prefetcher = None
+
+    def drain(self):
+        """Wait until everything prefetched so far is in the cache."""
+        while True:
+            with self._lock:
+                futures = list(self._futures)
+            if not futures:
+                return
+            wait(futures)
+
+    def _submit(self, fn, *args):
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def after_listing(self, working_directory: str, directory: str | None):
+        """Start prefetching the files of a directory that was listed."""
+        self._submit(self._prefetch_directory, working_directory, directory)
+
+    def _prefetch_directory(self, working_directory: str, directory: str | None):
+        workspace = get_workspace(working_directory)
+        rel_path = workspace.relative(directory or ".")
+        if rel_path is None:
+            return
+        try:
+            dir_fd = workspace.open_dir(rel_path)
+        except OSError:
+            return
+        try:
+            with os.scandir(dir_fd) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+            for entry in entries:
+                if entry.name in IGNORED_NAMES or not entry.name.endswith(
+                    self.suffixes
+                ):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                # Larger files are returned truncated and read on in pieces
+                if stat.S_ISREG(st.st_mode) and 0 < st.st_size <= MAX_CONTENT_LENGTH:
+                    file_path = os.path.normpath(os.path.join(rel_path, entry.name))
+                    self._submit(
+                        self._prefetch_file, working_directory, file_path, st.st_size
+                    )
+        except (OSError, RuntimeError):
+            # The directory went away, or the prefetcher was closed meanwhile
+            pass
+        finally:
+            os.close(dir_fd)
+
+    def _prefetch_file(self, working_directory: str, file_path: str, size: int):
+        with self._lock:
+            if self._reserved + size > self.budget_bytes:
+                self.skipped += 1
+                return
+            self._reserved += size
+
+        args = {"working_directory": working_directory, "file_path": file_path}
+        stored = self.cache.prefill(get_file_content, "get_file_content", args)
+        with self._lock:
+            self._reserved -= size
+            if stored is None:
+                return
+            key, result = stored
+            size = len(result.encode())
+            self._reserved += size
+            self._unread[key] = size
+            self.prefetched += 1
+            self.prefetched_bytes += size
+
+    def record_hit(self, key: tuple):
+        """Called by the cache when it serves an entry."""
+        with self._lock:
+            size = self._unread.pop(key, None)
+            if size is not None:
+                self._reserved -= size
+                self.hits += 1
+
+    def record_drop(self, key: tuple):
+        """Called by the cache when it drops or replaces an entry."""
+        with self._lock:
+            size = self._unread.pop(key, None)
+            if size is not None:
+                self._reserved -= size
+                self.dropped += 1
+                self.dropped_bytes += size
+
+    def stats(self) -> dict:
+        """Return the prefetch counts and ratios.
+
+        Entries that are still unread count as wasted, so the ratios describe the
+        session so far.
+        """
+        with self._lock:
+            unread_bytes = sum(self._unread.values())
+            wasted_bytes = self.dropped_bytes + unread_bytes
+            return {
+                "prefetched": self.prefetched,
+                "hits": self.hits,
+                "dropped": self.dropped,
+                "skipped": self.skipped,
+                "hit_ratio": self.hits / self.prefetched if self.prefetched else 0.0,
+                "waste_ratio": (
+                    wasted_bytes / self.prefetched_bytes
+                    if self.prefetched_bytes
+                    else 0.0
+                ),
+            }
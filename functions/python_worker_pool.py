@@ -0,0 +1,204 @@
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .output_capture import OutputLimits, capture_output
+
+PYTHON_EXECUTABLE = "python"
+WORKER_SCRIPT = Path(__file__).with_name("_python_worker.py")
+# Extra time given to a worker to report back after the script's own timeout
+REPLY_GRACE_PERIOD = 5
+
+
+def worker_pool_supported() -> bool:
+    return hasattr(os, "fork") and hasattr(socket, "send_fds")
+
+
+@dataclass
+class ExecutionResult:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    timed_out: bool = False
+    output_limit_reached: bool = False
+
+
+class WorkerError(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self):
+        self.sock, worker_sock = socket.socketpair()
+        try:
+            self.proc = subprocess.Popen(
+                [PYTHON_EXECUTABLE, str(WORKER_SCRIPT), str(worker_sock.fileno())],
+                pass_fds=[worker_sock.fileno()],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+            )
+        except BaseException:
+            self.sock.close()
+            raise
+        finally:
+            worker_sock.close()
+        self._reply = b""
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(
+        self, argv: list[str], timeout: float, limits: OutputLimits, cwd_fd: int
+    ) -> ExecutionResult:
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        try:
+            request = {"argv": argv, "timeout": timeout}
+            data = json.dumps(request).encode() + b"\n"
+            socket.send_fds(self.sock, [data], [stdout_w, stderr_w, cwd_fd])
+            os.close(stdout_w)
+            os.close(stderr_w)
+            stdout_w = stderr_w = None
+
+            deadline = time.monotonic() + timeout + REPLY_GRACE_PERIOD
+            captured = capture_output(
+                stdout_r, stderr_r, deadline, limits, on_limit=self._kill_job
+            )
+            reply = self._read_reply(deadline)
+        finally:
+            for fd in (stdout_r, stderr_r, stdout_w, stderr_w):
+                if fd is not None:
+                    os.close(fd)
+
+        return ExecutionResult(
+            reply["returncode"],
+            captured.stdout.getvalue(),
+            captured.stderr.getvalue(),
+            reply["timed_out"],
+            captured.limit_reached,
+        )
+
+    def _kill_job(self):
+        self.sock.sendall(b"kill\n")
+
+    def _read_reply(self, deadline: float) -> dict:
+        while b"\n" not in self._reply:
+            self.sock.settimeout(max(deadline - time.monotonic(), 0.001))
+            try:
+                chunk = self.sock.recv(4096)
+            except TimeoutError:
+                raise WorkerError("Python worker did not respond") from None
+            if not chunk:
+                raise WorkerError("Python worker exited unexpectedly")
+            self._reply += chunk
+        self.sock.settimeout(None)
+        line, self._reply = self._reply.split(b"\n", 1)
+        return json.loads(line)
+
+    def close(self):
+        self.sock.close()
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class PythonWorkerPool:
+    """A pool of warm Python interpreters that run scripts in forked children.
+
+    Each worker imports commonly used standard library modules once at startup. A job
+    is run by forking the worker, so it skips interpreter startup and those imports
+    while still running in a fresh process with its own cwd, argv and output pipes.
+    The script's directory is handed to the worker as a file descriptor, so the
+    child changes into exactly the directory that was opened.
+    Workers that die or fail are replaced on the next job that gets their slot.
+
+    Parameters
+    ----------
+    size: int
+        Number of warm workers, i.e. how many scripts can run at the same time
+    """
+
+    def __init__(self, size: int):
+        if not worker_pool_supported():
+            raise OSError("Warm Python workers need os.fork and socket.send_fds")
+        self.size = size
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(_Worker())
+
+    def run(
+        self,
+        argv: list[str],
+        timeout: float,
+        limits: OutputLimits | None = None,
+        cwd_fd: int | None = None,
+    ) -> ExecutionResult:
+        """Run `python *argv` on a warm worker.
+
+        Parameters
+        ----------
+        argv: list[str]
+            The script path followed by its arguments
+        timeout: float
+            Seconds after which the script is killed
+        limits: OutputLimits | None
+            How much output to keep and when to kill a script for printing too much.
+            Default: None (the defaults of `OutputLimits`)
+        cwd_fd: int | None
+            A file descriptor of the directory to run the script in. Default: None
+            (our own current directory)
+
+        Returns
+        -------
+        ExecutionResult
+            The exit code and captured output of the script
+        """
+        if limits is None:
+            limits = OutputLimits()
+        if cwd_fd is None:
+            cwd_fd = os.open(os.curdir, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+            try:
+                return self.run(argv, timeout, limits, cwd_fd)
+            finally:
+                os.close(cwd_fd)
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker.close()
+                # Should this fail, the dead worker keeps its slot and the next job
+                # tries again
+                worker = _Worker()
+            try:
+                return worker.run(argv, timeout, limits, cwd_fd)
+            except (OSError, WorkerError):
+                # Replaced by the next job that gets it
+                worker.close()
+                raise
+        finally:
+            with self._lock:
+                if self._closed:
+                    worker.close()
+                else:
+                    self._idle.put(worker)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
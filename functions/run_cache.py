@@ -0,0 +1,179 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from .python_worker_pool import PYTHON_EXECUTABLE
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def imported_modules(source: bytes) -> list[tuple[int, str, list[str]]]:
+    """Return the `(level, module, names)` of every import statement in a module.
+
+    `import a.b` gives `(0, "a.b", [])`, and `from ..a import b, c` gives
+    `(2, "a", ["b", "c"])`. Imports inside functions and conditional blocks are
+    included, as they may run too.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    imports = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports += [(0, alias.name, []) for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            names = [alias.name for alias in node.names if alias.name != "*"]
+            imports.append((node.level, node.module or "", names))
+    return imports
+
+
+def _module_files(base: str, parts: list[str]) -> list[str]:
+    """Return the files Python runs to import the module `parts` from `base`: the
+    `__init__.py` of each package on the way and the module itself."""
+    files = []
+    directory = base
+    for i, part in enumerate(parts):
+        path = os.path.join(directory, part)
+        if i == len(parts) - 1 and os.path.isfile(path + ".py"):
+            files.append(path + ".py")
+        elif os.path.isdir(path):
+            init = os.path.join(path, "__init__.py")
+            if os.path.isfile(init):
+                files.append(init)
+        else:
+            break
+        directory = path
+    return files
+
+
+class RunCache:
+    """Results of earlier Python runs, reused while nothing they depend on changed.
+
+    A run is keyed on the Python interpreter, the script's path, the directory it
+    runs in, the command line arguments, and the content hashes of the script and of
+    every local module it imports, found by following its import statements within
+    the script's directory. Writing to any of those files changes the key,
+    while rewriting one with the same content does not. File hashes and imports are
+    only recomputed when a file's `(st_mtime_ns, st_size, st_ino)` changes.
+
+    Only scripts whose output depends on nothing else (no data files, clock,
+    randomness or dynamic imports) should be run with the cache.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._files: dict[str, tuple[tuple[int, int, int], str, list]] = {}
+        self._results: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, path: str) -> tuple[str, list] | None:
+        """Return the content hash and the imports of a file."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            entry = self._files.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1], entry[2]
+        try:
+            with open(path, "rb") as fp:
+                source = fp.read()
+        except OSError:
+            return None
+        digest = hashlib.sha256(source).hexdigest()
+        imports = imported_modules(source)
+        with self._lock:
+            self._files[path] = (signature, digest, imports)
+        return digest, imports
+
+    def closure(self, script: str) -> dict[str, str]:
+        """Return the content hash of the script and of every local module it
+        imports, directly or not, by path relative to the script's directory.
+
+        The imports are resolved again every time, so a module that is created
+        next to the script after a run that could not import it changes the key.
+        """
+        base = os.path.dirname(script)
+        hashes: dict[str, str] = {}
+        pending = [script]
+
+        while pending:
+            path = pending.pop()
+            rel_path = os.path.relpath(path, base)
+            if rel_path in hashes or rel_path.startswith(os.pardir):
+                continue
+            info = self._file(path)
+            if info is None:
+                continue
+            hashes[rel_path], imports = info
+            for level, module, names in imports:
+                if level:
+                    # Relative to the package of the importing module
+                    start = os.path.dirname(path)
+                    for _ in range(level - 1):
+                        start = os.path.dirname(start)
+                else:
+                    start = base
+                parts = module.split(".") if module else []
+                pending += _module_files(start, parts)
+                for name in names:
+                    # `from package import module` may import a submodule
+                    pending += _module_files(start, [*parts, name])
+        return hashes
+
+    @staticmethod
+    def interpreter() -> list:
+        # Its resolved path and stat stand in for the version, which would take
+        # starting it to find out
+        path = shutil.which(PYTHON_EXECUTABLE)
+        if path is None:
+            return [PYTHON_EXECUTABLE]
+        path = os.path.realpath(path)
+        st = os.stat(path)
+        return [path, st.st_mtime_ns, st.st_size]
+
+    def key(self, argv: list[str], cwd: str) -> str:
+        """Return the key of running `argv`, the script's path and its arguments,
+        in the directory `cwd`."""
+        script = os.path.join(cwd, argv[0])
+        data = [
+            self.interpreter(),
+            cwd,
+            argv,
+            sorted(self.closure(script).items()),
+        ]
+        return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: str, result: str):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -1,61 +1,230 @@
+import os
+import stat
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from .file_path_utils import is_file_outside_workdir
+from .output_capture import OutputLimits, capture_output
+from .python_worker_pool import PYTHON_EXECUTABLE, ExecutionResult, PythonWorkerPool
+from .run_cache import RunCache
+from .workspace import Workspace, get_workspace
 
+TIMEOUT = 30
+MAX_BATCH_SIZE = 64
+# Only the start and end of long outputs are returned, and scripts that print more
+# than `max_bytes` in total are killed
+OUTPUT_LIMITS = OutputLimits()
 
-def run_python_file(working_directory: str, file_path: str) -> str:
-    """Execute a python file.
+# Marks a result that was reused instead of running the script again
+CACHED_RESULT_NOTE = (
+    "(Cached: the script, the local modules it imports and the arguments are "
+    "unchanged since an earlier run)\n"
+)
 
-    Parameters
-    ----------
-    working_directory: str
-    file_path: str
+_worker_pool: PythonWorkerPool | None = None
+_run_cache: RunCache | None = None
 
-    Returns
-    -------
-    str
-        On a successful execution, returns a string containing information about the
-        process, specifically:
 
-        - Any output from `stdout`, prefixed by `STDOUT:`
-        - Any output from `stderr`, prefixed by `STDERR:`
+def use_worker_pool(pool: PythonWorkerPool | None):
+    """Run Python files on `pool` instead of starting a new interpreter per call.
 
-        On error, returns an appropriate error message.
+    Pass None to go back to starting a new interpreter for every call.
     """
+    global _worker_pool
+    _worker_pool = pool
 
-    final_path = Path(working_directory).joinpath(file_path)
 
-    # Check if file exists
-    if not final_path.exists():
-        return f'Error: File "{file_path}" not found.'
+def use_run_cache(cache: RunCache | None):
+    """Reuse the results of earlier runs from `cache` while the script, the local
+    modules it imports and its arguments are unchanged.
+
+    Pass None to run every call again.
+    """
+    global _run_cache
+    _run_cache = cache
+
+
+def _execute(argv: list[str], workspace: Workspace) -> ExecutionResult:
+    if _worker_pool is not None:
+        return _worker_pool.run(argv, TIMEOUT, OUTPUT_LIMITS, workspace.fd)
+
+    proc = subprocess.Popen(
+        [PYTHON_EXECUTABLE, *argv],
+        cwd=workspace.cwd_path(),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    with proc:
+        captured = capture_output(
+            proc.stdout.fileno(),
+            proc.stderr.fileno(),
+            time.monotonic() + TIMEOUT,
+            OUTPUT_LIMITS,
+            on_limit=proc.kill,
+        )
+        if captured.deadline_reached:
+            proc.kill()
+        returncode = proc.wait()
+
+    return ExecutionResult(
+        returncode,
+        captured.stdout.getvalue(),
+        captured.stderr.getvalue(),
+        captured.deadline_reached,
+        captured.limit_reached,
+    )
+
+
+def _check_file(
+    working_directory: str, file_path: str
+) -> tuple[Workspace | None, str | None, str | None]:
+    workspace = get_workspace(working_directory)
+    rel_path = workspace.relative(file_path)
 
     # Check if file is in working directory
-    if is_file_outside_workdir(working_directory, file_path):
-        return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
+    if rel_path is None:
+        return (
+            None,
+            None,
+            f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory',
+        )
+
+    # Check if file exists, without following symbolic links out of the workspace
+    try:
+        st = workspace.lstat(rel_path)
+    except OSError:
+        return None, None, f'Error: File "{file_path}" not found.'
 
     # Check if file ends in `.py`
-    if final_path.suffix != ".py":
-        return f'Error: "{file_path}" is not a Python file.'
+    if Path(rel_path).suffix != ".py":
+        return None, None, f'Error: "{file_path}" is not a Python file.'
+    if not stat.S_ISREG(st.st_mode):
+        return (
+            None,
+            None,
+            f'Error: "{file_path}" is a symbolic link or not a regular file.',
+        )
+
+    return workspace, rel_path, None
+
+
+def _run(workspace: Workspace, rel_path: str, file_path: str, args: list | None) -> str:
+    # Scripts run in the working directory, so relative paths they open stay in it
+    argv = [rel_path, *(str(arg) for arg in args or [])]
+    run_cache = _run_cache
+    if run_cache is not None:
+        key = run_cache.key(argv, workspace.root)
+        result = run_cache.get(key)
+        if result is not None:
+            return CACHED_RESULT_NOTE + result
 
-    # Run file
     try:
-        proc_results = subprocess.run(
-            ["python", str(final_path)], capture_output=True, timeout=30, check=True
-        )
+        proc_results = _execute(argv, workspace)
+        if proc_results.timed_out:
+            return f'Error: executing Python file: "{file_path}" timed out after {TIMEOUT} seconds'
 
         results_str = ""
         if proc_results.stderr or proc_results.stdout:
             if proc_results.stdout:
-                results_str += f"STDOUT: {proc_results.stdout.decode()}"
+                results_str += f"STDOUT: {proc_results.stdout.decode(errors='replace')}"
             if proc_results.stderr:
-                results_str += f"STDERR: {proc_results.stderr.decode()}"
+                results_str += f"STDERR: {proc_results.stderr.decode(errors='replace')}"
         else:
             results_str = "No output produced"
 
-        if proc_results.returncode != 0:
+        if proc_results.output_limit_reached:
+            results_str += f"Process killed after printing more than {OUTPUT_LIMITS.max_bytes} bytes "
+        elif proc_results.returncode != 0:
             results_str += f"Process exited with code {proc_results.returncode} "
 
+        if run_cache is not None and not proc_results.output_limit_reached:
+            run_cache.put(key, results_str)
         return results_str
     except Exception as e:
         return f"Error: executing Python file: {e}"
+
+
+def run_python_file(
+    working_directory: str, file_path: str, args: list[str] | None = None
+) -> str:
+    """Execute a python file.
+
+    The script runs with `working_directory` as its current directory.
+
+    Parameters
+    ----------
+    working_directory: str
+    file_path: str
+    args: list[str] | None
+        Command line arguments passed to the script. Default: None
+
+    Returns
+    -------
+    str
+        On a successful execution, returns a string containing information about the
+        process, specifically:
+
+        - Any output from `stdout`, prefixed by `STDOUT:`
+        - Any output from `stderr`, prefixed by `STDERR:`
+
+        On error, returns an appropriate error message.
+    """
+    workspace, rel_path, error = _check_file(working_directory, file_path)
+    if error is not None:
+        return error
+
+    return _run(workspace, rel_path, file_path, args)
+
+
+def run_python_file_batch(
+    working_directory: str,
+    file_path: str,
+    args_list: list[list[str]],
+    max_parallel: int | None = None,
+) -> str:
+    """Execute a python file once for each set of arguments.
+
+    The runs are spread over up to `max_parallel` processes at a time, bounded by the
+    number of CPUs, and their results are returned in the order of `args_list`.
+
+    Parameters
+    ----------
+    working_directory: str
+    file_path: str
+    args_list: list[list[str]]
+        One list of command line arguments per run
+    max_parallel: int | None
+        Maximum number of runs at the same time. Default: the number of CPUs
+
+    Returns
+    -------
+    str
+        The result of each run, in the same format as `run_python_file`, under a
+        `Run <n> (args: [...]):` heading. On error, returns an appropriate error
+        message.
+    """
+    workspace, rel_path, error = _check_file(working_directory, file_path)
+    if error is not None:
+        return error
+
+    if not args_list:
+        return "Error: args_list must contain at least one list of arguments"
+    if len(args_list) > MAX_BATCH_SIZE:
+        return (
+            f"Error: At most {MAX_BATCH_SIZE} runs can be batched, got {len(args_list)}"
+        )
+
+    cpu_count = os.cpu_count() or 1
+    workers = min(len(args_list), max_parallel or cpu_count, cpu_count)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        results = executor.map(
+            lambda args: _run(workspace, rel_path, file_path, args), args_list
+        )
+        return "\n".join(
+            f"Run {i} (args: {[str(arg) for arg in args or []]}):\n{result}"
+            for i, (args, result) in enumerate(
+                zip(args_list, results, strict=True), start=1
+            )
+        )
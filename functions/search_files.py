@@ -0,0 +1,146 @@
+import os
+import re
+from fnmatch import fnmatch
+
+from .search_index import get_index, read_text, required_literals
+from .workspace import get_workspace
+
+MAX_MATCHES = 100
+MAX_LINE_LENGTH = 300
+DEFAULT_CONTEXT_LINES = 2
+
+
+def _format_line(rel_path: str, number: int, line: str, separator: str) -> str:
+    if len(line) > MAX_LINE_LENGTH:
+        line = line[:MAX_LINE_LENGTH] + "..."
+    return f"{rel_path}{separator}{number}{separator} {line}"
+
+
+def search_files(
+    working_directory: str,
+    pattern: str,
+    directory: str | None = None,
+    literal: bool = False,
+    ignore_case: bool = False,
+    include: list[str] | None = None,
+    context_lines: int = DEFAULT_CONTEXT_LINES,
+) -> str:
+    """Search the files in a directory for lines matching a pattern.
+
+    Any directory specified by `directory` must be within the current
+    `working_directory`. Files are looked up in a trigram index of the working
+    directory, which is refreshed from the directories' mtimes before every search, so
+    only files that can contain the literal parts of `pattern` are read. At most 100
+    matching lines are returned.
+
+    Parameters
+    ----------
+    working_directory: str
+        The path to the working directory
+    pattern: str
+        A regular expression, or plain text if `literal` is set
+    directory: str
+        The directory to search in. If None, searches the whole working directory.
+        Default: None
+    literal: bool
+        Whether to treat `pattern` as plain text. Default: False
+    ignore_case: bool
+        Whether to match regardless of case. Default: False
+    include: list[str] | None
+        Glob patterns; only files whose name or relative path matches one of them are
+        searched. Default: None
+    context_lines: int
+        Number of lines to show before and after each match. Default: 2
+
+    Returns
+    -------
+    str
+        On error:
+
+        - A message indicating that the specified directory is outside of the working
+          directory or isn't a directory
+        - A message indicating that the pattern is not a valid regular expression
+
+        On success: the matching lines grouped by file, in the form
+
+        path/to/file.py:12: matching line
+        path/to/file.py-13- context line
+        --
+
+        or a message saying that nothing matched.
+    """
+    workspace = get_workspace(working_directory)
+    rel_dir = workspace.relative(directory or ".")
+
+    # Check that directory is in working_directory
+    if rel_dir is None:
+        return f'Error: Cannot search "{directory}" as it is outside the permitted working directory'
+
+    # Check that directory is actually a directory
+    try:
+        os.close(workspace.open_dir(rel_dir))
+    except OSError:
+        return f'Error: "{directory}" is not a directory'
+
+    try:
+        regex = re.compile(
+            re.escape(pattern) if literal else pattern,
+            re.IGNORECASE if ignore_case else 0,
+        )
+    except re.error as e:
+        return f'Error: Invalid regular expression "{pattern}": {e}'
+    literals = [pattern] if literal else required_literals(pattern)
+    context_lines = max(int(context_lines), 0)
+
+    index = get_index(working_directory)
+    index.refresh(workspace)
+    prefix = "" if rel_dir == os.curdir else rel_dir + os.sep
+
+    blocks: list[str] = []
+    matches = 0
+    for rel_path in index.candidates(literals):
+        if not rel_path.startswith(prefix):
+            continue
+        if include and not any(
+            fnmatch(rel_path, p) or fnmatch(os.path.basename(rel_path), p)
+            for p in include
+        ):
+            continue
+        text = read_text(workspace, rel_path)
+        if text is None:
+            continue
+
+        lines = text.splitlines()
+        found = [n for n, line in enumerate(lines) if regex.search(line)]
+        found = found[: MAX_MATCHES - matches]
+        matches += len(found)
+
+        # Merge the context windows of nearby matches into one block
+        ranges: list[list[int]] = []
+        for number in found:
+            first = max(number - context_lines, 0)
+            last = min(number + context_lines, len(lines) - 1)
+            if ranges and first <= ranges[-1][1] + 1:
+                ranges[-1][1] = last
+            else:
+                ranges.append([first, last])
+        matched = set(found)
+        for first, last in ranges:
+            blocks.append(
+                "\n".join(
+                    _format_line(
+                        rel_path, n + 1, lines[n], ":" if n in matched else "-"
+                    )
+                    for n in range(first, last + 1)
+                )
+            )
+        if matches == MAX_MATCHES:
+            blocks.append(
+                f"...Search stopped after {MAX_MATCHES} matches. Use a more specific "
+                "pattern, directory or include filter to see the rest"
+            )
+            break
+
+    if not blocks:
+        return f'No matches found for "{pattern}"'
+    return "\n--\n".join(blocks)
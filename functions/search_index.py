@@ -0,0 +1,296 @@
+import os
+import stat
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:
+    # Python < 3.11, where these modules are only available under their old names
+    import sre_constants
+    import sre_parse
+
+from .get_files_info import IGNORED_NAMES
+from .workspace import Workspace, get_workspace
+
+# Files larger than this are not indexed or searched
+MAX_INDEXED_FILE_SIZE = 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+def trigrams(text: str) -> set[str]:
+    """Return the set of lowercased three character substrings of `text`."""
+    text = text.lower()
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _literal_runs(parsed, runs: list[str]):
+    run: list[str] = []
+    for op, arg in parsed:
+        if op is sre_constants.LITERAL:
+            run.append(chr(arg))
+            continue
+        if run:
+            runs.append("".join(run))
+            run = []
+        if op is sre_constants.SUBPATTERN:
+            # (group, add_flags, del_flags, pattern); the group itself must match
+            _literal_runs(arg[3], runs)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_count, _, item = arg
+            if min_count >= 1:
+                _literal_runs(item, runs)
+    if run:
+        runs.append("".join(run))
+
+
+def required_literals(pattern: str) -> list[str]:
+    """Return strings that every match of the regular expression `pattern` contains.
+
+    Only plain runs of literal characters that the pattern cannot skip are
+    collected; alternations, character classes and optional parts end a run. An
+    empty list means the pattern gives nothing to narrow a search down with.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except sre_constants.error:
+        return []
+    runs: list[str] = []
+    _literal_runs(parsed, runs)
+    return [run for run in runs if len(run) >= 3]
+
+
+def read_text(workspace: Workspace, rel_path: str) -> str | None:
+    """Return the text of a file of the workspace, or None if it is binary or
+    cannot be read."""
+    try:
+        # Reached through the workspace, so no link on the way is followed
+        fd = workspace.open(rel_path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        with open(fd, "rb") as fp:
+            if not stat.S_ISREG(os.fstat(fp.fileno()).st_mode):
+                return None
+            data = fp.read(MAX_INDEXED_FILE_SIZE + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_INDEXED_FILE_SIZE or b"\0" in data[:BINARY_SNIFF_BYTES]:
+        return None
+    return data.decode(errors="replace")
+
+
+@dataclass
+class _Directory:
+    mtime_ns: int
+    subdirs: set[str] = field(default_factory=set)
+    files: set[str] = field(default_factory=set)
+
+
+class TrigramIndex:
+    """An incremental inverted index from trigrams to the files containing them.
+
+    Every text file under `root` is indexed by the set of its lowercased trigrams, so
+    a search only has to open the files that contain all the trigrams of the literal
+    parts of its pattern.
+
+    `refresh` walks the directories of the tree through the workspace's file
+    descriptors and only lists those whose mtime changed, which is the case when a
+    file in them was created, removed or replaced (the tools write files by renaming
+    a temporary file over them). Files rewritten in place do not change their
+    directory's mtime: `update` re-indexes a single file right after it was written,
+    and `mark_stale` makes the next `refresh` check every file, e.g. after a script
+    ran that could have written anywhere.
+
+    Parameters
+    ----------
+    root: str
+        The directory to index
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+        self._files: dict[str, tuple[tuple[int, int, int], frozenset[str]]] = {}
+        self._postings: dict[str, set[str]] = defaultdict(set)
+        self._dirs: dict[str, _Directory] = {}
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def mark_stale(self):
+        """Have the next `refresh` check the signature of every file."""
+        self._stale = True
+
+    def _remove(self, rel_path: str):
+        _, grams = self._files.pop(rel_path, (None, frozenset()))
+        for gram in grams:
+            posting = self._postings[gram]
+            posting.discard(rel_path)
+            if not posting:
+                del self._postings[gram]
+
+    def _add(self, workspace: Workspace, rel_path: str, st: os.stat_result) -> bool:
+        """(Re)index a file unless its signature is unchanged; return whether it
+        was."""
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        entry = self._files.get(rel_path)
+        if entry is not None and entry[0] == signature:
+            return False
+        self._remove(rel_path)
+        text = read_text(workspace, rel_path)
+        grams = frozenset() if text is None else frozenset(trigrams(text))
+        self._files[rel_path] = (signature, grams)
+        for gram in grams:
+            self._postings[gram].add(rel_path)
+        return True
+
+    def _forget(self, rel_dir: str) -> int:
+        """Drop a directory that is gone, and everything indexed below it."""
+        directory = self._dirs.pop(rel_dir, None)
+        if directory is None:
+            return 0
+        changed = 0
+        for name in directory.files:
+            self._remove(os.path.join(rel_dir, name))
+            changed += 1
+        for name in directory.subdirs:
+            changed += self._forget(os.path.join(rel_dir, name))
+        return changed
+
+    def _refresh_dir(
+        self, workspace: Workspace, dir_fd: int, rel_dir: str, full: bool
+    ) -> int:
+        changed = 0
+        mtime_ns = os.fstat(dir_fd).st_mtime_ns
+        directory = self._dirs.get(rel_dir)
+        if full or directory is None or directory.mtime_ns != mtime_ns:
+            found = _Directory(mtime_ns)
+            with os.scandir(dir_fd) as it:
+                entries = list(it)
+            for entry in entries:
+                if entry.name in IGNORED_NAMES:
+                    continue
+                rel_path = os.path.join(rel_dir, entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        found.subdirs.add(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_size <= MAX_INDEXED_FILE_SIZE:
+                            found.files.add(entry.name)
+                            changed += self._add(workspace, rel_path, st)
+                except OSError:
+                    continue
+            if directory is not None:
+                for name in directory.files - found.files:
+                    self._remove(os.path.join(rel_dir, name))
+                    changed += 1
+                for name in directory.subdirs - found.subdirs:
+                    changed += self._forget(os.path.join(rel_dir, name))
+            self._dirs[rel_dir] = directory = found
+
+        for name in directory.subdirs:
+            sub_dir = os.path.join(rel_dir, name)
+            try:
+                fd = os.open(name, _DIR_FLAGS, dir_fd=dir_fd)
+            except OSError:
+                # Replaced since it was listed; the next refresh lists it again
+                changed += self._forget(sub_dir)
+                continue
+            try:
+                changed += self._refresh_dir(workspace, fd, sub_dir, full)
+            finally:
+                os.close(fd)
+        return changed
+
+    def refresh(self, workspace: Workspace | None = None) -> int:
+        """Bring the index up to date with the files on disk.
+
+        Parameters
+        ----------
+        workspace: Workspace | None
+            The workspace of the indexed directory. Default: None (look it up)
+
+        Returns
+        -------
+        int
+            The number of files that were (re)indexed or removed
+        """
+        workspace = workspace or get_workspace(self.root)
+        with self._lock:
+            full, self._stale = self._stale, False
+            dir_fd = workspace.open_dir(os.curdir)
+            try:
+                return self._refresh_dir(workspace, dir_fd, "", full)
+            finally:
+                os.close(dir_fd)
+
+    def update(self, file_path: str, workspace: Workspace | None = None):
+        """Re-index a single file, e.g. after it was written to."""
+        workspace = workspace or get_workspace(self.root)
+        rel_path = workspace.relative(file_path)
+        if rel_path is None:
+            return
+        with self._lock:
+            self._remove(rel_path)
+            try:
+                st = workspace.lstat(rel_path)
+            except OSError:
+                return
+            if stat.S_ISREG(st.st_mode) and st.st_size <= MAX_INDEXED_FILE_SIZE:
+                self._add(workspace, rel_path, st)
+                rel_dir, name = os.path.split(rel_path)
+                directory = self._dirs.get(rel_dir)
+                if directory is not None:
+                    directory.files.add(name)
+
+    def candidates(self, literals: list[str]) -> list[str]:
+        """Return the indexed files, in path order, that may contain all `literals`."""
+        with self._lock:
+            result = set(self._files)
+            for literal in literals:
+                for gram in trigrams(literal):
+                    result &= self._postings.get(gram, set())
+                    if not result:
+                        return []
+        return sorted(result)
+
+
+_indexes: dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(working_directory: str) -> TrigramIndex:
+    """Return the shared index of a working directory, creating it on first use."""
+    root = os.path.realpath(working_directory)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = TrigramIndex(root)
+    return index
+
+
+def notify_write(working_directory: str, file_path: str):
+    """Update the index of `working_directory`, if there is one, after a write."""
+    with _indexes_lock:
+        index = _indexes.get(os.path.realpath(working_directory))
+    if index is not None:
+        index.update(file_path.strip("/"), get_workspace(working_directory))
+
+
+def notify_run(working_directory: str):
+    """Have the index of `working_directory`, if there is one, check every file
+    again after a script ran that may have written to them."""
+    with _indexes_lock:
+        index = _indexes.get(os.path.realpath(working_directory))
+    if index is not None:
+        index.mark_stale()
+
+
+def drop_index(working_directory: str):
+    """Forget the index of a working directory that is no longer used."""
+    with _indexes_lock:
+        _indexes.pop(os.path.realpath(working_directory), None)
@@ -0,0 +1,220 @@
+import errno
+import os
+import secrets
+import stat
+import threading
+
+# Read once, as os.umask can only be queried by changing it, which is not thread safe
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+
+
+class Workspace:
+    """The directory a session's function calls are confined to.
+
+    The root is resolved with `os.path.realpath` and opened once. Paths given by the
+    model are then checked lexically against the root, without touching the disk, and
+    every file is reached from the root's file descriptor one component at a time
+    with `O_NOFOLLOW`, so a symbolic link can never lead a function call out of the
+    workspace, and the rest of the filesystem is never looked at.
+
+    Parameters
+    ----------
+    root: str
+        The working directory
+    """
+
+    def __init__(self, root: str):
+        self.fd = -1
+        self.root = os.path.realpath(root)
+        self.fd = os.open(self.root, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def __del__(self):
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def relative(self, path: str) -> str | None:
+        """Return `path` relative to the root in normal form ("." for the root
+        itself), or None if it lies outside of the workspace."""
+        if os.path.isabs(path):
+            rel_path = os.path.relpath(path, self.root)
+        else:
+            rel_path = os.path.normpath(path)
+        if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+            return None
+        return rel_path
+
+    def path(self, rel_path: str) -> str:
+        return os.path.join(self.root, rel_path)
+
+    def cwd_path(self) -> str:
+        """Return the path a child process should change to in order to run in the
+        workspace.
+
+        Where the platform has `/proc/self/fd`, the path leads to the root through
+        the file descriptor, as a child process inherits it until it starts the new
+        program, so renaming the root or putting a link in its place cannot move the
+        child elsewhere.
+        """
+        fd_path = f"/proc/self/fd/{self.fd}"
+        return fd_path if os.path.isdir(fd_path) else self.root
+
+    def open_dir(self, rel_path: str) -> int:
+        """Open a directory of the workspace and return its file descriptor."""
+        fd = os.open(os.curdir, _DIR_FLAGS, dir_fd=self.fd)
+        for part in rel_path.split(os.sep):
+            if part in ("", os.curdir):
+                continue
+            try:
+                next_fd = os.open(part, _DIR_FLAGS, dir_fd=fd)
+            except OSError as e:
+                raise self._error(e, rel_path, part, fd) from None
+            finally:
+                os.close(fd)
+            fd = next_fd
+        return fd
+
+    def open(self, rel_path: str, flags: int, mode: int = 0o666) -> int:
+        """Open a file of the workspace with `os.open` flags and return its file
+        descriptor."""
+        parent, name = os.path.split(rel_path)
+        if name in ("", os.curdir):
+            return self.open_dir(rel_path)
+        dir_fd = self.open_dir(parent)
+        try:
+            return os.open(
+                name, flags | os.O_NOFOLLOW | os.O_CLOEXEC, mode, dir_fd=dir_fd
+            )
+        except OSError as e:
+            raise self._error(e, rel_path, name, dir_fd) from None
+        finally:
+            os.close(dir_fd)
+
+    def lstat(self, rel_path: str) -> os.stat_result:
+        parent, name = os.path.split(rel_path)
+        dir_fd = self.open_dir(parent)
+        try:
+            return os.stat(name or os.curdir, dir_fd=dir_fd, follow_symlinks=False)
+        finally:
+            os.close(dir_fd)
+
+    def atomic_write(self, rel_path: str, content: str, fsync: bool = False):
+        """Replace the contents of a file without ever exposing a partly written file.
+
+        The content goes to a temporary file in the same directory, which is then
+        renamed over the file. An existing file keeps its permission bits. With
+        `fsync`, the data and the rename are flushed to disk before returning so the
+        write also survives a crash.
+        """
+        parent, name = os.path.split(rel_path)
+        dir_fd = self.open_dir(parent)
+        try:
+            try:
+                st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+            except FileNotFoundError:
+                st = None
+            if st is not None and stat.S_ISREG(st.st_mode):
+                mode = st.st_mode & 0o7777
+            else:
+                mode = 0o666 & ~_UMASK
+
+            tmp_name, fd = self._create_temporary(name, dir_fd)
+            try:
+                os.fchmod(fd, mode)
+                with open(fd, "w", newline="") as fp:
+                    fp.write(content)
+                    fp.flush()
+                    if fsync:
+                        os.fsync(fp.fileno())
+                os.replace(tmp_name, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+            except BaseException:
+                os.unlink(tmp_name, dir_fd=dir_fd)
+                raise
+
+            if fsync:
+                os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    @staticmethod
+    def _create_temporary(name: str, dir_fd: int) -> tuple[str, int]:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW | os.O_CLOEXEC
+        while True:
+            tmp_name = f".{name}.{secrets.token_hex(4)}.tmp"
+            try:
+                return tmp_name, os.open(tmp_name, flags, 0o600, dir_fd=dir_fd)
+            except FileExistsError:
+                continue
+
+    @staticmethod
+    def _error(e: OSError, rel_path: str, name: str, dir_fd: int) -> OSError:
+        # O_NOFOLLOW fails with ELOOP on a link, or ENOTDIR with O_DIRECTORY
+        if e.errno in (errno.ELOOP, errno.ENOTDIR):
+            try:
+                is_link = stat.S_ISLNK(
+                    os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_mode
+                )
+            except OSError:
+                is_link = False
+            if is_link:
+                return OSError(
+                    e.errno,
+                    "Symbolic links are not followed in the workspace",
+                    rel_path,
+                )
+        return type(e)(e.errno, e.strerror, rel_path)
+
+
+# The workspaces of the running sessions and how many sessions use each
+_workspaces: dict[str, tuple[Workspace, int]] = {}
+_workspaces_lock = threading.Lock()
+
+
+def open_workspace(working_directory: str) -> Workspace:
+    """Open the workspace of a session, shared by its function calls until
+    `close_workspace` is called.
+
+    Sessions on the same working directory share one workspace. Workspaces are
+    looked up by the path exactly as given, so a session's calls only pay for
+    resolving and opening its working directory once.
+    """
+    with _workspaces_lock:
+        workspace, users = _workspaces.get(working_directory, (None, 0))
+        if workspace is None:
+            workspace = Workspace(working_directory)
+        _workspaces[working_directory] = (workspace, users + 1)
+    return workspace
+
+
+def close_workspace(working_directory: str):
+    """End a session's use of the workspace of its working directory, closing it
+    once no other session uses it."""
+    with _workspaces_lock:
+        workspace, users = _workspaces.pop(working_directory, (None, 0))
+        if users > 1:
+            _workspaces[working_directory] = (workspace, users - 1)
+            return
+    if workspace is not None:
+        workspace.close()
+
+
+def get_workspace(working_directory: str) -> Workspace:
+    """Return the workspace of the session on a working directory.
+
+    Outside of a session, e.g. when a function is called directly, a workspace is
+    opened for the call and closed once it is no longer referenced.
+    """
+    entry = _workspaces.get(working_directory)
+    return Workspace(working_directory) if entry is None else entry[0]
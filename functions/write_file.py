@@ -1,12 +1,13 @@
-from pathlib import Path
+from .workspace import get_workspace
 
-from .file_path_utils import is_file_outside_workdir
 
-
-def write_file(working_directory: str, file_path: str, content: str) -> str:
+def write_file(
+    working_directory: str, file_path: str, content: str, fsync: bool = False
+) -> str:
     """Write contents to a file.
 
-    The should be in the specified file_path in the given working directory.
+    The should be in the specified file_path in the given working directory. The file
+    is replaced atomically, so readers see either the old or the new contents.
 
     Parameters
     ----------
@@ -16,6 +17,8 @@ def write_file(working_directory: str, file_path: str, content: str) -> str:
         Path to a file inside the working directory
     content: str
         Text to be written to the specified file
+    fsync: bool
+        Whether to flush the new contents to disk before returning. Default: False
 
     Returns
     -------
@@ -28,19 +31,16 @@ def write_file(working_directory: str, file_path: str, content: str) -> str:
         - On success, a message indicating a successful write as well as the number of
           characters written to the file
     """
-    final_path = Path(working_directory).joinpath(file_path.strip("/"))
+    workspace = get_workspace(working_directory)
+    rel_path = workspace.relative(file_path)
 
     # Check if file path is outside of working directory
-    if is_file_outside_workdir(working_directory, file_path):
+    if rel_path is None:
         return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
 
-    # Create file if it doesn't exist
-    final_path.touch()
-
     # Write to file
     try:
-        with open(final_path, "w") as fp:
-            fp.write(content)
+        workspace.atomic_write(rel_path, content, fsync)
         return (
             f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
         )
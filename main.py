@@ -1,113 +1,417 @@
+from __future__ import annotations
+
 import argparse
+import asyncio
+import functools
 import os
+import sys
+import time
 from argparse import Namespace
 
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from google.genai.types import Content, Part
+from agent.compaction import DEFAULT_TOKEN_BUDGET, compact_messages, content_size
+from agent.journal import SessionJournal
+from agent.response_cache import (
+    DEFAULT_CACHE_DIR,
+    DEFAULT_MAX_BYTES,
+    CachedModels,
+    ResponseCache,
+)
+from agent.retry import (
+    DEFAULT_CALL_DEADLINE,
+    DEFAULT_MAX_RETRIES,
+    RateLimiter,
+    RetryingClient,
+    RetryPolicy,
+)
+from agent.telemetry import SessionTelemetry
+from client import run_on_server
+from functions import run_python
+from functions.call_function import (
+    WORKING_DIRECTORY,
+    ToolResultCache,
+    all_functions,
+    call_function,
+    get_function,
+)
+from functions.dispatch import (
+    DEFAULT_MAX_WORKERS,
+    ToolDispatcher,
+    call_functions_concurrently,
+)
+from functions.lazy_import import lazy_import
+from functions.prefetch import DEFAULT_BUDGET_BYTES, Prefetcher
+from functions.python_worker_pool import PythonWorkerPool
+from functions.run_cache import RunCache
+from functions.workspace import close_workspace, open_workspace
 
-import functions.function_declarations as funcdecs
-from functions.call_function import call_function
+# The SDK is only imported once it is needed, so that --help, argument errors and
+# --profile-startup do not pay for it
+genai = lazy_import("google.genai")
+types = lazy_import("google.genai.types")
 
 MAX_AGENT_ITERATIONS = 20
+MODEL = "gemini-2.0-flash-001"
 
-available_functions = types.Tool(
-    function_declarations=[
-        funcdecs.schema_get_files_info,
-        funcdecs.schema_get_file_content,
-        funcdecs.schema_run_python_file,
-        funcdecs.schema_write_file,
-    ]
-)
+
+@functools.cache
+def get_available_functions() -> types.Tool:
+    """Return the declarations of the functions the model may call."""
+    import functions.function_declarations as funcdecs
+
+    return types.Tool(
+        function_declarations=[
+            funcdecs.schema_get_files_info,
+            funcdecs.schema_get_file_content,
+            funcdecs.schema_run_python_file,
+            funcdecs.schema_run_python_file_batch,
+            funcdecs.schema_search_files,
+            funcdecs.schema_write_file,
+            funcdecs.schema_edit_file,
+        ]
+    )
 
 
-def parse_args() -> Namespace:
+def preload():
+    """Import everything a session needs ahead of time, e.g. before forking
+    sessions from a warm process."""
+    get_available_functions()
+    for function_name in all_functions:
+        get_function(function_name)
+    # Creating a client imports the SDK's lazily loaded HTTP and auth modules
+    genai.Client(api_key="preload")
+
+
+def parse_args(argv: list[str] | None = None) -> Namespace:
     parser = argparse.ArgumentParser(
         prog="example_ai_agent",
         description="Example AI agent created as part of the Boot.dev backend path",
     )
-    parser.add_argument("prompt", nargs="+", type=str, help="Prompt to the AI agent")
+    parser.add_argument("prompt", nargs="*", type=str, help="Prompt to the AI agent")
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Enable verbose output"
     )
+    parser.add_argument(
+        "--working-directory",
+        default=WORKING_DIRECTORY,
+        metavar="DIR",
+        help=f"Directory the agent works in (default: {WORKING_DIRECTORY})",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrent-tools",
+        action="store_true",
+        help="Run the function calls from a single model turn concurrently",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Maximum number of concurrent function calls (default: {DEFAULT_MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "-s",
+        "--stream",
+        action="store_true",
+        help="Stream model responses and start function calls as soon as they arrive",
+    )
+    parser.add_argument(
+        "--response-cache",
+        nargs="?",
+        const=DEFAULT_CACHE_DIR,
+        metavar="DIR",
+        help=f"Cache model responses on disk (default directory: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="Size limit of the response cache in MiB",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only serve model responses from the response cache",
+    )
+
+    parser.add_argument(
+        "--no-tool-cache",
+        action="store_true",
+        help="Do not reuse the results of repeated read-only function calls",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="After a directory listing, read its small .py files into the tool "
+        "result cache in the background",
+    )
+    parser.add_argument(
+        "--prefetch-budget-kb",
+        type=int,
+        default=DEFAULT_BUDGET_BYTES // 1024,
+        help="Memory for prefetched files that were not read yet, in KiB "
+        f"(default: {DEFAULT_BUDGET_BYTES // 1024})",
+    )
+
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Compact old function results before each model call",
+    )
+    parser.add_argument(
+        "--token-budget",
+        type=int,
+        default=DEFAULT_TOKEN_BUDGET,
+        help=f"Token budget for --compact (default: {DEFAULT_TOKEN_BUDGET})",
+    )
 
-    return parser.parse_args()
+    parser.add_argument(
+        "--telemetry",
+        metavar="PATH",
+        help='Write a JSON summary of token usage and latencies to PATH ("-" for stdout)',
+    )
+    parser.add_argument(
+        "--count-tokens",
+        action="store_true",
+        help="Count the tokens of each request with the API before sending it",
+    )
 
+    parser.add_argument(
+        "--warm-workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Run Python files on a pool of N warm interpreters (default: disabled)",
+    )
 
-def verbose_token_count(text: str) -> int:
-    return len(text.replace(" ", "")) // 4
+    parser.add_argument(
+        "--cache-runs",
+        action="store_true",
+        help="Reuse the output of an earlier run of a Python file while the file, "
+        "the local modules it imports and its arguments are unchanged (only for "
+        "scripts that depend on nothing else)",
+    )
 
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=DEFAULT_MAX_RETRIES,
+        help=f"Retries of a failed model call (default: {DEFAULT_MAX_RETRIES})",
+    )
+    parser.add_argument(
+        "--call-timeout",
+        type=float,
+        default=DEFAULT_CALL_DEADLINE,
+        metavar="SECONDS",
+        help="Deadline of a model call including its retries "
+        f"(default: {DEFAULT_CALL_DEADLINE:g})",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        metavar="N",
+        help="Limit model calls to N requests per minute",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=int,
+        metavar="N",
+        help="Limit model calls to N tokens per minute",
+    )
 
-def main():
-    # Parse command line args
-    args = parse_args()
+    parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help="Record the session to PATH as it goes, so that it can be resumed",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the session recorded in the --journal file",
+    )
 
-    # Init model
-    load_dotenv()
-    api_key = os.environ.get("GEMINI_API_KEY")
-    client = genai.Client(api_key=api_key)
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report the time spent importing what a session needs and exit",
+    )
 
-    # Generate content using model
-    model = "gemini-2.0-flash-001"
-    user_prompt = " ".join(args.prompt)
-    system_prompt = """
-    You are a helpful AI coding agent.
-
-    When a user asks a question or makes a request, make a function call plan. You can
-    peform the following operations:
-
-    - List files and directories
-    - Read file contents
-    - Execute Python files with optional arguments
-    - Write or overwrite files
-
-    All of these operations are constrained to a working directory that has already been
-    provided by the calling code and, thus, does not need to be specified in any of the
-    function calls. All paths you provide should be relative to this working directory.
-    Also, any of the questions asked by the user should be answered within the context
-    of this working directory. When asked about code functionality, try looking through
-    any files with a '.py' extension in the current directory or any subdirectories.
-    When attempting to retrieve information about files always start by looking in the
-    current directory (i.e., the '.' directory).
-    """
+    args = parser.parse_args(argv)
+    if not args.prompt and not (args.resume or args.profile_startup):
+        parser.error("the following arguments are required: prompt")
+    if args.resume and args.journal is None:
+        parser.error("--resume needs the --journal to resume from")
+    if args.offline and args.response_cache is None:
+        args.response_cache = DEFAULT_CACHE_DIR
+    if args.offline and args.count_tokens:
+        parser.error("--count-tokens needs the API and cannot be used with --offline")
+    if args.stream and args.response_cache is not None:
+        parser.error("--stream cannot be combined with the response cache")
 
-    reached_max_iter = False
-    messages = [Content(role="user", parts=[Part(text=user_prompt)])]
-    for it in range(MAX_AGENT_ITERATIONS):
-        response = client.models.generate_content(
-            model=model,
-            contents=messages,
-            config=types.GenerateContentConfig(
-                tools=[available_functions], system_instruction=system_prompt
-            ),
+    return args
+
+
+SYSTEM_PROMPT = """
+You are a helpful AI coding agent.
+
+When a user asks a question or makes a request, make a function call plan. You can
+peform the following operations:
+
+- List files and directories
+- Read file contents
+- Search the contents of files for a pattern
+- Execute Python files with optional arguments
+- Execute a Python file once for each of several argument lists in a single call
+- Write or overwrite files
+- Edit part of a file with search/replace blocks or a unified diff
+
+All of these operations are constrained to a working directory that has already been
+provided by the calling code and, thus, does not need to be specified in any of the
+function calls. All paths you provide should be relative to this working directory.
+Also, any of the questions asked by the user should be answered within the context
+of this working directory. When asked about code functionality, try looking through
+any files with a '.py' extension in the current directory or any subdirectories.
+Search for names you are looking for rather than reading files one at a time.
+When attempting to retrieve information about files always start by looking in the
+current directory (i.e., the '.' directory).
+"""
+
+
+def prepare_contents(
+    messages: list[types.Content], args: Namespace
+) -> list[types.Content]:
+    if not args.compact:
+        return messages
+
+    contents, stats = compact_messages(messages, args.token_budget)
+    if args.verbose:
+        print(
+            f"Compaction: {stats.bytes_saved} bytes saved "
+            f"({stats.bytes_before} -> {stats.bytes_after} bytes, "
+            f"{stats.compacted_results} results compacted)"
         )
-        if response.candidates is not None:
-            for candidate in response.candidates:
-                messages.append(candidate.content)
+    return contents
+
+
+def print_usage(
+    user_prompt: str, usage: types.GenerateContentResponseUsageMetadata | None
+):
+    print(f"User prompt: {user_prompt}")
+    if usage is not None:
+        print(f"Prompt tokens: {usage.prompt_token_count}")
+        print(f"Response tokens: {usage.candidates_token_count}")
+
+
+def append_function_results(
+    messages: list[types.Content],
+    function_call: types.FunctionCall,
+    function_call_results: types.Content,
+    verbose: bool,
+):
+    function_call_results_response = function_call_results.parts[
+        0
+    ].function_response.response
+    if function_call_results_response is None:
+        raise Exception(
+            f'Function call "{function_call.name}" did not return a response'
+        )
+    messages.append(function_call_results)
+    if verbose:
+        print(f"-> {function_call_results_response}")
+
+
+def run_function_calls(
+    messages: list[types.Content],
+    function_calls: list[types.FunctionCall],
+    args: Namespace,
+    tool_cache: ToolResultCache | None = None,
+    telemetry: SessionTelemetry | None = None,
+) -> list[types.Content]:
+    """Run the function calls of a model turn and append their results to
+    `messages`, in the order the calls were made."""
+    if args.concurrent_tools:
+        all_results = call_functions_concurrently(
+            function_calls,
+            args.verbose,
+            args.max_workers,
+            tool_cache,
+            telemetry,
+            args.working_directory,
+        )
+    else:
+        all_results = (
+            call_function(
+                function_call,
+                args.verbose,
+                tool_cache,
+                telemetry,
+                args.working_directory,
+            )
+            for function_call in function_calls
+        )
+    results = []
+    for function_call, function_call_results in zip(
+        function_calls, all_results, strict=True
+    ):
+        append_function_results(
+            messages, function_call, function_call_results, args.verbose
+        )
+        results.append(function_call_results)
+    return results
+
+
+def run_agent(
+    models: genai.models.Models | CachedModels,
+    model: str,
+    messages: list[types.Content],
+    config: types.GenerateContentConfig,
+    args: Namespace,
+    tool_cache: ToolResultCache | None = None,
+    telemetry: SessionTelemetry | None = None,
+    journal: SessionJournal | None = None,
+    start_iteration: int = 0,
+) -> bool:
+    """Run the agent loop, waiting for each complete model response.
+
+    Each model turn and its function results are recorded to `journal`, if given.
+    A resumed session continues counting iterations from `start_iteration`.
+
+    Returns True if the agent used up all of its iterations without answering.
+    """
+    user_prompt = " ".join(args.prompt)
+    reached_max_iter = start_iteration >= MAX_AGENT_ITERATIONS
+    for it in range(start_iteration, MAX_AGENT_ITERATIONS):
+        contents = prepare_contents(messages, args)
+        estimated_tokens = (
+            telemetry.estimate_prompt_tokens(contents) if telemetry else None
+        )
+        start = time.perf_counter()
+        response = models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        if telemetry is not None:
+            telemetry.record_model_call(
+                it,
+                time.perf_counter() - start,
+                response.usage_metadata,
+                sum(content_size(content) for content in contents),
+                len(response.model_dump_json(exclude_none=True).encode()),
+                estimated_tokens,
+            )
+        model_contents = [c.content for c in response.candidates or []]
+        messages.extend(model_contents)
+        if journal is not None:
+            journal.record_model(it, model_contents)
 
         if args.verbose:
-            print(f"User prompt: {user_prompt}")
-            print(f"Prompt tokens: {verbose_token_count(user_prompt)}")
-            # Will need to rethink how to handle this. Comment out for now.
-            # print(
-            #     f"Response tokens: {verbose_token_count(response.text) if response.text else 0}\n"
-            # )
+            print_usage(user_prompt, response.usage_metadata)
 
         function_calls = response.function_calls
         if function_calls:
-            for function_call in function_calls:
-                function_call_results = call_function(function_call, args.verbose)
-                function_call_results_response = function_call_results.parts[
-                    0
-                ].function_response.response
-                if function_call_results_response is None:
-                    raise Exception(
-                        f'Function call "{function_call.name}" did not return a response'
-                    )
-                messages.append(function_call_results)
-                if args.verbose:
-                    print(f"-> {function_call_results_response}")
+            results = run_function_calls(
+                messages, function_calls, args, tool_cache, telemetry
+            )
+            if journal is not None:
+                journal.record_tools(it, results)
 
         else:
             print(f"Response: {response.text}")
@@ -115,6 +419,272 @@ def main():
 
         reached_max_iter = (it + 1) == MAX_AGENT_ITERATIONS
 
+    return reached_max_iter
+
+
+def _is_text_only(part: types.Part) -> bool:
+    return part.text is not None and not part.model_dump(
+        exclude={"text"}, exclude_none=True
+    )
+
+
+def _append_part(parts: list[types.Part], part: types.Part):
+    # Streamed text arrives in many small parts; keep the history compact by joining
+    # consecutive text-only parts back together. Thoughts, and parts carrying
+    # anything besides text, are kept as they are.
+    if (
+        parts
+        and _is_text_only(part)
+        and _is_text_only(parts[-1])
+        and not (part.thought or parts[-1].thought)
+    ):
+        parts[-1] = parts[-1].model_copy(update={"text": parts[-1].text + part.text})
+        return
+    parts.append(part)
+
+
+async def run_agent_stream(
+    client: genai.Client,
+    model: str,
+    messages: list[types.Content],
+    config: types.GenerateContentConfig,
+    args: Namespace,
+    tool_cache: ToolResultCache | None = None,
+    telemetry: SessionTelemetry | None = None,
+    journal: SessionJournal | None = None,
+    start_iteration: int = 0,
+) -> bool:
+    """Run the agent loop on the streaming API.
+
+    Text is printed as it arrives. Each function call is handed to the tool dispatcher
+    as soon as the chunk carrying it has been received, so tools run while the rest of
+    the response is still streaming in. Results are appended to `messages` in the
+    order the calls were made. Turns are journaled as in `run_agent`.
+
+    Returns True if the agent used up all of its iterations without answering.
+    """
+    user_prompt = " ".join(args.prompt)
+    max_workers = args.max_workers if args.concurrent_tools else 1
+    reached_max_iter = start_iteration >= MAX_AGENT_ITERATIONS
+    with ToolDispatcher(
+        args.verbose, max_workers, tool_cache, telemetry, args.working_directory
+    ) as dispatcher:
+        for it in range(start_iteration, MAX_AGENT_ITERATIONS):
+            parts: list[types.Part] = []
+            pending: list[tuple[types.FunctionCall, asyncio.Future]] = []
+            printed_text = False
+            usage = None
+            response_bytes = 0
+            first_chunk_latency = None
+            contents = prepare_contents(messages, args)
+            estimated_tokens = (
+                telemetry.estimate_prompt_tokens(contents) if telemetry else None
+            )
+            start = time.perf_counter()
+            stream = await client.aio.models.generate_content_stream(
+                model=model, contents=contents, config=config
+            )
+            async for chunk in stream:
+                if first_chunk_latency is None:
+                    first_chunk_latency = time.perf_counter() - start
+                usage = chunk.usage_metadata or usage
+                response_bytes += len(chunk.model_dump_json(exclude_none=True).encode())
+                if not chunk.candidates or chunk.candidates[0].content is None:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    _append_part(parts, part)
+                    if part.function_call:
+                        future = dispatcher.submit(part.function_call)
+                        pending.append(
+                            (part.function_call, asyncio.wrap_future(future))
+                        )
+                    elif part.text and not part.thought:
+                        if not printed_text:
+                            print("Response: ", end="")
+                            printed_text = True
+                        print(part.text, end="", flush=True)
+            if printed_text:
+                print()
+            if telemetry is not None:
+                telemetry.record_model_call(
+                    it,
+                    time.perf_counter() - start,
+                    usage,
+                    sum(content_size(content) for content in contents),
+                    response_bytes,
+                    estimated_tokens,
+                    first_chunk_latency,
+                )
+            if args.verbose:
+                print_usage(user_prompt, usage)
+
+            messages.append(types.Content(role="model", parts=parts))
+            if journal is not None:
+                journal.record_model(it, messages[-1:])
+            if not pending:
+                break
+
+            results = []
+            for function_call, future in pending:
+                results.append(await future)
+                append_function_results(
+                    messages, function_call, results[-1], args.verbose
+                )
+            if journal is not None:
+                journal.record_tools(it, results)
+
+            reached_max_iter = (it + 1) == MAX_AGENT_ITERATIONS
+
+    return reached_max_iter
+
+
+def main(argv: list[str] | None = None, model_client: genai.Client | None = None):
+    """Run the CLI.
+
+    Parameters
+    ----------
+    argv : list[str] | None
+        Command line arguments, `sys.argv[1:]` by default
+    model_client : genai.Client | None
+        Client to use instead of one for the Gemini API, such as the scripted fake
+        in `agent.fake_client` that the benchmarks use
+    """
+    # Parse command line args
+    args = parse_args(argv)
+    if args.profile_startup:
+        from agent.startup_profile import profile_imports, summarize
+
+        print(summarize(*profile_imports()))
+        return
+
+    # Init model
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    api_key = os.environ.get("GEMINI_API_KEY")
+    client = None
+    if not args.offline:
+        policy = RetryPolicy(max_retries=args.max_retries, deadline=args.call_timeout)
+        limiter = RateLimiter(args.rpm, args.tpm)
+        if model_client is None:
+            model_client = genai.Client(api_key=api_key)
+        client = RetryingClient(model_client, policy, limiter, args.verbose)
+
+    # Generate content using model
+    model = MODEL
+    user_prompt = " ".join(args.prompt)
+    config = types.GenerateContentConfig(
+        tools=[get_available_functions()], system_instruction=SYSTEM_PROMPT
+    )
+
+    messages = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+    start_iteration = 0
+    journal = None
+    if args.resume:
+        session = SessionJournal.load(args.journal)
+        if args.prompt and user_prompt != session.prompt:
+            raise Exception(f'"{args.journal}" records a session with another prompt')
+        args.prompt = [session.prompt]
+        messages = session.messages
+        start_iteration = session.iterations
+        if args.verbose:
+            print(f"Resuming session after {session.iterations} model calls")
+        if session.finished:
+            text = "".join(part.text or "" for part in messages[-1].parts or [])
+            print(f"Response: {text}")
+            return
+    if args.journal is not None:
+        journal = SessionJournal(args.journal, append=args.resume)
+        if not args.resume:
+            journal.record_prompt(user_prompt, model)
+    tool_cache = None if args.no_tool_cache else ToolResultCache()
+    prefetcher = None
+    if args.prefetch and tool_cache is not None:
+        prefetcher = Prefetcher(tool_cache, budget_bytes=args.prefetch_budget_kb * 1024)
+    token_counter = None
+    if args.count_tokens:
+
+        def token_counter(contents: list[types.Content]) -> int:
+            return client.models.count_tokens(
+                model=model, contents=contents
+            ).total_tokens
+
+    telemetry = SessionTelemetry(token_counter)
+    worker_pool = None
+    if args.warm_workers > 0:
+        worker_pool = PythonWorkerPool(args.warm_workers)
+        run_python.use_worker_pool(worker_pool)
+    run_cache = None
+    if args.cache_runs:
+        run_cache = RunCache()
+        run_python.use_run_cache(run_cache)
+    # Shared by the session's function calls, and closed with the session
+    open_workspace(args.working_directory)
+    try:
+        if args.resume and session.pending_calls:
+            # The model answered but not all of its calls got to run
+            results = run_function_calls(
+                messages, session.pending_calls, args, tool_cache, telemetry
+            )
+            journal.record_tools(start_iteration - 1, results)
+
+        if args.stream:
+            reached_max_iter = asyncio.run(
+                run_agent_stream(
+                    client,
+                    model,
+                    messages,
+                    config,
+                    args,
+                    tool_cache,
+                    telemetry,
+                    journal,
+                    start_iteration,
+                )
+            )
+        else:
+            models = None if client is None else client.models
+            if args.response_cache is not None:
+                cache = ResponseCache(
+                    args.response_cache, args.cache_max_mb * 1024 * 1024
+                )
+                models = CachedModels(models, cache, offline=args.offline)
+            reached_max_iter = run_agent(
+                models,
+                model,
+                messages,
+                config,
+                args,
+                tool_cache,
+                telemetry,
+                journal,
+                start_iteration,
+            )
+            if args.verbose and args.response_cache is not None:
+                print(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+    finally:
+        if journal is not None:
+            journal.close()
+        if worker_pool is not None:
+            run_python.use_worker_pool(None)
+            worker_pool.close()
+        if run_cache is not None:
+            run_python.use_run_cache(None)
+        if prefetcher is not None:
+            prefetcher.close()
+        close_workspace(args.working_directory)
+        # Also write the summary for failed sessions, where it is most useful
+        if args.telemetry is not None:
+            telemetry.dump(args.telemetry)
+
+    if args.verbose and client is not None:
+        print(f"Model call retries: {client.retries}")
+    if args.verbose and tool_cache is not None:
+        print(f"Tool result cache: {tool_cache.stats()}")
+    if args.verbose and prefetcher is not None:
+        print(f"Prefetch: {prefetcher.stats()}")
+    if args.verbose and run_cache is not None:
+        print(f"Run cache: {run_cache.stats()}")
     if args.verbose and reached_max_iter:
         print(
             f"Agent reached the maximum number of iterations ({MAX_AGENT_ITERATIONS})"
@@ -122,6 +692,10 @@ def main():
 
 
 if __name__ == "__main__":
+    # Hand the session to a running agent server, which has everything loaded
+    returncode = run_on_server(sys.argv[1:])
+    if returncode is not None:
+        sys.exit(returncode)
     try:
         main()
     except Exception as e:
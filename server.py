@@ -0,0 +1,171 @@
+import argparse
+import io
+import os
+import signal
+import socket
+import socketserver
+import sys
+from argparse import Namespace
+
+import main
+from agent.daemon import (
+    check_private_dir,
+    default_socket_path,
+    is_session_env_var,
+    peer_uid,
+    recv_request,
+    send_message,
+)
+
+
+def parse_args(argv: list[str] | None = None) -> Namespace:
+    parser = argparse.ArgumentParser(
+        prog="example_ai_agent_server",
+        description="Keep the agent loaded and run sessions for the thin client "
+        "(client.py) without paying for imports and setup on every prompt",
+    )
+    parser.add_argument(
+        "--socket",
+        default=default_socket_path(),
+        metavar="PATH",
+        help="Unix socket to listen on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=16,
+        help="Maximum number of sessions run at the same time (default: 16)",
+    )
+    return parser.parse_args(argv)
+
+
+def _line_buffered(fd: int) -> io.TextIOWrapper:
+    return io.TextIOWrapper(
+        io.BufferedWriter(io.FileIO(fd, "w", closefd=False)), line_buffering=True
+    )
+
+
+def run_session(request: dict, fds: list[int]) -> int:
+    """Run a CLI invocation in the current (forked) process and return its exit code.
+
+    The client's stdin, stdout and stderr take the place of our own, and its working
+    directory, environment and arguments are restored, so the session behaves
+    exactly like `python main.py ...` started by the client.
+    """
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = io.TextIOWrapper(io.BufferedReader(io.FileIO(0, closefd=False)))
+    sys.stdout = _line_buffered(1)
+    sys.stderr = _line_buffered(2)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    os.chdir(request["cwd"])
+    # The client only sends the variables a session uses; everything else is ours
+    for name in [name for name in os.environ if is_session_env_var(name)]:
+        del os.environ[name]
+    os.environ.update(request["env"])
+    sys.argv = [main.__file__, *request["argv"]]
+    try:
+        main.main()
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        print(f"Error running program: {e}")
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return 0
+
+
+class SessionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Runs in a child forked for this connection
+        uid = peer_uid(self.request)
+        if uid is not None and uid != os.getuid():
+            send_message(
+                self.request, {"error": "Sessions must run as the server's user"}
+            )
+            return
+        request, fds = recv_request(self.request)
+        if len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            send_message(self.request, {"error": "Expected stdin, stdout and stderr"})
+            return
+        send_message(self.request, {"pid": os.getpid()})
+        returncode = run_session(request, fds)
+        send_message(self.request, {"returncode": returncode})
+
+
+class AgentServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Fork a child from the warm server process for every client session.
+
+    Everything `main.py` sets up at import time (the SDK, pydantic models, tool
+    declarations) is loaded once, and each session starts from a copy of that
+    process. Sessions are isolated from each other and from the server as in the
+    plain CLI, and concurrent sessions run in parallel.
+    """
+
+    block_on_close = False
+    stopping = False
+
+    def stop(self, signum, frame):
+        # Raising from a signal handler is not enough: when the signal arrives
+        # while forking, the exception is swallowed by an at-fork hook
+        self.stopping = True
+
+    def service_actions(self):
+        super().service_actions()
+        if self.stopping:
+            sys.exit(0)
+
+    def server_bind(self):
+        # Only our own user may connect, as sessions run with our permissions
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+
+def server_main():
+    args = parse_args()
+    socket_dir = os.path.dirname(os.path.abspath(args.socket))
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    try:
+        check_private_dir(socket_dir)
+    except PermissionError as e:
+        sys.exit(f"Cannot listen on {args.socket}: {e}")
+    if os.path.exists(args.socket):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(args.socket)
+        except ConnectionRefusedError:
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(args.socket)
+        else:
+            sys.exit(f"An agent server is already listening on {args.socket}")
+        finally:
+            probe.close()
+    main.preload()
+    with AgentServer(args.socket, SessionHandler) as server:
+        server.max_children = args.max_sessions
+        signal.signal(signal.SIGTERM, server.stop)
+        print(f"Agent server listening on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    server_main()
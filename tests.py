@@ -1,9 +1,59 @@
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 from pathlib import Path
+from types import SimpleNamespace
 
+import httpx
+from google.genai import errors, types
+
+import batch
+import bench
+import client
+import main
+from agent.compaction import compact_messages
+from agent.daemon import recv_request, send_request
+from agent.fake_client import ScriptedClient
+from agent.journal import JournalError, SessionJournal
+from agent.response_cache import CachedModels, CacheMiss, ResponseCache, cache_key
+from agent.retry import (
+    AsyncRetryingModels,
+    RateLimiter,
+    RetryingModels,
+    RetryPolicy,
+    retry_after,
+)
+from agent.startup_profile import parse_importtime, summarize
+from agent.telemetry import SessionTelemetry, percentile
+from functions import python_worker_pool, run_python
+from functions.call_function import ToolResultCache, call_function
+from functions.dispatch import call_footprint, call_functions_concurrently
+from functions.edit_file import edit_file
 from functions.get_file_content import MAX_CONTENT_LENGTH, get_file_content
 from functions.get_files_info import get_files_info
-from functions.run_python import run_python_file
+from functions.output_capture import BoundedBuffer, OutputLimits
+from functions.prefetch import Prefetcher
+from functions.python_worker_pool import PythonWorkerPool, worker_pool_supported
+from functions.run_cache import RunCache, imported_modules
+from functions.run_python import run_python_file, run_python_file_batch
+from functions.search_files import search_files
+from functions.search_index import TrigramIndex, required_literals
+from functions.workspace import (
+    Workspace,
+    close_workspace,
+    get_workspace,
+    open_workspace,
+)
 from functions.write_file import write_file
 
 
@@ -15,15 +65,53 @@ class TestGetFilesInfo(unittest.TestCase):
         self.assertIn("main.py", got)
         self.assertIn("pkg", got)
         self.assertIn("tests.py", got)
+        self.assertEqual(got, get_files_info(self.working_dir))
 
     def test_calculator_pkg(self):
         got = get_files_info(self.working_dir, "pkg")
         self.assertIn("calculator.py", got)
         self.assertIn("render.py", got)
 
+    def test_recursive(self):
+        got = get_files_info(self.working_dir, ".", recursive=True)
+        self.assertIn("- pkg/calculator.py: file_size=", got)
+        self.assertNotIn("__pycache__", got)
+        self.assertLess(got.index("- main.py:"), got.index("- pkg:"))
+        self.assertLess(got.index("- pkg:"), got.index("- pkg/calculator.py:"))
+
+    def test_depth_and_globs(self):
+        got = get_files_info(self.working_dir, ".", max_depth=1, include=["*.py"])
+        self.assertEqual(
+            ["- main.py", "- tests.py"],
+            [line.split(":")[0] for line in got.splitlines()],
+        )
+        got = get_files_info(
+            self.working_dir, ".", recursive=True, include=["*.py"], exclude=["pkg"]
+        )
+        self.assertNotIn("pkg", got)
+
+    def test_pagination(self):
+        want = get_files_info(self.working_dir, ".", recursive=True).splitlines()
+        got: list[str] = []
+        cursor = None
+        while True:
+            page = get_files_info(
+                self.working_dir, ".", recursive=True, cursor=cursor, page_size=2
+            ).splitlines()
+            if page and page[-1].startswith("...Listing truncated"):
+                cursor = page.pop().split('cursor="')[1].split('"')[0]
+                got += page
+            else:
+                got += page
+                break
+        self.assertEqual(want, got)
+
     def test_calculator_bin(self):
         got = get_files_info(self.working_dir, "/bin")
-        self.assertEqual('Error: "/bin" is not a directory', got)
+        self.assertEqual(
+            'Error: Cannot list "/bin" as it is outside the permitted working directory',
+            got,
+        )
 
     def test_calculator_parent(self):
         got = get_files_info(self.working_dir, "../")
@@ -49,9 +137,51 @@ class TestGetFileContent(unittest.TestCase):
     def test_lorem(self):
         got = get_file_content(self.working_dir, "lorem-test.txt")
         golden_file = self.golden_files["lorem"]
-        lorem_trunc = f'{self.get_golden_file(golden_file)}...File "lorem.txt" truncated at {MAX_CONTENT_LENGTH} characters'
+        size = Path(self.working_dir, "lorem-test.txt").stat().st_size
+        lorem_trunc = (
+            f'{self.get_golden_file(golden_file)}...File "lorem-test.txt" truncated at '
+            f"{MAX_CONTENT_LENGTH} characters (bytes 0-{MAX_CONTENT_LENGTH} of {size}). "
+            f"Call get_file_content with offset={MAX_CONTENT_LENGTH} to continue reading"
+        )
         self.assertEqual(lorem_trunc, got)
 
+    def test_lorem_continuation(self):
+        got = get_file_content(
+            self.working_dir, "lorem-test.txt", offset=MAX_CONTENT_LENGTH, length=20
+        )
+        want = self.get_golden_file("calculator/lorem-test.txt")[
+            MAX_CONTENT_LENGTH : MAX_CONTENT_LENGTH + 20
+        ]
+        self.assertTrue(got.startswith(f'{want}...File "lorem-test.txt" truncated'))
+        self.assertTrue(
+            got.endswith(f"offset={MAX_CONTENT_LENGTH + 20} to continue reading")
+        )
+
+    def test_line_range(self):
+        got = get_file_content(self.working_dir, "main.py", start_line=3, end_line=4)
+        want = self.get_golden_file(self.golden_files["calc_main"]).splitlines(True)[
+            2:4
+        ]
+        self.assertEqual("".join(want), got)
+
+    def test_line_range_past_end(self):
+        got = get_file_content(self.working_dir, "main.py", start_line=1000)
+        self.assertEqual("Error: start_line 1000 is past the end of the file", got)
+
+    def test_multibyte_boundary(self):
+        # "┌" is three bytes long; a range ending inside it stops before it
+        got = get_file_content(self.working_dir, "pkg/render.py", offset=0, length=1)
+        self.assertTrue(got.startswith("#..."))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Path(tmp_dir, "box.txt").write_text("a┌b")
+            got = get_file_content(tmp_dir, "box.txt", length=2)
+            self.assertTrue(
+                got.startswith('a...File "box.txt" truncated at 1 characters')
+            )
+            self.assertTrue(got.endswith("offset=1 to continue reading"))
+            self.assertEqual("┌b", get_file_content(tmp_dir, "box.txt", offset=1))
+            self.assertEqual("b", get_file_content(tmp_dir, "box.txt", offset=2))
+
     def test_calc_main_file(self):
         got = get_file_content(self.working_dir, "main.py")
         golden_file = self.golden_files["calc_main"]
@@ -70,6 +200,87 @@ class TestGetFileContent(unittest.TestCase):
         self.assertEqual(got, want)
 
 
+class TestSearchFiles(unittest.TestCase):
+    working_dir = "calculator"
+
+    def tearDown(self):
+        Path(self.working_dir, "pkg", "search-test.txt").unlink(missing_ok=True)
+
+    def test_regex(self):
+        got = search_files(self.working_dir, r"def\s+evaluate\(", context_lines=0)
+        self.assertEqual(
+            "pkg/calculator.py:93:     def evaluate(self, expression, **variables):",
+            got,
+        )
+
+    def test_context_and_include(self):
+        got = search_files(
+            self.working_dir, "Calculator", literal=True, include=["*.py"]
+        )
+        self.assertIn("main.py:", got)
+        self.assertIn("pkg/calculator.py:", got)
+        self.assertNotIn("lorem", got)
+        self.assertRegex(got, r"pkg/calculator\.py-\d+- ")
+
+    def test_directory_and_case(self):
+        got = search_files(
+            self.working_dir, "class calculator", "pkg", ignore_case=True
+        )
+        self.assertIn("pkg/calculator.py:", got)
+        self.assertNotIn("main.py", got)
+
+    def test_no_match(self):
+        got = search_files(self.working_dir, "no such text anywhere")
+        self.assertEqual('No matches found for "no such text anywhere"', got)
+
+    def test_errors(self):
+        got = search_files(self.working_dir, "x", "/bin")
+        self.assertEqual(
+            'Error: Cannot search "/bin" as it is outside the permitted working directory',
+            got,
+        )
+        self.assertTrue(search_files(self.working_dir, "(").startswith("Error:"))
+
+    def test_index_follows_writes(self):
+        index = TrigramIndex(self.working_dir)
+        index.refresh()
+        self.assertEqual([], index.candidates(["zebra crossing"]))
+        write_file(self.working_dir, "pkg/search-test.txt", "a zebra crossing\n")
+        index.update("pkg/search-test.txt")
+        self.assertEqual(["pkg/search-test.txt"], index.candidates(["Zebra Crossing"]))
+        self.assertEqual(0, index.refresh())
+
+        got = search_files(self.working_dir, "zebra crossing")
+        self.assertEqual("pkg/search-test.txt:1: a zebra crossing", got)
+        write_file(self.working_dir, "pkg/search-test.txt", "gone\n")
+        got = search_files(self.working_dir, "zebra crossing")
+        self.assertEqual('No matches found for "zebra crossing"', got)
+
+    def test_refresh_only_lists_changed_directories(self):
+        with tempfile.TemporaryDirectory() as working_dir:
+            Path(working_dir, "sub").mkdir()
+            Path(working_dir, "sub", "a.txt").write_text("alpha\n")
+            index = TrigramIndex(working_dir)
+            self.assertEqual(1, index.refresh())
+            self.assertEqual(0, index.refresh())
+
+            # Written in place, which the directory's mtime does not show
+            with open(Path(working_dir, "sub", "a.txt"), "w") as fp:
+                fp.write("beta\n")
+            index.mark_stale()
+            self.assertEqual(1, index.refresh())
+            self.assertEqual(["sub/a.txt"], index.candidates(["beta"]))
+
+            shutil.rmtree(Path(working_dir, "sub"))
+            self.assertEqual(1, index.refresh())
+            self.assertEqual([], index.candidates(["beta"]))
+
+    def test_required_literals(self):
+        self.assertEqual(["def", "calc"], required_literals(r"def\s+(calc\w+)"))
+        self.assertEqual([], required_literals("foo|barbaz"))
+        self.assertEqual(["abc"], required_literals("(abc)+xy?"))
+
+
 class TestWriteFile(unittest.TestCase):
     lorem_file_path = "calculator/lorem.txt"
 
@@ -102,20 +313,231 @@ class TestWriteFile(unittest.TestCase):
         self.assertEqual(got, want)
 
 
+class TestEditFile(unittest.TestCase):
+    working_dir = "calculator"
+    file_path = "pkg/edit-test.txt"
+    original = "one\ntwo\nthree\nfour\nfive\n"
+
+    def setUp(self):
+        write_file(self.working_dir, self.file_path, self.original)
+        os.chmod(os.path.join(self.working_dir, self.file_path), 0o640)
+
+    def tearDown(self):
+        Path(self.working_dir, self.file_path).unlink(missing_ok=True)
+
+    def read_file(self) -> str:
+        with open(os.path.join(self.working_dir, self.file_path)) as fp:
+            return fp.read()
+
+    def test_search_replace(self):
+        edits = [
+            {"search": "two\n", "replace": "2\n"},
+            {"search": "five", "replace": "5"},
+        ]
+        got = edit_file(self.working_dir, self.file_path, edits=edits)
+        self.assertEqual(
+            'Successfully edited "pkg/edit-test.txt" (file is now 19 characters)', got
+        )
+        self.assertEqual("one\n2\nthree\nfour\n5\n", self.read_file())
+        mode = os.stat(os.path.join(self.working_dir, self.file_path)).st_mode
+        self.assertEqual(0o640, mode & 0o777)
+
+    def test_failed_edit_leaves_file(self):
+        edits = [{"search": "one", "replace": "1"}, {"search": "o", "replace": "0"}]
+        got = edit_file(self.working_dir, self.file_path, edits=edits)
+        self.assertEqual(
+            'Error: Could not edit "pkg/edit-test.txt": the search text of edit 2 '
+            "matches 2 times; include more surrounding lines to make it unique. "
+            "The file was not changed",
+            got,
+        )
+        self.assertEqual(self.original, self.read_file())
+
+    def test_unified_diff(self):
+        diff = (
+            "--- a/pkg/edit-test.txt\n"
+            "+++ b/pkg/edit-test.txt\n"
+            "@@ -1,2 +1,3 @@\n"
+            "+zero\n"
+            " one\n"
+            " two\n"
+            "@@ -4,2 +5,2 @@\n"
+            " four\n"
+            "-five\n"
+            "+FIVE\n"
+        )
+        got = edit_file(self.working_dir, self.file_path, diff=diff)
+        self.assertTrue(got.startswith("Successfully edited"), got)
+        self.assertEqual("zero\none\ntwo\nthree\nfour\nFIVE\n", self.read_file())
+
+    def test_diff_mismatch(self):
+        diff = "@@ -1,1 +1,1 @@\n-uno\n+1\n"
+        got = edit_file(self.working_dir, self.file_path, diff=diff)
+        self.assertEqual(
+            'Error: Could not edit "pkg/edit-test.txt": hunk 1 does not match the '
+            "file. The file was not changed",
+            got,
+        )
+
+    def test_errors(self):
+        got = edit_file(self.working_dir, "/tmp/temp.txt", diff="")
+        self.assertEqual(
+            'Error: Cannot edit "/tmp/temp.txt" as it is outside the permitted working directory',
+            got,
+        )
+        got = edit_file(self.working_dir, self.file_path)
+        self.assertEqual("Error: Provide either edits or diff, but not both", got)
+
+    def test_no_temp_files_left(self):
+        edit_file(
+            self.working_dir, self.file_path, edits=[{"search": "x", "replace": ""}]
+        )
+        write_file(self.working_dir, self.file_path, "new", fsync=True)
+        leftovers = [n for n in os.listdir("calculator/pkg") if n.endswith(".tmp")]
+        self.assertEqual([], leftovers)
+        self.assertEqual("new", self.read_file())
+
+
+class TestWorkspace(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.outside = os.path.join(tmp_dir.name, "outside")
+        self.working_dir = os.path.join(tmp_dir.name, "work")
+        os.makedirs(os.path.join(self.outside, "secret"))
+        os.makedirs(self.working_dir)
+        with open(os.path.join(self.outside, "secret", "key.py"), "w") as fp:
+            fp.write("print('secret')\n")
+        os.symlink(
+            os.path.join(self.outside, "secret"), os.path.join(self.working_dir, "link")
+        )
+
+    def test_relative(self):
+        with Workspace(self.working_dir) as workspace:
+            self.assertEqual(".", workspace.relative(""))
+            self.assertEqual("a/c", workspace.relative("a/./b/../c"))
+            self.assertEqual("a", workspace.relative(os.path.join(workspace.root, "a")))
+            self.assertIsNone(workspace.relative("a/../../b"))
+            self.assertIsNone(workspace.relative("/etc/passwd"))
+
+    def test_session_workspace(self):
+        workspace = open_workspace(self.working_dir)
+        self.assertIs(workspace, open_workspace(self.working_dir))
+        self.assertIs(workspace, get_workspace(self.working_dir))
+        close_workspace(self.working_dir)
+        self.assertGreaterEqual(workspace.fd, 0)
+        close_workspace(self.working_dir)
+        self.assertEqual(-1, workspace.fd)
+        # Outside of a session, every call opens a workspace of its own
+        self.assertIsNot(
+            get_workspace(self.working_dir), get_workspace(self.working_dir)
+        )
+
+    def test_scripts_run_in_the_opened_directory(self):
+        with open(os.path.join(self.working_dir, "ls.py"), "w") as fp:
+            fp.write("import os\nprint(sorted(os.listdir()))\n")
+        open_workspace(self.working_dir)
+        self.addCleanup(close_workspace, self.working_dir)
+        # A directory swapped in under the same name is not where scripts run
+        moved = self.working_dir + "-moved"
+        os.rename(self.working_dir, moved)
+        os.makedirs(os.path.join(self.working_dir))
+        self.addCleanup(shutil.rmtree, moved)
+        got = run_python_file(self.working_dir, "ls.py")
+        self.assertEqual("STDOUT: ['link', 'ls.py']\n", got)
+
+    def test_symlinks_are_not_followed(self):
+        for got in (
+            get_file_content(self.working_dir, "link/key.py"),
+            edit_file(self.working_dir, "link/key.py", diff="-"),
+            run_python_file(self.working_dir, "link/key.py"),
+            get_files_info(self.working_dir, "link"),
+            search_files(self.working_dir, "secret", "link"),
+        ):
+            self.assertTrue(got.startswith("Error:"), got)
+            self.assertNotIn("secret'", got)
+        got = write_file(self.working_dir, "link/key.py", "pwned")
+        self.assertIn("Symbolic links are not followed", got)
+        with open(os.path.join(self.outside, "secret", "key.py")) as fp:
+            self.assertEqual("print('secret')\n", fp.read())
+
+        # The link itself is listed, but not as a directory
+        got = get_files_info(self.working_dir, recursive=True)
+        self.assertRegex(got, r"^- link: file_size=\d+ bytes, is_dir=False$")
+
+
 class TestRunFile(unittest.TestCase):
     def test_run_calc_main(self):
         got = run_python_file("calculator", "main.py")
-        want = 'STDOUT: Calculator App\nUsage: python main.py "<expression>"\nExample: python main.py "3 + 5"\n'
+        want = (
+            "STDOUT: Calculator App\n"
+            'Usage: python main.py "<expression>"\n'
+            'Example: python main.py "3 + 5"\n'
+            "Batch: python main.py --batch [FILE] (one expression per line)\n"
+            "Add --json to print results as JSON instead of boxes\n"
+        )
 
         self.assertEqual(got, want)
 
     def test_run_calc_tests(self):
         got = run_python_file("calculator", "tests.py")
 
-        want_parts = ["STDERR", "Ran 9 tests", "OK"]
+        want_parts = ["STDERR", "Ran 14 tests", "OK"]
         for want_part in want_parts:
             self.assertIn(want_part, got)
 
+    def test_run_calc_main_args(self):
+        got = run_python_file("calculator", "main.py", ["3 + 5"])
+        self.assertTrue(got.startswith("STDOUT: ┌"))
+        self.assertIn("│  8", got)
+
+    def test_run_calc_main_batch(self):
+        got = run_python_file_batch(
+            "calculator", "main.py", [["3 + 5"], ["2", "*", "4"], ["1 / 0"]]
+        )
+        runs = got.split("\nRun ")
+        self.assertEqual(3, len(runs))
+        self.assertTrue(runs[0].startswith("Run 1 (args: ['3 + 5']):\nSTDOUT: ┌"))
+        self.assertTrue(runs[1].startswith("2 (args: ['2', '*', '4']):\nSTDOUT: ┌"))
+        self.assertIn("│  8", runs[1])
+        self.assertIn("Error: float division by zero", runs[2])
+
+    def test_runs_in_working_directory(self):
+        with tempfile.TemporaryDirectory() as working_dir:
+            Path(working_dir, "data.txt").write_text("data")
+            Path(working_dir, "sub").mkdir()
+            Path(working_dir, "sub", "show.py").write_text(
+                "print(open('data.txt').read())\n"
+            )
+            got = run_python_file(working_dir, "sub/show.py")
+        self.assertEqual("STDOUT: data\n", got)
+
+    def test_run_calc_main_stream(self):
+        path = Path("calculator", "expressions.ndjson")
+        path.write_text('3 + 5\n\n{"id": "a", "expression": "1 / 0"}\n2 * 2.5\n')
+        self.addCleanup(path.unlink)
+        # Scripts run in the working directory
+        got = run_python_file(
+            "calculator", "main.py", ["--batch", "expressions.ndjson", "--json"]
+        )
+        want = [
+            {"expression": "3 + 5", "result": 8},
+            {"id": "a", "expression": "1 / 0", "error": "float division by zero"},
+            {"expression": "2 * 2.5", "result": 5},
+        ]
+        self.assertTrue(got.startswith("STDOUT: "))
+        lines = got.removeprefix("STDOUT: ").splitlines()
+        self.assertEqual(want, [json.loads(line) for line in lines])
+
+        got = run_python_file("calculator", "main.py", ["--batch", path.name])
+        self.assertEqual(2, got.count("┌"))
+        self.assertIn("Error: float division by zero", got)
+
+    def test_run_batch_outside_workdir(self):
+        got = run_python_file_batch("calculator", "../main.py", [[]])
+        want = 'Error: Cannot execute "../main.py" as it is outside the permitted working directory'
+        self.assertEqual(got, want)
+
     # Should error
     def test_run_agent_main(self):
         got = run_python_file("calculator", "../main.py")
@@ -131,5 +553,1147 @@ class TestRunFile(unittest.TestCase):
         self.assertEqual(got, want)
 
 
+class TestRunCache(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.working_dir = tmp_dir.name
+        os.mkdir(os.path.join(self.working_dir, "pkg"))
+        write_file(self.working_dir, "pkg/helper.py", "VALUE = 1\n")
+        write_file(
+            self.working_dir,
+            "main.py",
+            "import sys\nfrom pkg.helper import VALUE\nprint(VALUE, *sys.argv[1:])\n",
+        )
+        self.cache = RunCache()
+        run_python.use_run_cache(self.cache)
+        self.addCleanup(run_python.use_run_cache, None)
+
+    def test_imported_modules(self):
+        source = b"import a.b, c\nfrom ..d import e\nfrom f import *\ndef f():\n    from . import g\n"
+        self.assertEqual(
+            [
+                (0, "a.b", []),
+                (0, "c", []),
+                (2, "d", ["e"]),
+                (0, "f", []),
+                (1, "", ["g"]),
+            ],
+            imported_modules(source),
+        )
+
+    def test_cached_until_an_import_changes(self):
+        self.assertEqual("STDOUT: 1\n", run_python_file(self.working_dir, "main.py"))
+        self.assertEqual(
+            run_python.CACHED_RESULT_NOTE + "STDOUT: 1\n",
+            run_python_file(self.working_dir, "main.py"),
+        )
+        self.assertEqual(
+            "STDOUT: 1 x\n", run_python_file(self.working_dir, "main.py", ["x"])
+        )
+
+        write_file(self.working_dir, "pkg/helper.py", "VALUE = 2\n")
+        self.assertEqual("STDOUT: 2\n", run_python_file(self.working_dir, "main.py"))
+        self.assertEqual({"hits": 1, "misses": 3, "hit_rate": 0.25}, self.cache.stats())
+
+    def test_module_created_later(self):
+        write_file(self.working_dir, "other.py", "import extra\n")
+        self.assertIn(
+            "ModuleNotFoundError", run_python_file(self.working_dir, "other.py")
+        )
+        write_file(self.working_dir, "extra.py", "print('extra')\n")
+        self.assertEqual(
+            "STDOUT: extra\n", run_python_file(self.working_dir, "other.py")
+        )
+
+
+class TestOutputCapture(unittest.TestCase):
+    scratch_file = Path("calculator/pkg/scratch.py")
+
+    def tearDown(self):
+        self.scratch_file.unlink(missing_ok=True)
+
+    def test_short_output_is_kept(self):
+        buffer = BoundedBuffer(4, 4)
+        buffer.feed(b"abc")
+        buffer.feed(b"defg")
+        self.assertEqual(b"abcdefg", buffer.getvalue())
+        self.assertEqual(0, buffer.dropped)
+
+    def test_head_and_tail(self):
+        buffer = BoundedBuffer(4, 4)
+        for chunk in (b"012", b"3456789", b"abcdef"):
+            buffer.feed(chunk)
+        self.assertEqual(8, buffer.dropped)
+        self.assertEqual(b"0123\n...[8 bytes omitted]...\ncdef", buffer.getvalue())
+
+    def test_runaway_output(self):
+        self.scratch_file.write_text(
+            "import sys\nprint('start', flush=True)\nwhile True:\n    sys.stderr.write('y' * 1000)\n"
+        )
+        old_limits = run_python.OUTPUT_LIMITS
+        run_python.OUTPUT_LIMITS = OutputLimits(100, 10, max_bytes=100_000)
+        try:
+            got = run_python_file("calculator", "pkg/scratch.py")
+        finally:
+            run_python.OUTPUT_LIMITS = old_limits
+        self.assertTrue(got.startswith("STDOUT: start\nSTDERR: " + "y" * 100))
+        self.assertIn(" bytes omitted]...\nyyyyyyyyyyProcess killed", got)
+
+
+@unittest.skipUnless(worker_pool_supported(), "needs os.fork and socket.send_fds")
+class TestRunFileWorkerPool(unittest.TestCase):
+    scratch_file = Path("calculator/pkg/scratch.py")
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = PythonWorkerPool(2)
+        run_python.use_worker_pool(cls.pool)
+
+    @classmethod
+    def tearDownClass(cls):
+        run_python.use_worker_pool(None)
+        cls.pool.close()
+
+    def tearDown(self):
+        self.scratch_file.unlink(missing_ok=True)
+
+    def test_run_calc_main(self):
+        got = run_python_file("calculator", "main.py")
+        want = (
+            "STDOUT: Calculator App\n"
+            'Usage: python main.py "<expression>"\n'
+            'Example: python main.py "3 + 5"\n'
+            "Batch: python main.py --batch [FILE] (one expression per line)\n"
+            "Add --json to print results as JSON instead of boxes\n"
+        )
+        self.assertEqual(got, want)
+
+    def test_run_calc_tests(self):
+        got = run_python_file("calculator", "tests.py")
+        for want_part in ["STDERR", "Ran 14 tests", "OK"]:
+            self.assertIn(want_part, got)
+
+    def test_exit_code(self):
+        self.scratch_file.write_text("import sys\nprint('bye')\nsys.exit(3)\n")
+        got = run_python_file("calculator", "pkg/scratch.py")
+        self.assertEqual("STDOUT: bye\nProcess exited with code 3 ", got)
+
+    def test_uncaught_exception(self):
+        self.scratch_file.write_text("raise ValueError('boom')\n")
+        got = run_python_file("calculator", "pkg/scratch.py")
+        self.assertIn("ValueError: boom", got)
+        self.assertIn("Process exited with code 1", got)
+
+    def test_timeout(self):
+        self.scratch_file.write_text("import time\ntime.sleep(10)\n")
+        old_timeout = run_python.TIMEOUT
+        run_python.TIMEOUT = 0.2
+        try:
+            got = run_python_file("calculator", "pkg/scratch.py")
+        finally:
+            run_python.TIMEOUT = old_timeout
+        self.assertEqual(
+            'Error: executing Python file: "pkg/scratch.py" timed out after 0.2 seconds',
+            got,
+        )
+        # The worker that ran the script is still usable afterwards
+        self.assertIn("Calculator App", run_python_file("calculator", "main.py"))
+
+    def test_runaway_output(self):
+        self.scratch_file.write_text("while True:\n    print('x' * 1000)\n")
+        old_limits = run_python.OUTPUT_LIMITS
+        run_python.OUTPUT_LIMITS = OutputLimits(100, 100, max_bytes=100_000)
+        try:
+            got = run_python_file("calculator", "pkg/scratch.py")
+        finally:
+            run_python.OUTPUT_LIMITS = old_limits
+        self.assertTrue(got.startswith("STDOUT: " + "x" * 100 + "\n...["))
+        self.assertTrue(
+            got.endswith("Process killed after printing more than 100000 bytes ")
+        )
+        self.assertLess(len(got), 400)
+        self.assertIn("Calculator App", run_python_file("calculator", "main.py"))
+
+
+class TestWorkerPoolRecovery(unittest.TestCase):
+    def test_failed_replacement_keeps_the_slot(self):
+        with PythonWorkerPool(1) as pool:
+            worker = pool._idle.queue[0]
+            worker.proc.kill()
+            worker.proc.wait()
+            old_executable = python_worker_pool.PYTHON_EXECUTABLE
+            python_worker_pool.PYTHON_EXECUTABLE = "/nonexistent/python"
+            try:
+                with self.assertRaises(OSError):
+                    pool.run(["calculator/main.py"], 10)
+            finally:
+                python_worker_pool.PYTHON_EXECUTABLE = old_executable
+            result = pool.run(["calculator/main.py"], 10)
+        self.assertIn(b"Calculator App", result.stdout)
+
+
+class TestConcurrentDispatch(unittest.TestCase):
+    def function_call(self, name: str, **args) -> types.FunctionCall:
+        return types.FunctionCall(name=name, args=args)
+
+    def test_footprints(self):
+        got = [
+            call_footprint(self.function_call("get_files_info")),
+            call_footprint(
+                self.function_call("get_file_content", file_path="/main.py")
+            ),
+            call_footprint(self.function_call("write_file", file_path="pkg/x.txt")),
+            call_footprint(self.function_call("run_python_file", file_path="pkg/a.py")),
+        ]
+        want = [
+            (".", "read"),
+            ("main.py", "read"),
+            ("pkg/x.txt", "write"),
+            ("pkg", "exec"),
+        ]
+        self.assertEqual(got, want)
+
+    def test_results_in_call_order(self):
+        function_calls = [
+            self.function_call("run_python_file", file_path="main.py"),
+            self.function_call("get_file_content", file_path="main.py"),
+            self.function_call("get_files_info", directory="pkg"),
+        ]
+        with contextlib.redirect_stdout(io.StringIO()):
+            got = call_functions_concurrently(function_calls)
+        self.assertEqual(
+            [fc.name for fc in function_calls],
+            [content.parts[0].function_response.name for content in got],
+        )
+        self.assertIn("Usage:", got[0].parts[0].function_response.response["result"])
+        self.assertIn(
+            "calculator.py", got[2].parts[0].function_response.response["result"]
+        )
+
+    def test_write_then_read_same_file(self):
+        function_calls = [
+            self.function_call(
+                "write_file", file_path="pkg/morelorem.txt", content="lorem ipsum"
+            ),
+            self.function_call("get_file_content", file_path="pkg/morelorem.txt"),
+        ]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                got = call_functions_concurrently(function_calls)
+        finally:
+            Path("calculator/pkg/morelorem.txt").unlink(missing_ok=True)
+        self.assertEqual(
+            "lorem ipsum", got[1].parts[0].function_response.response["result"]
+        )
+
+
+class TestToolResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.file_path = Path(self.tmp_dir.name, "a.txt")
+        self.file_path.write_text("first")
+        self.calls = 0
+
+    def counting(self, func):
+        def wrapper(**kwargs):
+            self.calls += 1
+            return func(**kwargs)
+
+        return wrapper
+
+    def read(self, cache: ToolResultCache) -> str:
+        return cache.call(
+            self.counting(get_file_content),
+            "get_file_content",
+            {"working_directory": self.tmp_dir.name, "file_path": "a.txt"},
+        )
+
+    def list_dir(self, cache: ToolResultCache) -> str:
+        return cache.call(
+            self.counting(get_files_info),
+            "get_files_info",
+            {"working_directory": self.tmp_dir.name, "directory": "."},
+        )
+
+    def test_repeated_read_is_cached(self):
+        cache = ToolResultCache()
+        self.assertEqual("first", self.read(cache))
+        self.assertEqual("first", self.read(cache))
+        self.assertEqual(1, self.calls)
+        self.assertEqual({"hits": 1, "misses": 1, "hit_rate": 0.5}, cache.stats())
+
+    def test_changed_file_is_reread(self):
+        cache = ToolResultCache()
+        self.read(cache)
+        self.file_path.write_text("second!")
+        self.assertEqual("second!", self.read(cache))
+        self.assertEqual(2, self.calls)
+
+    def test_write_invalidates_listing(self):
+        cache = ToolResultCache()
+        self.list_dir(cache)
+        self.list_dir(cache)
+        self.assertEqual(1, self.calls)
+        cache.invalidate(self.tmp_dir.name, "a.txt")
+        self.list_dir(cache)
+        self.assertEqual(2, self.calls)
+
+    def test_errors_are_not_cached(self):
+        cache = ToolResultCache()
+        args = {"working_directory": self.tmp_dir.name, "file_path": "missing.txt"}
+        for _ in range(2):
+            cache.call(self.counting(get_file_content), "get_file_content", args)
+        self.assertEqual(2, self.calls)
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.working_dir = tmp_dir.name
+        for name, content in {
+            "a.py": "A = 1\n",
+            "b.py": "B = 2\n",
+            "big.py": "#" * 20000,
+            "notes.txt": "notes\n",
+            "sub/c.py": "C = 3\n",
+        }.items():
+            path = Path(self.working_dir, name)
+            path.parent.mkdir(exist_ok=True)
+            path.write_text(content)
+        self.cache = ToolResultCache()
+        self.prefetcher = Prefetcher(self.cache)
+        self.addCleanup(self.prefetcher.close)
+
+    def read(self, file_path: str) -> str:
+        return self.cache.call(
+            get_file_content,
+            "get_file_content",
+            {"working_directory": self.working_dir, "file_path": file_path},
+        )
+
+    def test_listing_prefetches_small_source_files(self):
+        self.prefetcher.after_listing(self.working_dir, ".")
+        self.prefetcher.drain()
+        self.assertEqual("A = 1\n", self.read("a.py"))
+        self.assertEqual("A = 1\n", self.read("./a.py"))
+        self.read("sub/c.py")
+        self.assertEqual(
+            {
+                "prefetched": 2,
+                "hits": 1,
+                "dropped": 0,
+                "skipped": 0,
+                "hit_ratio": 0.5,
+                "waste_ratio": 0.5,
+            },
+            self.prefetcher.stats(),
+        )
+        self.assertEqual(
+            {"hits": 2, "misses": 1, "hit_rate": 2 / 3}, self.cache.stats()
+        )
+
+    def test_write_drops_prefetched_entry(self):
+        self.prefetcher.after_listing(self.working_dir, ".")
+        self.prefetcher.drain()
+        Path(self.working_dir, "b.py").write_text("B = 3\n")
+        self.cache.invalidate(self.working_dir, "b.py")
+        self.assertEqual("B = 3\n", self.read("b.py"))
+        stats = self.prefetcher.stats()
+        self.assertEqual((0, 1), (stats["hits"], stats["dropped"]))
+
+    def test_budget(self):
+        # One thread, so the files are prefetched in name order
+        self.prefetcher.close()
+        self.prefetcher = Prefetcher(self.cache, max_workers=1, budget_bytes=8)
+        self.prefetcher.after_listing(self.working_dir, ".")
+        self.prefetcher.drain()
+        self.assertEqual((1, 1), (self.prefetcher.prefetched, self.prefetcher.skipped))
+        # Reading the prefetched file frees its share of the budget
+        self.read("a.py")
+        self.prefetcher.after_listing(self.working_dir, ".")
+        self.prefetcher.drain()
+        self.assertEqual(2, self.prefetcher.prefetched)
+
+    def test_call_function_prefetches_after_listing(self):
+        call = types.FunctionCall(name="get_files_info", args={"directory": "sub"})
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_function(call, cache=self.cache, working_directory=self.working_dir)
+        self.prefetcher.drain()
+        self.assertEqual("C = 3\n", self.read("sub/c.py"))
+        self.assertEqual(1, self.prefetcher.hits)
+
+
+class TestCompaction(unittest.TestCase):
+    def turn(self, name: str, result: str, **args) -> list[types.Content]:
+        call = types.FunctionCall(name=name, args=args)
+        return [
+            types.Content(role="model", parts=[types.Part(function_call=call)]),
+            types.Content(
+                role="tool",
+                parts=[
+                    types.Part.from_function_response(
+                        name=name, response={"result": result}
+                    )
+                ],
+            ),
+        ]
+
+    def result(self, content: types.Content) -> str:
+        return content.parts[0].function_response.response["result"]
+
+    def messages(self) -> list[types.Content]:
+        return [
+            types.Content(role="user", parts=[types.Part(text="fix it")]),
+            *self.turn("get_file_content", "a" * 5000, file_path="main.py"),
+            *self.turn("get_file_content", "b" * 5000, file_path="pkg/render.py"),
+            *self.turn(
+                "write_file", "Successfully wrote", file_path="main.py", content="x"
+            ),
+            *self.turn("get_file_content", "c" * 5000, file_path="tests.py"),
+        ]
+
+    def test_obsolete_read_is_dropped(self):
+        messages = self.messages()
+        got, stats = compact_messages(messages)
+        self.assertTrue(self.result(got[2]).startswith("[Compacted get_file_content"))
+        self.assertEqual("b" * 5000, self.result(got[4]))
+        self.assertEqual("a" * 5000, self.result(messages[2]))
+        self.assertEqual(1, stats.compacted_results)
+        self.assertGreater(stats.bytes_saved, 4000)
+
+    def test_token_budget(self):
+        got, stats = compact_messages(self.messages(), token_budget=100)
+        self.assertTrue(self.result(got[4]).startswith("[Compacted get_file_content"))
+        self.assertEqual("c" * 5000, self.result(got[8]))
+        self.assertEqual(2, stats.compacted_results)
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_percentile(self):
+        self.assertEqual(0.0, percentile([], 50))
+        self.assertEqual(3.0, percentile([5.0, 1.0, 3.0], 50))
+        self.assertAlmostEqual(4.8, percentile([5.0, 1.0, 3.0], 95))
+
+    def test_summary(self):
+        telemetry = SessionTelemetry(token_counter=lambda contents: 42)
+        for it, latency in enumerate([1.0, 2.0, 3.0]):
+            telemetry.record_model_call(
+                it,
+                latency,
+                types.GenerateContentResponseUsageMetadata(
+                    prompt_token_count=100, candidates_token_count=10
+                ),
+                request_bytes=400,
+                response_bytes=40,
+                estimated_prompt_tokens=telemetry.estimate_prompt_tokens([]),
+            )
+        telemetry.record_tool_call("get_file_content", 0.5, 1000)
+
+        summary = telemetry.summary()
+        self.assertEqual(300, summary["model"]["prompt_tokens"])
+        self.assertEqual(0, summary["model"]["cached_tokens"])
+        self.assertEqual(2.0, summary["model"]["latency_s"]["p50"])
+        self.assertEqual(42, summary["iterations"][0]["estimated_prompt_tokens"])
+        self.assertEqual(1, summary["tools"]["by_name"]["get_file_content"]["calls"])
+
+
+class TestStreamingAgentLoop(unittest.TestCase):
+    def chunk(self, *parts: types.Part) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(content=types.Content(role="model", parts=list(parts)))
+            ]
+        )
+
+    def fake_client(self, turns: list[list[types.GenerateContentResponse]]):
+        turns = iter(turns)
+
+        async def generate_content_stream(**kwargs):
+            chunks = next(turns)
+
+            async def stream():
+                for chunk in chunks:
+                    yield chunk
+
+            return stream()
+
+        return SimpleNamespace(
+            aio=SimpleNamespace(
+                models=SimpleNamespace(generate_content_stream=generate_content_stream)
+            )
+        )
+
+    def test_stream_with_function_calls(self):
+        list_call = types.FunctionCall(name="get_files_info", args={"directory": "pkg"})
+        read_call = types.FunctionCall(
+            name="get_file_content", args={"file_path": "main.py"}
+        )
+        client = self.fake_client(
+            [
+                [
+                    self.chunk(types.Part(text="Let me ")),
+                    self.chunk(types.Part(text="look.")),
+                    self.chunk(types.Part(function_call=list_call)),
+                    self.chunk(types.Part(function_call=read_call)),
+                ],
+                [self.chunk(types.Part(text="It's a calculator."))],
+            ]
+        )
+        args = main.parse_args(["--concurrent-tools", "what?"])
+        messages = [types.Content(role="user", parts=[types.Part(text="what?")])]
+        telemetry = SessionTelemetry()
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            reached_max_iter = asyncio.run(
+                main.run_agent_stream(
+                    client, "model", messages, None, args, telemetry=telemetry
+                )
+            )
+
+        self.assertFalse(reached_max_iter)
+        self.assertIn("Response: Let me look.", out.getvalue())
+        self.assertIn("Response: It's a calculator.", out.getvalue())
+        self.assertEqual(
+            ["user", "model", "tool", "tool", "model"], [m.role for m in messages]
+        )
+        self.assertEqual("Let me look.", messages[1].parts[0].text)
+        self.assertEqual(
+            ["get_files_info", "get_file_content"],
+            [m.parts[0].function_response.name for m in messages[2:4]],
+        )
+        summary = telemetry.summary()
+        self.assertEqual(2, summary["model"]["calls"])
+        self.assertEqual(2, summary["tools"]["calls"])
+        self.assertEqual(
+            ["get_file_content", "get_files_info"], list(summary["tools"]["by_name"])
+        )
+
+    def test_stream_keeps_thoughts_apart(self):
+        client = self.fake_client(
+            [
+                [
+                    self.chunk(types.Part(text="Thinking...", thought=True)),
+                    self.chunk(types.Part(text="Answer")),
+                    self.chunk(types.Part(text=" here.")),
+                    self.chunk(
+                        types.Part(
+                            text=" Clip.",
+                            video_metadata=types.VideoMetadata(start_offset="1s"),
+                        )
+                    ),
+                ]
+            ]
+        )
+        args = main.parse_args(["what?"])
+        messages = [types.Content(role="user", parts=[types.Part(text="what?")])]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(main.run_agent_stream(client, "model", messages, None, args))
+
+        parts = messages[1].parts
+        self.assertEqual(
+            ["Thinking...", "Answer here.", " Clip."], [p.text for p in parts]
+        )
+        self.assertEqual([True, None, None], [p.thought for p in parts])
+        self.assertEqual("1s", parts[2].video_metadata.start_offset)
+
+
+class TestRetry(unittest.TestCase):
+    class Clock:
+        def __init__(self):
+            self.now = 0.0
+            self.sleeps: list[float] = []
+
+        def __call__(self) -> float:
+            return self.now
+
+        def sleep(self, seconds: float):
+            self.sleeps.append(seconds)
+            self.now += seconds
+
+    def setUp(self):
+        self.clock = self.Clock()
+
+    def api_error(self, code: int, headers: dict | None = None, details=None):
+        response = httpx.Response(code, headers=headers or {})
+        return errors.APIError(code, {"error": {"details": details or []}}, response)
+
+    def response(self, total_tokens: int = 0) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                total_token_count=total_tokens
+            )
+        )
+
+    def fake_models(self, outcomes: list):
+        calls = []
+
+        def generate_content(**kwargs):
+            calls.append(kwargs)
+            outcome = outcomes[len(calls) - 1]
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        return SimpleNamespace(generate_content=generate_content), calls
+
+    def retrying(self, models, policy=None, limiter=None) -> RetryingModels:
+        return RetryingModels(
+            models, policy, limiter, self.clock.sleep, self.clock, random.Random(0)
+        )
+
+    def test_retries_transient_errors(self):
+        models, calls = self.fake_models(
+            [self.api_error(503), httpx.ConnectError("reset"), self.response()]
+        )
+        retrying = self.retrying(models, RetryPolicy(base_delay=1, deadline=60))
+        response = retrying.generate_content(model="m", contents=[], config=None)
+
+        self.assertIsInstance(response, types.GenerateContentResponse)
+        self.assertEqual(3, len(calls))
+        self.assertEqual(2, retrying.retries)
+        self.assertLessEqual(self.clock.sleeps[0], 1)
+        self.assertLessEqual(self.clock.sleeps[1], 2)
+        # Every attempt gets the time left until the deadline as its timeout
+        timeouts = [call["config"].http_options.timeout for call in calls]
+        self.assertEqual(60000, timeouts[0])
+        self.assertGreater(timeouts[0], timeouts[2])
+
+    def test_honours_retry_after(self):
+        models, calls = self.fake_models(
+            [self.api_error(429, {"Retry-After": "7"}), self.response()]
+        )
+        limiter = RateLimiter(clock=self.clock)
+        self.retrying(models, limiter=limiter).generate_content(model="m", contents=[])
+        self.assertGreaterEqual(self.clock.sleeps[0], 7)
+        self.assertEqual(2, len(calls))
+
+        error = self.api_error(
+            429, details=[{"@type": "RetryInfo", "retryDelay": "17s"}]
+        )
+        self.assertEqual(17, retry_after(error))
+
+    def test_gives_up(self):
+        models, calls = self.fake_models([self.api_error(400)])
+        with self.assertRaises(errors.APIError):
+            self.retrying(models).generate_content(model="m", contents=[])
+        self.assertEqual(1, len(calls))
+
+        models, calls = self.fake_models([self.api_error(500)] * 3)
+        with self.assertRaises(errors.APIError):
+            self.retrying(models, RetryPolicy(max_retries=2)).generate_content(
+                model="m", contents=[]
+            )
+        self.assertEqual(3, len(calls))
+
+        # A backoff that would run past the deadline ends the call early
+        models, calls = self.fake_models([self.api_error(500)] * 6)
+        policy = RetryPolicy(base_delay=10, max_delay=10, deadline=15)
+        with self.assertRaises(errors.APIError):
+            self.retrying(models, policy).generate_content(model="m", contents=[])
+        self.assertLessEqual(self.clock.now, 15)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(
+            requests_per_minute=60, tokens_per_minute=600, clock=self.clock
+        )
+        self.assertEqual(0, limiter.reserve(100))
+        # 500 tokens are left, so the next 600 token request needs 100 more tokens
+        self.assertAlmostEqual(10, limiter.reserve(600))
+        limiter.adjust(-600)
+        self.assertEqual(0, limiter.reserve(0))
+        limiter.pause(3)
+        self.assertEqual(3, limiter.reserve(0))
+
+    def test_idle_limiter_charges_full_requests(self):
+        limiter = RateLimiter(tokens_per_minute=6000, clock=self.clock)
+        self.clock.sleep(60)
+        self.assertEqual(0, limiter.reserve(6000))
+        self.assertAlmostEqual(60, limiter.reserve(6000))
+
+        limiter = RateLimiter(requests_per_minute=60, clock=self.clock)
+        self.clock.sleep(60)
+        waits = [limiter.reserve(0) for _ in range(61)]
+        self.assertEqual([0] * 60, waits[:60])
+        self.assertAlmostEqual(1, waits[60])
+
+    def test_limiter_slows_down_calls(self):
+        models, calls = self.fake_models([self.response(100)] * 4)
+        limiter = RateLimiter(requests_per_minute=2, clock=self.clock)
+        retrying = self.retrying(models, limiter=limiter)
+        for _ in range(4):
+            retrying.generate_content(model="m", contents=[])
+        self.assertEqual(4, len(calls))
+        self.assertAlmostEqual(60, self.clock.now)
+
+    def test_async_stream_retries(self):
+        attempts = []
+
+        async def chunks():
+            yield types.GenerateContentResponse()
+            yield self.response(600)
+
+        async def generate_content_stream(**kwargs):
+            attempts.append(kwargs)
+            if len(attempts) == 1:
+                raise self.api_error(503)
+            return chunks()
+
+        async def sleep(seconds):
+            self.clock.sleep(seconds)
+
+        async def consume(stream) -> list:
+            return [chunk async for chunk in await stream]
+
+        limiter = RateLimiter(tokens_per_minute=600, clock=self.clock)
+        retrying = AsyncRetryingModels(
+            SimpleNamespace(generate_content_stream=generate_content_stream),
+            limiter=limiter,
+            sleep=sleep,
+            clock=self.clock,
+            rng=random.Random(0),
+        )
+        got = asyncio.run(
+            consume(retrying.generate_content_stream(model="m", contents=[]))
+        )
+        self.assertEqual(2, len(got))
+        self.assertEqual(2, len(attempts))
+        # The 600 tokens used, not the estimate of 0, were taken from the bucket
+        self.assertAlmostEqual(60, limiter.reserve(600))
+
+
+class TestSessionJournal(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "session.jsonl")
+
+    def response(self, *parts: types.Part) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(content=types.Content(role="model", parts=list(parts)))
+            ]
+        )
+
+    def fake_models(self, responses: list):
+        calls = []
+
+        def generate_content(**kwargs):
+            calls.append(kwargs)
+            response = responses[len(calls) - 1]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        return SimpleNamespace(generate_content=generate_content), calls
+
+    def test_crash_and_resume(self):
+        list_call = types.FunctionCall(name="get_files_info", args={"directory": "pkg"})
+        models, calls = self.fake_models(
+            [
+                self.response(types.Part(function_call=list_call)),
+                ConnectionError("transient"),
+            ]
+        )
+        args = main.parse_args(["--journal", self.path, "what?"])
+        messages = [types.Content(role="user", parts=[types.Part(text="what?")])]
+        with (
+            SessionJournal(self.path) as journal,
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            journal.record_prompt("what?", "model")
+            with self.assertRaises(ConnectionError):
+                main.run_agent(models, "model", messages, None, args, journal=journal)
+
+        session = SessionJournal.load(self.path)
+        self.assertEqual("what?", session.prompt)
+        self.assertEqual(1, session.iterations)
+        self.assertEqual([], session.pending_calls)
+        self.assertFalse(session.finished)
+        self.assertEqual(["user", "model", "tool"], [m.role for m in session.messages])
+        self.assertEqual(messages[2].model_dump(), session.messages[2].model_dump())
+
+        models, calls = self.fake_models([self.response(types.Part(text="Done."))])
+        args = main.parse_args(["--journal", self.path, "--resume"])
+        args.prompt = [session.prompt]
+        out = io.StringIO()
+        with (
+            SessionJournal(self.path, append=True) as journal,
+            contextlib.redirect_stdout(out),
+        ):
+            main.run_agent(
+                models,
+                "model",
+                session.messages,
+                None,
+                args,
+                journal=journal,
+                start_iteration=session.iterations,
+            )
+        self.assertEqual(1, len(calls))
+        self.assertEqual(
+            ["user", "model", "tool", "model"], [m.role for m in session.messages]
+        )
+        self.assertIn("Response: Done.", out.getvalue())
+        self.assertTrue(SessionJournal.load(self.path).finished)
+
+    def test_pending_calls_and_torn_record(self):
+        call = types.FunctionCall(name="get_files_info", args={})
+        with SessionJournal(self.path) as journal:
+            journal.record_prompt("what?", "model")
+            journal.record_model(
+                0,
+                [types.Content(role="model", parts=[types.Part(function_call=call)])],
+            )
+        with open(self.path, "a") as fp:
+            fp.write('{"type":"tools","iter')
+
+        session = SessionJournal.load(self.path)
+        self.assertEqual(1, session.iterations)
+        self.assertEqual(["get_files_info"], [c.name for c in session.pending_calls])
+        with open(self.path) as fp:
+            self.assertTrue(fp.read().endswith("}\n"))
+
+    def test_invalid_journal(self):
+        with open(self.path, "w") as fp:
+            fp.write('{"type":"model"}\n')
+        with self.assertRaises(JournalError):
+            SessionJournal.load(self.path)
+
+    def test_resume_needs_journal(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main.parse_args(["--resume"])
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def fake_models(self):
+        """Each session writes a file named after its prompt, then answers."""
+
+        def generate_content(*, model, contents, config=None):
+            prompt = contents[0].parts[0].text
+            if len(contents) == 1:
+                call = types.FunctionCall(
+                    name="write_file",
+                    args={"file_path": f"{prompt}.txt", "content": prompt},
+                )
+                part = types.Part(function_call=call)
+            else:
+                part = types.Part(text=f"wrote {prompt}")
+            return types.GenerateContentResponse(
+                candidates=[
+                    types.Candidate(content=types.Content(role="model", parts=[part]))
+                ]
+            )
+
+        return SimpleNamespace(generate_content=generate_content)
+
+    def test_run_batch(self):
+        input_path = os.path.join(self.tmp_dir, "prompts.jsonl")
+        with open(input_path, "w") as fp:
+            fp.write('{"id": "a", "prompt": "alpha"}\n\n')
+            fp.write('{"request_id": "b", "title": "beta"}\n')
+            fp.write('{"prompt": "gamma"}\n')
+            fp.write("not json\n")
+            fp.write('{"id": "c"}\n')
+        batch_args, session_argv, _ = batch.parse_args(
+            [input_path, "-j", "2", "--sandbox-root", self.tmp_dir, "--", "-c"]
+        )
+
+        output = io.StringIO()
+        with (
+            contextlib.redirect_stdout(io.StringIO()),
+            contextlib.redirect_stderr(io.StringIO()),
+        ):
+            total, failed = batch.run_batch(
+                batch.read_prompts(input_path),
+                self.fake_models(),
+                session_argv,
+                batch_args,
+                output,
+            )
+
+        self.assertEqual((5, 2), (total, failed))
+        results = {r["id"]: r for r in map(json.loads, output.getvalue().splitlines())}
+        self.assertEqual({"a", "b", "4", "5", "c"}, set(results))
+        self.assertTrue(results["5"]["error"].startswith(f"{input_path}:5: "))
+        self.assertEqual(f"{input_path}:6: no prompt in record", results["c"]["error"])
+        self.assertEqual("wrote beta", results["b"]["response"])
+        self.assertEqual(2, results["a"]["iterations"])
+        self.assertEqual(2, results["a"]["telemetry"]["model"]["calls"])
+        self.assertEqual(1, results["a"]["telemetry"]["tools"]["calls"])
+        # Sessions wrote to their own sandboxes, which are gone afterwards
+        self.assertFalse(Path("calculator/alpha.txt").exists())
+        self.assertEqual(["prompts.jsonl"], os.listdir(self.tmp_dir))
+
+    def test_session_options(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            batch.parse_args(["prompts.jsonl", "--", "--journal", "x.jsonl"])
+
+
+@unittest.skipUnless(hasattr(socket, "send_fds"), "needs socket.send_fds")
+class TestAgentServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.socket_path = os.path.join(cls.tmp_dir.name, "agent.sock")
+        cls.server = subprocess.Popen(
+            [sys.executable, "server.py", "--socket", cls.socket_path],
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while not os.path.exists(cls.socket_path):
+            if time.monotonic() > deadline or cls.server.poll() is not None:
+                raise RuntimeError("Agent server did not start")
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        cls.tmp_dir.cleanup()
+
+    def run_client(self, *argv: str) -> subprocess.CompletedProcess:
+        env = {**os.environ, "AGENT_SOCKET": self.socket_path}
+        return subprocess.run(
+            [sys.executable, "client.py", *argv],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=30,
+            check=False,
+        )
+
+    def test_session_output_and_exit_code(self):
+        cache_dir = os.path.join(self.tmp_dir.name, "cache")
+        got = self.run_client("--offline", "--response-cache", cache_dir, "hi")
+        self.assertEqual(0, got.returncode)
+        self.assertIn("Error running program: No cached response", got.stdout)
+
+        got = self.run_client("--no-such-option")
+        self.assertEqual(2, got.returncode)
+        self.assertIn("unrecognized arguments: --no-such-option", got.stderr)
+
+    def test_concurrent_sessions(self):
+        clients = [
+            subprocess.Popen(
+                [sys.executable, "client.py", "--help"],
+                stdout=subprocess.PIPE,
+                env={**os.environ, "AGENT_SOCKET": self.socket_path},
+            )
+            for _ in range(4)
+        ]
+        for proc in clients:
+            stdout, _ = proc.communicate(timeout=30)
+            self.assertEqual(0, proc.returncode)
+            self.assertIn(b"usage: example_ai_agent", stdout)
+
+    def test_main_runs_on_server(self):
+        code = "import client, sys; print(client.run_on_server(sys.argv[1:]))"
+        env = {**os.environ, "AGENT_SOCKET": self.socket_path}
+        for no_server, want in (("", "0"), ("1", "None")):
+            got = subprocess.run(
+                [sys.executable, "-c", code, "--help"],
+                capture_output=True,
+                text=True,
+                env={**env, "AGENT_NO_SERVER": no_server},
+                timeout=30,
+                check=True,
+            )
+            self.assertEqual(want, got.stdout.splitlines()[-1])
+            self.assertEqual(want == "0", "usage: example_ai_agent" in got.stdout)
+
+        got = subprocess.run(
+            [sys.executable, "main.py", "--no-such-option"],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=30,
+            check=False,
+        )
+        self.assertEqual(2, got.returncode)
+        self.assertIn("unrecognized arguments: --no-such-option", got.stderr)
+
+    def test_socket_is_private(self):
+        self.assertEqual(0o600, os.stat(self.socket_path).st_mode & 0o777)
+
+    def test_socket_in_shared_directory_is_not_used(self):
+        shared_dir = os.path.join(self.tmp_dir.name, "shared")
+        os.mkdir(shared_dir)
+        os.chmod(shared_dir, 0o755)
+        socket_path = os.path.join(shared_dir, "agent.sock")
+        os.link(self.socket_path, socket_path)
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            self.assertIsNone(client.connect(socket_path))
+        self.assertIn("is not a private directory", stderr.getvalue())
+
+        sock = client.connect(self.socket_path)
+        self.assertIsNotNone(sock)
+        sock.close()
+
+    def test_request_only_carries_session_env(self):
+        for name in ("AGENT_TEST_SETTING", "UNRELATED_SECRET"):
+            os.environ[name] = "value"
+            self.addCleanup(os.environ.pop, name)
+        left, right = socket.socketpair()
+        with left, right:
+            send_request(left, ["hi"])
+            request, fds = recv_request(right)
+        for fd in fds:
+            os.close(fd)
+        self.assertEqual(["hi"], request["argv"])
+        self.assertEqual("value", request["env"]["AGENT_TEST_SETTING"])
+        self.assertNotIn("UNRELATED_SECRET", request["env"])
+
+
+class TestStartup(unittest.TestCase):
+    def test_parsing_args_does_not_import_sdk(self):
+        code = (
+            "import sys, main; main.parse_args(['hello']); "
+            "print(any(m.startswith('google.genai') for m in sys.modules))"
+        )
+        proc = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual("False", proc.stdout.strip())
+
+    def test_summarize_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       300 |        300 |   pydantic.types\n"
+            "import time:      1200 |       1500 | pydantic\n"
+            "import time:       500 |        500 | google.genai.types"
+        )
+        timings = parse_importtime(output)
+        self.assertEqual(
+            ["pydantic.types", "pydantic", "google.genai.types"],
+            [t.name for t in timings],
+        )
+        self.assertEqual([1, 0, 0], [t.depth for t in timings])
+        report = summarize(timings, 0.5)
+        self.assertIn("500 ms wall time, 2 ms in 3 imports", report)
+        self.assertRegex(report, r"pydantic\s+1\.5\s+75\.0%")
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_main_with_scripted_client(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        client = ScriptedClient(bench.AGENT_SCRIPT)
+        argv = ["--working-directory", tmp_dir.name, "check"]
+        for options in ([], ["--stream"]):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                main.main([*options, *argv], model_client=client)
+            self.assertIn("Response: The calculator works.", out.getvalue())
+        self.assertEqual(2 * len(bench.AGENT_SCRIPT), client.models.calls)
+        self.assertTrue(os.path.exists(os.path.join(tmp_dir.name, "notes.txt")))
+
+    def test_compare(self):
+        baseline = {"a": {"min_s": 1.0}, "b": {"min_s": 1.0}}
+        results = {"a": {"min_s": 1.2}, "b": {"min_s": 1.3}, "c": {"min_s": 9.0}}
+        self.assertEqual(["b"], bench.compare(results, baseline, 0.25))
+
+    def test_benchmarks_run(self):
+        for name in ("calculator/short", "workspace/relative/deep"):
+            result = bench.run_benchmark(name, repeat=2)
+            self.assertGreater(result["min_s"], 0)
+            self.assertLessEqual(result["min_s"], result["median_s"])
+
+    def test_missing_baseline_fails(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            baseline = os.path.join(tmp_dir, "baseline.json")
+            argv = ["calculator/short", "--repeat", "1", "--baseline", baseline]
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                self.assertEqual(1, bench.bench_main(argv))
+                self.assertEqual(0, bench.bench_main([*argv, "--update-baseline"]))
+            self.assertIn("No baseline", stderr.getvalue())
+            with (
+                contextlib.redirect_stdout(io.StringIO()),
+                contextlib.redirect_stderr(io.StringIO()),
+            ):
+                self.assertEqual(0, bench.bench_main([*argv, "--tolerance", "1000"]))
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def response(self, text: str) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(
+                    content=types.Content(role="model", parts=[types.Part(text=text)])
+                )
+            ]
+        )
+
+    def messages(self, text: str) -> list[types.Content]:
+        return [types.Content(role="user", parts=[types.Part(text=text)])]
+
+    def test_key_depends_on_request(self):
+        config = types.GenerateContentConfig(system_instruction="be helpful")
+        key = cache_key("model", self.messages("hi"), config)
+        self.assertEqual(key, cache_key("model", self.messages("hi"), config))
+        self.assertNotEqual(key, cache_key("other", self.messages("hi"), config))
+        self.assertNotEqual(key, cache_key("model", self.messages("bye"), config))
+        self.assertNotEqual(key, cache_key("model", self.messages("hi"), None))
+
+    def test_round_trip(self):
+        cache = ResponseCache(self.tmp_dir.name)
+        self.assertIsNone(cache.get("abc"))
+        cache.put("abc", self.response("cached"))
+        self.assertEqual("cached", cache.get("abc").text)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_evicts_least_recently_used(self):
+        cache = ResponseCache(self.tmp_dir.name, max_bytes=10**6)
+        cache.put("old", self.response("old"))
+        cache.put("new", self.response("new"))
+        entry_size = Path(self.tmp_dir.name, "old.json").stat().st_size
+        os.utime(Path(self.tmp_dir.name, "old.json"), ns=(0, 0))
+
+        cache.max_bytes = entry_size * 2
+        cache.put("newest", self.response("newest"))
+        self.assertIsNone(cache.get("old"))
+        self.assertEqual("newest", cache.get("newest").text)
+
+    def test_cached_models(self):
+        calls = []
+
+        def generate_content(**kwargs):
+            calls.append(kwargs)
+            return self.response("from model")
+
+        models = SimpleNamespace(generate_content=generate_content)
+        cache = ResponseCache(self.tmp_dir.name)
+        cached_models = CachedModels(models, cache)
+        for _ in range(2):
+            got = cached_models.generate_content(
+                model="model", contents=self.messages("hi")
+            )
+            self.assertEqual("from model", got.text)
+        self.assertEqual(1, len(calls))
+
+        offline = CachedModels(None, cache, offline=True)
+        self.assertEqual(
+            "from model",
+            offline.generate_content(model="model", contents=self.messages("hi")).text,
+        )
+        with self.assertRaises(CacheMiss):
+            offline.generate_content(model="model", contents=self.messages("bye"))
+
+
 if __name__ == "__main__":
     unittest.main()